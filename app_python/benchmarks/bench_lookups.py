@@ -0,0 +1,115 @@
+"""Lookup latency of the actions/information queries as the history grows.
+
+Builds throwaway SQLite databases with the app's schema, fills actions and
+information with N rows spread over many games, and times the two queries the
+player and storyteller pages run on every poll:
+
+    actions/information of one player for the current turn   (player_id, turn)
+    actions/information of one game for the current turn     (game_code, turn)
+
+Run from app_python/:
+
+    python benchmarks/bench_lookups.py                  # 10k, 100k and 1M rows
+    python benchmarks/bench_lookups.py --rows 1000000 --no-indexes
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sqlalchemy import create_engine  # noqa: E402
+from database import Base  # noqa: E402
+import models  # noqa: E402, F401
+
+PLAYERS_PER_GAME = 12
+ROWS_PER_PLAYER_TURN = 2
+QUERIES = {
+    "actions by player+turn": "SELECT * FROM actions WHERE player_id = ? AND turn = ?",
+    "information by player+turn": "SELECT * FROM information WHERE player_id = ? AND turn = ?",
+    "actions by game+turn": "SELECT * FROM actions WHERE game_code = ? AND turn = ?",
+    "information by game+turn": "SELECT * FROM information WHERE game_code = ? AND turn = ?",
+}
+
+
+def build_database(path, rows, indexes):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    connection = sqlite3.connect(path)
+    if not indexes:
+        for (name,) in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name IN ('actions', 'information') AND name LIKE '%turn'"
+        ).fetchall():
+            connection.execute(f"DROP INDEX {name}")
+
+    turns = 10
+    games = max(1, rows // (PLAYERS_PER_GAME * turns * ROWS_PER_PLAYER_TURN))
+    keys = []
+
+    def generate():
+        for game in range(games):
+            game_code = f"G{game:05d}"
+            for player in range(PLAYERS_PER_GAME):
+                player_id = str(10**9 + game * PLAYERS_PER_GAME + player)
+                for turn in range(1, turns + 1):
+                    for _ in range(ROWS_PER_PLAYER_TURN):
+                        yield player_id, game_code, turn
+                if player == 0:
+                    keys.append((player_id, game_code))
+
+    connection.executemany(
+        "INSERT INTO actions (player_id, game_code, action_type, action_input, turn, response_required, information_id) "
+        "VALUES (?, ?, 'night_response', 'x', ?, 0, 0)",
+        generate(),
+    )
+    connection.executemany(
+        "INSERT INTO information (player_id, game_code, turn, information_type, information_input, response_required, action_id) "
+        "VALUES (?, ?, ?, 'info', 'x', 0, 0)",
+        ((player_id, game_code, turn) for player_id, game_code, turn in generate()),
+    )
+    connection.commit()
+    connection.execute("ANALYZE")
+    return connection, keys, turns
+
+
+def time_queries(connection, keys, turns, samples):
+    random.seed(0)
+    results = {}
+    for name, sql in QUERIES.items():
+        by_game = "game_code" in sql
+        timings = []
+        for _ in range(samples):
+            player_id, game_code = random.choice(keys)
+            start = time.perf_counter()
+            connection.execute(sql, (game_code if by_game else player_id, random.randint(1, turns))).fetchall()
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        plan = connection.execute("EXPLAIN QUERY PLAN " + sql, ("x", 1)).fetchall()
+        results[name] = (timings[len(timings) // 2], timings[int(len(timings) * 0.99)], plan[-1][-1])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="rows per table")
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--no-indexes", action="store_true", help="drop the (player_id, turn)/(game_code, turn) indexes")
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as directory:
+            connection, keys, turns = build_database(os.path.join(directory, "bench.db"), rows, not args.no_indexes)
+            print(f"\n{rows:,} rows per table")
+            for name, (p50, p99, plan) in time_queries(connection, keys, turns, args.samples).items():
+                print(f"  {name:<28} p50 {p50 * 1e6:8.1f} us   p99 {p99 * 1e6:8.1f} us   {plan}")
+            connection.close()
+
+
+if __name__ == "__main__":
+    main()
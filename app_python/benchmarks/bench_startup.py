@@ -0,0 +1,206 @@
+"""Cold start of an API worker: import time of main, lifespan startup and first request.
+
+Every run starts a fresh Python process, as the autoscaler does when it adds a
+worker, against a SQLite database in a temporary directory. By default the
+database is created once beforehand, the way workers find it in production;
+--fresh-db gives every run an empty file so the schema is created too.
+
+    import     python starting to import main up to the module being ready
+    startup    the lifespan startup (schema upgrade, content packs, background writers)
+    first      first GET /games/ answered after startup
+    total      process start to first response, what a load balancer waits for
+
+Run from app_python/:
+
+    python benchmarks/bench_startup.py                    # 10 runs
+    python benchmarks/bench_startup.py --runs 30 --top 15  # also the 15 slowest imports
+    python benchmarks/bench_startup.py --save baseline     # writes benchmarks/results/startup-baseline.json
+    python benchmarks/bench_startup.py --compare baseline
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, "..", "src"))
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+PHASES = ("import", "startup", "first", "total")
+
+# Runs in the measured process. PROCESS_START is passed in by the parent, so
+# interpreter start up counts towards "total" as well.
+CHILD = """
+import asyncio, json, os, sys, time
+started = time.time()
+sys.path.insert(0, os.environ["BENCH_SRC_DIR"])
+import main
+imported = time.time()
+modules = len(sys.modules)
+
+async def request(app, path):
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"limit=1",
+             "root_path": "", "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80)}
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    return status[0]
+
+async def run():
+    async with main.app.router.lifespan_context(main.app):
+        ready = time.time()
+        status = await request(main.app, "/games/")
+        answered = time.time()
+    return ready, answered, status
+
+ready, answered, status = asyncio.run(run())
+process_start = float(os.environ["BENCH_PROCESS_START"])
+print(json.dumps({
+    "import": imported - started,
+    "startup": ready - imported,
+    "first": answered - ready,
+    "total": answered - process_start,
+    "status": status,
+    "modules": modules,
+}))
+"""
+
+
+def child_env(directory, database):
+    env = dict(os.environ)
+    env.update({
+        "BENCH_SRC_DIR": SRC_DIR,
+        "DATABASE_URL": f"sqlite:///{database}",
+        "GAME_STATE_JOURNAL": os.path.join(directory, "game_state.journal"),
+        "ARCHIVE_DIR": os.path.join(directory, "archive"),
+    })
+    return env
+
+
+def measure(directory, database):
+    import time
+
+    env = child_env(directory, database)
+    env["BENCH_PROCESS_START"] = repr(time.time())
+    output = subprocess.run([sys.executable, "-c", CHILD], env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(directory, database, top):
+    """Modules imported directly by main with the highest cumulative import time, from python -X importtime."""
+    env = child_env(directory, database)
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], env=env, cwd=SRC_DIR,
+                            capture_output=True, text=True, check=True)
+    imports = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented two spaces per level, main's own imports are one level down
+        if len(name) - len(name.lstrip()) == 3:
+            imports.append((int(cumulative), int(own), name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def prepare_database(directory):
+    database = os.path.join(directory, "bench.db")
+    env = child_env(directory, database)
+    subprocess.run([sys.executable, "init_db.py"], env=env, cwd=SRC_DIR, capture_output=True, check=True)
+    return database
+
+
+def run(args):
+    directory = tempfile.mkdtemp(prefix="botc-startup-")
+    database = None if args.fresh_db else prepare_database(directory)
+    runs = []
+    for index in range(args.runs + 1):
+        run_database = database or os.path.join(directory, f"fresh-{index}.db")
+        result = measure(directory, run_database)
+        if result["status"] != 200:
+            raise SystemExit(f"GET /games/ answered {result['status']}")
+        # The first run fills the OS file cache and compiles .pyc files, keep it out of the numbers
+        if index:
+            runs.append(result)
+
+    phases = {}
+    for phase in PHASES:
+        values = sorted(result[phase] for result in runs)
+        phases[phase] = {
+            "median_ms": statistics.median(values) * 1000,
+            "p90_ms": values[min(len(values) - 1, int(len(values) * 0.9))] * 1000,
+            "min_ms": values[0] * 1000,
+        }
+    results = {
+        "config": {"runs": args.runs, "fresh_db": args.fresh_db, "python": sys.version.split()[0]},
+        "modules_loaded": runs[-1]["modules"],
+        "phases": phases,
+    }
+    if args.top:
+        results["slowest_imports"] = [
+            {"module": name, "cumulative_ms": cumulative / 1000, "own_ms": own / 1000}
+            for cumulative, own, name in slowest_imports(directory, database or os.path.join(directory, "fresh-0.db"), args.top)
+        ]
+    return results
+
+
+def report(results, baseline=None):
+    print(f"\n{results['config']['runs']} cold starts, {results['modules_loaded']} modules loaded\n")
+    print(f"{'phase':<10}{'median ms':>11}{'p90 ms':>9}{'min ms':>9}")
+    for phase, values in results["phases"].items():
+        line = f"{phase:<10}{values['median_ms']:>11.1f}{values['p90_ms']:>9.1f}{values['min_ms']:>9.1f}"
+        if baseline and phase in baseline["phases"]:
+            line += f"   median {change(baseline['phases'][phase]['median_ms'], values['median_ms'])}"
+        print(line)
+    if "slowest_imports" in results:
+        print(f"\n{'import':<40}{'cumulative ms':>15}{'own ms':>9}")
+        for entry in results["slowest_imports"]:
+            print(f"{entry['module']:<40}{entry['cumulative_ms']:>15.1f}{entry['own_ms']:>9.1f}")
+
+
+def change(before, after):
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.0f}%"
+
+
+def results_path(name):
+    return os.path.abspath(name) if name.endswith(".json") else os.path.join(RESULTS_DIR, f"startup-{name}.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="measured cold starts, after one warm-up run")
+    parser.add_argument("--fresh-db", action="store_true", help="start every run on an empty database")
+    parser.add_argument("--top", type=int, default=0, help="also list the N slowest imports of main")
+    parser.add_argument("--save", metavar="NAME", help="save the results as benchmarks/results/startup-NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare against saved results")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(results_path(args.compare)) as file:
+            baseline = json.load(file)
+
+    results = run(args)
+    report(results, baseline)
+
+    if args.save:
+        save_path = results_path(args.save)
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        with open(save_path, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nsaved {save_path}")
+
+
+if __name__ == "__main__":
+    main()
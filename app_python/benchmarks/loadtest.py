@@ -0,0 +1,273 @@
+"""Load generator playing full Trouble Brewing games against the API.
+
+Each simulated game goes through the same calls as the storyteller and player
+pages: create_game, joins via /players/, character assignment through
+/players/update_multiple, the first night (first_night_players,
+update_first_night_info) and then rounds of player polling with
+add_action/add_information.
+
+By default the app runs in-process on a throwaway SQLite database. Pass --url to
+drive a running server instead (start it from app_python/src with uvicorn main:app).
+
+Run from app_python/:
+
+    python benchmarks/loadtest.py --games 50 --players 10 --rounds 5
+    python benchmarks/loadtest.py --save baseline            # writes benchmarks/results/baseline.json
+    python benchmarks/loadtest.py --compare baseline         # prints the change against it
+    python benchmarks/loadtest.py --url http://localhost:8000 --db src/database.db
+
+Needs httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCHMARKS_DIR, "..", "src")
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+TABLES = ("games", "players", "actions", "information")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, client, name, method, url, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[name].append(time.perf_counter() - start)
+        if response.status_code >= 400 or (response.headers.get("content-type", "").startswith("application/json")
+                                           and response.json().get("result") == "failure"):
+            self.errors[name] += 1
+        return response
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def play_game(client, recorder, characters, players_per_game, rounds, rng):
+    game = (await recorder.call(client, "POST /games/", "POST", "/games/", json={
+        "player_count": players_per_game, "game_version": "Trouble Brewing",
+        "ai_game_master": False, "turn": 0, "time_of_day": "day",
+    })).json()
+    game_code = game["game_code"]
+
+    player_ids = []
+    for index in range(players_per_game):
+        player = (await recorder.call(client, "POST /players/", "POST", "/players/", json={
+            "game_code": game_code, "player_name": f"player {index}",
+        })).json()
+        player_ids.append(player["player"]["player_id"])
+
+    assigned = rng.sample(characters, players_per_game)
+    await recorder.call(client, "PUT /players/update_multiple", "PUT", "/players/update_multiple", json={
+        "players": [{"player_id": player_id, "character_id": character["character_id"]}
+                    for player_id, character in zip(player_ids, assigned)],
+    })
+    await recorder.call(client, "PUT /games/{game_code}", "PUT", f"/games/{game_code}",
+                        json={"turn": 1, "time_of_day": "night"})
+
+    first_night = (await recorder.call(client, "POST /game/first_night_players", "POST", "/game/first_night_players",
+                                       json={"game_code": game_code, "game_version": "Trouble Brewing"})).json()
+    woken = first_night.get("players", [])
+    await recorder.call(client, "POST /game/update_first_night_info", "POST", "/game/update_first_night_info", json={
+        "game_code": game_code,
+        "players": [{
+            "player_id": player["player_id"],
+            "character_id": player["character_id"],
+            "designation": player["designation"],
+            "first_night_order": player["first_night_order"] or 0,
+            "receives_information": player["character_action_info"]["recieve_information"],
+            "information_received": player["character_action_info"]["information_recieved"] or "",
+            "action": player["character_action_info"]["action"],
+            "response_required": player["character_action_info"]["response_required"],
+        } for player in woken],
+    })
+
+    for _ in range(rounds):
+        await recorder.call(client, "GET /players/game/{game_code}", "GET", f"/players/game/{game_code}")
+        await recorder.call(client, "GET /all_players_info/{game_code}", "GET", f"/all_players_info/{game_code}")
+        for player_id in player_ids:
+            await recorder.call(client, "GET /players/{player_id}", "GET", f"/players/{player_id}")
+            await recorder.call(client, "GET /player_actions/{game_code}/{player_id}", "GET",
+                                f"/player_actions/{game_code}/{player_id}")
+            if rng.random() < 0.5:
+                await recorder.call(client, "POST /player/add_action", "POST", "/player/add_action", json={
+                    "player_id": player_id, "action_type": "response", "action_input": "ok",
+                    "response_required": False, "turn": 1,
+                })
+            else:
+                await recorder.call(client, "POST /player/add_information", "POST", "/player/add_information", json={
+                    "player_id": player_id, "information_type": "custom", "information_input": "note",
+                    "response_required": False, "turn": 1,
+                })
+
+
+def count_rows(db_path):
+    if not db_path or not os.path.exists(db_path):
+        return None
+    connection = sqlite3.connect(db_path)
+    try:
+        return sum(connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in TABLES)
+    finally:
+        connection.close()
+
+
+async def lifespan(app, events):
+    """Runs the app's ASGI lifespan (startup hooks) while the load test runs in-process."""
+    messages = asyncio.Queue()
+    await messages.put({"type": "lifespan.startup"})
+    started, stop = asyncio.Event(), asyncio.Event()
+
+    async def receive():
+        message = await messages.get()
+        return message
+
+    async def send(message):
+        if message["type"] == "lifespan.startup.complete":
+            started.set()
+        elif message["type"] == "lifespan.shutdown.complete":
+            stop.set()
+
+    task = asyncio.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}, receive, send))
+    await started.wait()
+    events["shutdown"] = lambda: messages.put_nowait({"type": "lifespan.shutdown"})
+    events["wait"] = lambda: asyncio.wait_for(asyncio.gather(stop.wait(), task), 30)
+
+
+async def run(args):
+    import httpx
+
+    sys.path.insert(0, SRC_DIR)
+    db_path = args.db
+    events = {}
+    if args.url:
+        transport = None
+        base_url = args.url
+    else:
+        directory = tempfile.mkdtemp(prefix="botc-loadtest-")
+        db_path = os.path.join(directory, "loadtest.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        os.environ.setdefault("GAME_STATE_JOURNAL", os.path.join(directory, "game_state.journal"))
+        import main
+
+        await lifespan(main.app, events)
+        transport = httpx.ASGITransport(app=main.app)
+        base_url = "http://loadtest"
+
+    from content import ContentRegistry
+
+    characters = ContentRegistry(os.path.join(SRC_DIR, "game_files")).get("trouble_brewing").characters
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    rows_before = count_rows(db_path)
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=60, limits=limits) as client:
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def bounded(seed):
+            async with semaphore:
+                await play_game(client, recorder, characters, args.players, args.rounds, random.Random(seed))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(bounded(rng.random()) for _ in range(args.games)))
+        elapsed = time.perf_counter() - start
+
+    if events:
+        events["shutdown"]()
+        await events["wait"]()
+
+    rows_after = count_rows(db_path)
+    endpoints = {}
+    for name, values in sorted(recorder.latencies.items()):
+        endpoints[name] = {
+            "count": len(values),
+            "errors": recorder.errors[name],
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "mean_ms": sum(values) / len(values) * 1000,
+            "throughput_rps": len(values) / elapsed,
+        }
+    requests = sum(endpoint["count"] for endpoint in endpoints.values())
+    return {
+        "config": {"games": args.games, "players": args.players, "rounds": args.rounds,
+                   "concurrency": args.concurrency, "seed": args.seed, "target": args.url or "in-process"},
+        "elapsed_s": elapsed,
+        "requests": requests,
+        "throughput_rps": requests / elapsed,
+        "db_rows_written": None if rows_before is None else rows_after - rows_before,
+        "db_rows_per_s": None if rows_before is None else (rows_after - rows_before) / elapsed,
+        "endpoints": endpoints,
+    }
+
+
+def report(results, baseline=None):
+    print(f"\n{results['requests']} requests in {results['elapsed_s']:.2f}s "
+          f"({results['throughput_rps']:.0f} req/s)", end="")
+    if results["db_rows_per_s"] is not None:
+        print(f", {results['db_rows_written']} rows written ({results['db_rows_per_s']:.0f} rows/s)", end="")
+    print("\n")
+    print(f"{'endpoint':<45}{'count':>7}{'err':>5}{'p50 ms':>9}{'p99 ms':>9}{'req/s':>9}")
+    for name, endpoint in results["endpoints"].items():
+        line = (f"{name:<45}{endpoint['count']:>7}{endpoint['errors']:>5}{endpoint['p50_ms']:>9.2f}"
+                f"{endpoint['p99_ms']:>9.2f}{endpoint['throughput_rps']:>9.0f}")
+        if baseline and name in baseline["endpoints"]:
+            before = baseline["endpoints"][name]
+            line += f"   p50 {change(before['p50_ms'], endpoint['p50_ms'])}  p99 {change(before['p99_ms'], endpoint['p99_ms'])}"
+        print(line)
+    if baseline:
+        print(f"\nthroughput {change(baseline['throughput_rps'], results['throughput_rps'])} against the baseline")
+
+
+def change(before, after):
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.0f}%"
+
+
+def results_path(name):
+    return os.path.abspath(name) if name.endswith(".json") else os.path.join(RESULTS_DIR, f"{name}.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=20, help="number of games to play")
+    parser.add_argument("--players", type=int, default=10, help="players per game (5 to 15)")
+    parser.add_argument("--rounds", type=int, default=5, help="polling rounds per game after the first night")
+    parser.add_argument("--concurrency", type=int, default=10, help="games played at the same time")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="base URL of a running server instead of the in-process app")
+    parser.add_argument("--db", help="SQLite file of the server given with --url, to count rows written")
+    parser.add_argument("--save", metavar="NAME", help="save the results as benchmarks/results/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare against saved results")
+    args = parser.parse_args()
+
+    save_path = results_path(args.save) if args.save else None
+    baseline = None
+    if args.compare:
+        with open(results_path(args.compare)) as file:
+            baseline = json.load(file)
+
+    results = asyncio.run(run(args))
+    report(results, baseline)
+
+    if save_path:
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        with open(save_path, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nsaved {save_path}")
+
+
+if __name__ == "__main__":
+    main()
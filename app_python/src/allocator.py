@@ -0,0 +1,102 @@
+import hashlib
+import threading
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+import config
+from database import engine
+
+# Game code alphabet without the easily confused 0/O and 1/I. 32 letters, so a
+# 6 letter code is exactly 30 bits and every 30 bit number maps to one code.
+GAME_CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+GAME_CODE_LENGTH = 6
+GAME_CODE_BITS = 30
+
+# Player ids stay 10 digit strings: 10**9 plus a shuffled 32 bit number
+PLAYER_ID_OFFSET = 10**9
+PLAYER_ID_BITS = 32
+
+FEISTEL_ROUNDS = 4
+
+
+def feistel(value, bits, key, rounds=FEISTEL_ROUNDS):
+    """Keyed permutation of the integers in [0, 2**bits). bits must be even.
+
+    A Feistel network is a bijection whatever the round function, so two different
+    sequence numbers can never produce the same output.
+    """
+    half = bits // 2
+    mask = (1 << half) - 1
+    left, right = value >> half, value & mask
+    for round_number in range(rounds):
+        digest = hashlib.blake2b(f"{round_number}:{right}".encode(), key=key, digest_size=8).digest()
+        left, right = right, left ^ (int.from_bytes(digest, "big") & mask)
+    return (left << half) | right
+
+
+def encode_game_code(number):
+    letters = []
+    for _ in range(GAME_CODE_LENGTH):
+        number, index = divmod(number, len(GAME_CODE_ALPHABET))
+        letters.append(GAME_CODE_ALPHABET[index])
+    return "".join(reversed(letters))
+
+
+class IdAllocator:
+    """Hands out game codes and player ids from sequences stored in the id_sequences table.
+
+    Each process reserves a block of numbers with one atomic UPDATE, then allocates
+    from memory until the block runs out, so allocation is O(1) and safe across
+    worker processes sharing the database. The numbers go through a keyed Feistel
+    permutation so consecutive games do not get consecutive, guessable codes.
+    """
+
+    def __init__(self, engine, block_size=100, key=b"botc"):
+        self.engine = engine
+        self.block_size = block_size
+        self.key = key
+        self._blocks = {}  # sequence name -> [next, end)
+        self._lock = threading.Lock()
+
+    def _reserve(self, name):
+        with self.engine.begin() as connection:
+            end = connection.execute(
+                text("UPDATE id_sequences SET next_value = next_value + :block WHERE name = :name RETURNING next_value"),
+                {"block": self.block_size, "name": name},
+            ).scalar()
+        if end is not None:
+            return end - self.block_size, end
+
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(
+                    text("INSERT INTO id_sequences (name, next_value) VALUES (:name, :next_value)"),
+                    {"name": name, "next_value": self.block_size},
+                )
+            return 0, self.block_size
+        except IntegrityError:
+            # Another process created the sequence first
+            return self._reserve(name)
+
+    def next_number(self, name):
+        with self._lock:
+            block = self._blocks.get(name)
+            if block is None or block[0] >= block[1]:
+                block = self._blocks[name] = list(self._reserve(name))
+            number = block[0]
+            block[0] += 1
+            return number
+
+    def next_game_code(self):
+        number = self.next_number("game_code")
+        if number >= 1 << GAME_CODE_BITS:
+            raise RuntimeError("Game code space exhausted")
+        return encode_game_code(feistel(number, GAME_CODE_BITS, self.key))
+
+    def next_player_id(self):
+        number = self.next_number("player_id")
+        if number >= 1 << PLAYER_ID_BITS:
+            raise RuntimeError("Player id space exhausted")
+        return str(PLAYER_ID_OFFSET + feistel(number, PLAYER_ID_BITS, self.key))
+
+
+allocator = IdAllocator(engine, config.ID_BLOCK_SIZE, config.ID_ALLOCATOR_KEY.encode())
@@ -0,0 +1,190 @@
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, text
+import models
+from bulk import transaction
+from game_state import FINISHED_STATES
+
+logger = logging.getLogger(__name__)
+
+# Tables archived with each game, children first so deletes never break a foreign key
+ARCHIVED_TABLES = (
+    (models.GameSnapshot, models.GameSnapshot.game_code),
+    (models.GameLogEntry, models.GameLogEntry.game_code),
+    (models.Information, models.Information.game_code),
+    (models.Actions, models.Actions.game_code),
+    (models.Player, models.Player.game_code),
+    (models.Game, models.Game.game_code),
+)
+
+# Pages released per incremental_vacuum step, so the write lock is held only briefly
+VACUUM_STEP_PAGES = 1000
+
+
+class Archiver:
+    """Moves finished and idle games out of the live tables into gzip NDJSON files.
+
+    A game is archived once it has been finished for finished_after, or was created
+    more than idle_after ago and has seen no write for as long (or, for games
+    not written to since this process started, was created that long ago). Games are moved
+    chunk_size at a time: the rows are written and fsynced to an archive file, then
+    deleted in one short transaction, so live games only ever wait for one chunk.
+    The run ends with an incremental VACUUM handing the freed pages back to the OS.
+    """
+
+    def __init__(self, session_factory, engine, archive_dir, finished_after, idle_after,
+                 chunk_size=50, chunk_pause=0.05, last_activity=None, is_active=None, on_archived=None):
+        self.session_factory = session_factory
+        self.engine = engine
+        self.archive_dir = archive_dir
+        self.finished_after = finished_after  # timedelta
+        self.idle_after = idle_after  # timedelta
+        self.chunk_size = chunk_size
+        self.chunk_pause = chunk_pause  # seconds slept between chunks
+        self.last_activity = last_activity or (lambda game_code: None)  # game_code -> unix time of the last write, or None
+        self.is_active = is_active or (lambda game_code: False)  # game_code -> True to keep a game in place
+        self.on_archived = on_archived or (lambda game_codes: None)
+        self.games_archived = 0
+        self.last_run = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, interval):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.run()
+            except Exception:
+                logger.exception("archive run failed")
+
+    def candidates(self, now=None):
+        """Game codes due for archival, oldest first."""
+        now = now or datetime.utcnow()
+        db = self.session_factory()
+        try:
+            rows = db.execute(
+                select(models.Game.game_code, models.Game.time_of_day, models.Game.created_date)
+                .where(models.Game.created_date < now - min(self.finished_after, self.idle_after))
+                .order_by(models.Game.id)
+            ).all()
+        finally:
+            db.close()
+
+        due = []
+        for game_code, time_of_day, created_date in rows:
+            if self.is_active(game_code):
+                continue
+            last_write = self.last_activity(game_code)
+            # Without a write seen since this process started, the game's age is all we know
+            quiet_for = now - created_date if last_write is None else timedelta(seconds=time.time() - last_write)
+            finished = (time_of_day or "").lower() in FINISHED_STATES
+            if (finished and quiet_for > self.finished_after) or quiet_for > self.idle_after:
+                due.append(game_code)
+        return due
+
+    def run(self):
+        """Archives every game due and compacts the database. Returns the number of games archived."""
+        # One run at a time, whether started by the timer or by POST /archive/run
+        if not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            due = self.candidates()
+            archived = 0
+            for start in range(0, len(due), self.chunk_size):
+                if self._stop.is_set():
+                    break
+                archived += self.archive_chunk(due[start:start + self.chunk_size])
+                time.sleep(self.chunk_pause)
+            if archived:
+                self.compact()
+            self.games_archived += archived
+            self.last_run = {"at": datetime.utcnow().isoformat(), "games_archived": archived}
+            return archived
+        finally:
+            self._lock.release()
+
+    def archive_chunk(self, game_codes):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"games-{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns()}.ndjson.gz")
+        db = self.session_factory()
+        try:
+            with transaction(db):
+                with gzip.open(path, "wt") as file:
+                    for model, game_column in ARCHIVED_TABLES:
+                        rows = db.execute(select(*model.__table__.columns).where(game_column.in_(game_codes))).mappings()
+                        for row in rows:
+                            file.write(json.dumps({"table": model.__tablename__, "row": dict(row)}, default=str) + "\n")
+                # The archive must be on disk before its rows are deleted
+                with open(path, "rb") as file:
+                    os.fsync(file.fileno())
+                for model, game_column in ARCHIVED_TABLES:
+                    db.execute(delete(model).where(game_column.in_(game_codes)))
+        except Exception:
+            # Nothing was deleted, do not leave a copy behind that would be restored twice
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        finally:
+            db.close()
+
+        self.on_archived(game_codes)
+        return len(game_codes)
+
+    def compact(self):
+        """Returns the free pages left by the deleted rows to the file system (SQLite only)."""
+        if self.engine.dialect.name != "sqlite":
+            return
+        # VACUUM cannot run inside a transaction
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            if connection.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+                # Files created before incremental vacuum was turned on need one full VACUUM to switch
+                connection.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+                connection.execute(text("VACUUM"))
+                return
+            while connection.execute(text("PRAGMA freelist_count")).scalar():
+                connection.execute(text(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})"))
+                time.sleep(self.chunk_pause)
+
+
+def restore(session_factory, path):
+    """Loads an archive file written by Archiver back into the live tables."""
+    models_by_table = {model.__tablename__: model for model, _ in ARCHIVED_TABLES}
+    columns = {table: {column.key: column for column in model.__table__.columns} for table, model in models_by_table.items()}
+    rows = {table: [] for table in models_by_table}
+    with gzip.open(path, "rt") as file:
+        for line in file:
+            entry = json.loads(line)
+            table_columns = columns[entry["table"]]
+            row = {}
+            for key, value in entry["row"].items():
+                if value is not None and table_columns[key].type.python_type is datetime:
+                    value = datetime.fromisoformat(value)
+                row[key] = value
+            rows[entry["table"]].append(row)
+
+    db = session_factory()
+    try:
+        with transaction(db):
+            # Parents first
+            for model, _ in reversed(ARCHIVED_TABLES):
+                if rows[model.__tablename__]:
+                    db.execute(model.__table__.insert(), rows[model.__tablename__])
+    finally:
+        db.close()
+    return sum(len(table_rows) for table_rows in rows.values())
@@ -0,0 +1,40 @@
+from contextlib import contextmanager
+from sqlalchemy import select, update, insert
+
+# Helpers for writing many rows in one round trip and one commit.
+# Used by the multi-player routes and the night-phase batch writes.
+
+
+@contextmanager
+def transaction(db):
+    """Commits everything written inside the block once, or nothing if it raises."""
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def fetch_by_ids(db, model, key_column, ids):
+    """Loads the rows whose key_column is in ids with a single IN (...) query, keyed by that column."""
+    if not ids:
+        return {}
+    rows = db.scalars(select(model).where(key_column.in_(set(ids)))).all()
+    return {getattr(row, key_column.key): row for row in rows}
+
+
+def bulk_update(db, model, rows):
+    """Executemany UPDATE by primary key. Each row is a dict holding the primary key and the changed columns."""
+    if rows:
+        db.execute(update(model), rows)
+
+
+def bulk_insert(db, model, rows, returning=False):
+    """Executemany INSERT of dict rows. With returning=True the inserted ORM objects are returned in the order of rows."""
+    if not rows:
+        return []
+    if returning:
+        return db.scalars(insert(model).returning(model, sort_by_parameter_order=True), rows).all()
+    db.execute(insert(model), rows)
+    return []
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+# Results kept at most, expired ones are dropped first when the limit is reached
+MAX_ENTRIES = 10000
+
+
+class ReadCoalescer:
+    """Single-flight reads of a game: concurrent identical reads share one query and its result.
+
+    Reads are keyed by a name and the game code, and by the game's version when the
+    query started. A read arriving while the same query runs waits for it instead of
+    running its own, and its result is kept for ttl seconds. Every write publishes a
+    new version, so reads after a write never get a result loaded before it; on_event
+    drops a game's results as soon as the write is published.
+    """
+
+    def __init__(self, version, ttl=0.1, max_entries=MAX_ENTRIES):
+        self.version = version  # game_code -> value that changes with every write to the game
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.counts = Counter()  # (name, outcome) -> reads
+        self._results = {}  # game_code -> {name: (version, expires, result)}
+        self._in_flight = {}  # (game_code, name, version) -> Future
+        self._lock = threading.Lock()
+
+    def get(self, name, game_code, load):
+        """load()'s result, from a recent or running call with the same name, game and version when there is one."""
+        version = self.version(game_code)
+        flight = (game_code, name, version)
+        with self._lock:
+            cached = self._results.get(game_code, {}).get(name)
+            if cached is not None and cached[0] == version and cached[1] > time.monotonic():
+                self.counts[(name, "hit")] += 1
+                return cached[2]
+            future = self._in_flight.get(flight)
+            leader = future is None
+            if leader:
+                future = self._in_flight[flight] = Future()
+            self.counts[(name, "miss" if leader else "coalesced")] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = load()
+        except Exception as e:
+            with self._lock:
+                self._in_flight.pop(flight, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._in_flight.pop(flight, None)
+            # Not kept when a write was published while the query ran
+            if self.ttl > 0 and self.version(game_code) == version:
+                if len(self._results) >= self.max_entries:
+                    self._prune()
+                self._results.setdefault(game_code, {})[name] = (version, time.monotonic() + self.ttl, result)
+        future.set_result(result)
+        return result
+
+    def _prune(self):
+        now = time.monotonic()
+        for game_code, results in list(self._results.items()):
+            if all(expires <= now for _, expires, _ in results.values()):
+                del self._results[game_code]
+        if len(self._results) >= self.max_entries:
+            self._results.clear()
+
+    def on_event(self, game_code, event):
+        """Event bus listener: a write to the game, its results are out of date."""
+        if game_code in self._results:
+            with self._lock:
+                self._results.pop(game_code, None)
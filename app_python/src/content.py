@@ -0,0 +1,367 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pickle
+import re
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Root folder holding one sub folder per script (content pack), next to the code
+GAME_FILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "game_files")
+
+# Folder of files shared by every pack, a pack's own copy of a file takes precedence
+SHARED_FOLDER = "miscellaneous"
+
+# Compiled packs are written here, relative to the game files folder
+COMPILED_FOLDER = ".compiled"
+
+# Files of a pack folder. script.json is an optional manifest: {"name": ..., "aliases": [...]}
+REQUIRED_FILES = ("characters.json", "characteractions.json")
+OPTIONAL_FILES = ("non_response.json", "script.json")
+
+DESIGNATIONS = {"townsfolk", "outsider", "minion", "demon", "traveller", "fabled"}
+
+# Compiled pack layout: magic, format version, sha256 of the payload, pickled payload
+PACK_MAGIC = b"BOTCPACK"
+PACK_FORMAT = 1
+PACK_HEADER = struct.Struct("8sB32s")
+
+
+class ContentPackError(ValueError):
+    """A script folder whose files are missing or inconsistent, or a corrupt compiled pack."""
+
+
+class ScriptContent:
+    """Parsed and indexed content of a single script folder."""
+
+    def __init__(self, characters, character_actions, non_response=(), name=None, aliases=(), source_hash=None):
+        self.characters = characters
+        self.character_actions = character_actions
+        self.non_response = list(non_response)  # prompts for players without a night action
+        self.name = name
+        self.aliases = tuple(aliases)  # game_version values mapped to this script
+        self.source_hash = source_hash
+
+        # character_id -> character
+        self.characters_by_id = {
+            character["character_id"]: character for character in characters
+        }
+
+        # game_version (as written in characters.json) -> characters
+        self.characters_by_version = {}
+        for character in characters:
+            self.characters_by_version.setdefault(character["game_version"], []).append(character)
+
+        # Every first night action in file order, a character can have several
+        self.first_night_action_list = [action for action in character_actions if action.get("first_night")]
+        # character_id -> first night action, for the wake order lookups
+        self.first_night_actions = {
+            action["character_id"]: action
+            for action in character_actions
+            if action.get("first_night")
+        }
+        # character_id -> other nights action
+        self.night_actions = {
+            action["character_id"]: action
+            for action in character_actions
+            if not action.get("first_night")
+        }
+
+        # first_night_order / night_order -> character, and the wake order lists
+        self.characters_by_first_night_order = {
+            character["first_night_order"]: character
+            for character in characters
+            if character.get("first_night_order")
+        }
+        self.characters_by_night_order = {}
+        for character in characters:
+            if character.get("night_order"):
+                self.characters_by_night_order.setdefault(character["night_order"], []).append(character)
+
+        self.first_night_wake_order = [
+            self.characters_by_first_night_order[order]
+            for order in sorted(self.characters_by_first_night_order)
+        ]
+        self.night_wake_order = [
+            character
+            for order in sorted(self.characters_by_night_order)
+            for character in self.characters_by_night_order[order]
+        ]
+
+
+def folder_for_version(game_version):
+    """Default folder of a game version: "Bad Moon Rising" -> bad_moon_rising."""
+    if game_version is None:
+        # A game without a version has no script, like a version without a folder
+        raise FileNotFoundError("Game has no game_version")
+    return re.sub(r"[^a-z0-9]+", "_", game_version.lower().replace("&", "and")).strip("_")
+
+
+def pack_sources(base_dir, folder):
+    """Paths of the files a pack is compiled from, by file name."""
+    sources = {}
+    for name in REQUIRED_FILES + OPTIONAL_FILES:
+        path = os.path.join(base_dir, folder, name)
+        if not os.path.exists(path) and name == "non_response.json":
+            path = os.path.join(base_dir, SHARED_FOLDER, name)
+        if os.path.exists(path):
+            sources[name] = path
+        elif name in REQUIRED_FILES:
+            raise FileNotFoundError(path)
+    return sources
+
+
+def validate_pack(folder, characters, character_actions, non_response):
+    """Raises ContentPackError listing every problem found in a pack."""
+    problems = []
+    character_ids = set()
+    first_night_orders = {}
+    for index, character in enumerate(characters):
+        missing = [key for key in ("character_id", "character_name", "designation", "game_version") if key not in character]
+        if missing:
+            problems.append(f"characters.json[{index}] is missing {', '.join(missing)}")
+            continue
+        if not isinstance(character["character_id"], int):
+            problems.append(f"characters.json[{index}] character_id is not an integer")
+        if character["character_id"] in character_ids:
+            problems.append(f"characters.json[{index}] repeats character_id {character['character_id']}")
+        character_ids.add(character["character_id"])
+        if character["designation"] not in DESIGNATIONS:
+            problems.append(f"characters.json[{index}] has unknown designation {character['designation']!r}")
+        order = character.get("first_night_order")
+        if order:
+            if order in first_night_orders:
+                problems.append(f"characters.json[{index}] shares first_night_order {order} with "
+                                f"{first_night_orders[order]}")
+            first_night_orders[order] = character["character_name"]
+
+    for index, action in enumerate(character_actions):
+        if action.get("character_id") not in character_ids:
+            problems.append(f"characteractions.json[{index}] refers to unknown character_id {action.get('character_id')}")
+
+    for index, prompt in enumerate(non_response):
+        if "information_recieved" not in prompt:
+            problems.append(f"non_response.json[{index}] is missing information_recieved")
+
+    if problems:
+        raise ContentPackError(f"Content pack {folder}: " + "; ".join(problems))
+
+
+def compile_pack(base_dir, folder, compiled_dir=None):
+    """Validates a script folder and writes it as one compiled pack.
+
+    Returns (path of the pack, number of JSON files parsed), 0 files if it was already compiled.
+
+    The pack file is named after the hash of its sources, so an unchanged folder is
+    never compiled twice and worker processes starting together share the same file.
+    """
+    compiled_dir = compiled_dir or os.path.join(base_dir, COMPILED_FOLDER)
+    sources = pack_sources(base_dir, folder)
+    raw = {}
+    source_hash = hashlib.sha256()
+    for name, path in sorted(sources.items()):
+        with open(path, "rb") as file:
+            raw[name] = file.read()
+        source_hash.update(name.encode() + b"\0" + raw[name] + b"\0")
+    source_hash = source_hash.hexdigest()
+
+    path = os.path.join(compiled_dir, f"{folder}-{source_hash[:16]}.pack")
+    if os.path.exists(path):
+        return path, 0
+
+    characters = json.loads(raw["characters.json"])
+    character_actions = json.loads(raw["characteractions.json"])
+    non_response = json.loads(raw["non_response.json"]) if "non_response.json" in raw else []
+    manifest = json.loads(raw["script.json"]) if "script.json" in raw else {}
+    validate_pack(folder, characters, character_actions, non_response)
+
+    name = manifest.get("name") or folder.replace("_", " ").title()
+    aliases = {folder, name, *manifest.get("aliases", ()), *(character["game_version"] for character in characters)}
+    payload = pickle.dumps({
+        "name": name,
+        "aliases": sorted(aliases),
+        "source_hash": source_hash,
+        "characters": characters,
+        "character_actions": character_actions,
+        "non_response": non_response,
+    }, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.makedirs(compiled_dir, exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(PACK_HEADER.pack(PACK_MAGIC, PACK_FORMAT, hashlib.sha256(payload).digest()))
+        file.write(payload)
+    # Atomic, a worker never maps a half written pack
+    os.replace(temporary, path)
+
+    for stale in os.listdir(compiled_dir):
+        if stale.startswith(f"{folder}-") and stale.endswith(".pack") and stale != os.path.basename(path):
+            try:
+                os.remove(os.path.join(compiled_dir, stale))
+            except FileNotFoundError:
+                pass
+    return path, len(raw)
+
+
+def load_pack(path):
+    """Maps a compiled pack and returns its ScriptContent, after checking its integrity hash.
+
+    The file is memory mapped, so every worker reads the same page cache pages instead
+    of its own copy of the file. Packs are written by compile_pack from local files;
+    the hash guards against corruption, not against a pack crafted by someone else.
+    """
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if len(mapped) < PACK_HEADER.size:
+            raise ContentPackError(f"{path} is truncated")
+        magic, pack_format, digest = PACK_HEADER.unpack_from(mapped)
+        if magic != PACK_MAGIC or pack_format != PACK_FORMAT:
+            raise ContentPackError(f"{path} is not a format {PACK_FORMAT} content pack")
+        payload = memoryview(mapped)[PACK_HEADER.size:]
+        try:
+            if hashlib.sha256(payload).digest() != digest:
+                raise ContentPackError(f"{path} failed its integrity check")
+            data = pickle.loads(payload)
+        finally:
+            payload.release()
+
+    return ScriptContent(
+        data["characters"], data["character_actions"], data["non_response"],
+        name=data["name"], aliases=data["aliases"], source_hash=data["source_hash"],
+    )
+
+
+class ContentRegistry:
+    """Discovers the script folders under game_files and serves their content from compiled packs.
+
+    A folder is compiled once (see compile_pack) and loaded from its pack afterwards.
+    When a source file changes on disk the folder is compiled and loaded again.
+    """
+
+    def __init__(self, base_dir=GAME_FILES_DIR, check_interval=1.0, compiled_dir=None):
+        self.base_dir = base_dir
+        self.compiled_dir = compiled_dir or os.path.join(base_dir, COMPILED_FOLDER)
+        self.check_interval = check_interval  # seconds between mtime checks of a loaded script
+        self._scripts = {}  # script folder -> (mtimes, ScriptContent)
+        self._checked_at = {}  # script folder -> monotonic time of the last mtime check
+        self._aliases = {}  # game_version -> script folder, filled as packs are loaded
+        self._discovered_at = 0
+        self._lock = threading.Lock()
+        self.load_count = 0  # number of times a JSON file was actually parsed
+        self.pack_loads = 0  # number of compiled packs mapped
+        self.errors = {}  # script folder -> why it failed to validate
+
+    def folders(self):
+        """Script folders found under base_dir."""
+        return [
+            folder for folder in sorted(os.listdir(self.base_dir))
+            if not folder.startswith(".") and folder != SHARED_FOLDER
+            and all(os.path.exists(os.path.join(self.base_dir, folder, name)) for name in REQUIRED_FILES)
+        ]
+
+    def script_folder(self, game_version):
+        folder = self._aliases.get(game_version)
+        if folder is not None:
+            return folder
+        folder = folder_for_version(game_version)
+        if not os.path.isdir(os.path.join(self.base_dir, folder)) and time.monotonic() - self._discovered_at > self.check_interval:
+            # Custom scripts may declare any name in script.json, load the packs to learn their aliases
+            self.preload()
+            folder = self._aliases.get(game_version, folder)
+        return folder
+
+    def _mtimes(self, folder):
+        return tuple(os.stat(path).st_mtime_ns for path in pack_sources(self.base_dir, folder).values())
+
+    def get(self, game_version):
+        """Returns the ScriptContent for a game version, (re)loading it if the files changed.
+
+        Raises FileNotFoundError if the script folder does not exist and
+        ContentPackError if its files do not validate.
+        """
+        folder = self.script_folder(game_version)
+        cached = self._scripts.get(folder)
+        now = time.monotonic()
+        if cached and now - self._checked_at.get(folder, 0) < self.check_interval:
+            return cached[1]
+
+        mtimes = self._mtimes(folder)
+        self._checked_at[folder] = now
+        if cached and cached[0] == mtimes:
+            return cached[1]
+
+        with self._lock:
+            cached = self._scripts.get(folder)
+            if cached and cached[0] == mtimes:
+                return cached[1]
+            try:
+                content = self._load(folder)
+            except ContentPackError as e:
+                if not cached:
+                    raise
+                # A bad edit of a running script keeps the last content that validated
+                self.errors[folder] = str(e)
+                logger.warning("content pack %s not reloaded: %s", folder, e)
+                self._scripts[folder] = (mtimes, cached[1])
+                return cached[1]
+            self._scripts[folder] = (mtimes, content)
+            self.errors.pop(folder, None)
+            for alias in content.aliases:
+                self._aliases[alias] = folder
+            return content
+
+    def _load(self, folder):
+        path, parsed = compile_pack(self.base_dir, folder, self.compiled_dir)
+        self.load_count += parsed
+        self.pack_loads += 1
+        try:
+            return load_pack(path)
+        except ContentPackError:
+            # Damaged pack file, build it again from the sources
+            os.remove(path)
+            path, parsed = compile_pack(self.base_dir, folder, self.compiled_dir)
+            self.load_count += parsed
+            return load_pack(path)
+
+    def preload(self):
+        """Compiles and loads every script folder found under base_dir. Folders that do not validate are skipped."""
+        self._discovered_at = time.monotonic()
+        for folder in self.folders():
+            try:
+                self.get(folder)
+                self.errors.pop(folder, None)
+            except ContentPackError as e:
+                self.errors[folder] = str(e)
+                logger.warning("content pack %s not loaded: %s", folder, e)
+
+    def packs(self):
+        """Summary of the loaded packs."""
+        return [
+            {"folder": folder, "name": content.name, "aliases": list(content.aliases),
+             "characters": len(content.characters), "source_hash": content.source_hash}
+            for folder, (_, content) in sorted(self._scripts.items())
+        ]
+
+    # Convenience lookups used by the routes
+    def character(self, game_version, character_id):
+        return self.get(game_version).characters_by_id.get(character_id)
+
+    def characters_for_version(self, game_version):
+        try:
+            content = self.get(game_version)
+        except FileNotFoundError:
+            return []
+        return content.characters_by_version.get(game_version, [])
+
+
+registry = ContentRegistry()
+
+
+if __name__ == "__main__":
+    # Compile every pack ahead of a deployment: python content.py
+    for folder in registry.folders():
+        print(f"{folder}: {compile_pack(registry.base_dir, folder)[0]}")
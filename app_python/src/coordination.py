@@ -0,0 +1,313 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+# A worker missing this many heartbeats in a row is considered gone
+HEARTBEAT_MISSES = 3
+
+# Events kept in the SQLite backend for workers that fall behind
+SQLITE_EVENT_RETENTION = 60  # seconds
+
+SQLITE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS coordination_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS game_versions (game_code TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL, game_code TEXT, "
+    "kind TEXT NOT NULL, version INTEGER, data TEXT NOT NULL, created REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, last_seen REAL NOT NULL)",
+)
+
+
+def rendezvous_owner(game_code, workers):
+    """Highest random weight hashing: every worker computes the same owner for a game,
+    and only the games of a worker that joins or leaves move."""
+    if not workers:
+        return None
+    return max(workers, key=lambda worker: hashlib.blake2b(f"{worker}:{game_code}".encode(), digest_size=8).digest())
+
+
+class InProcessBackend:
+    """Single worker: nothing to share, versions are counted by the event bus itself."""
+
+    shared = False
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]  # versions restart with the process
+
+    def start(self, worker_id, on_event):
+        pass
+
+    def stop(self):
+        pass
+
+    def version(self, game_code):
+        return None
+
+    def publish(self, origin, game_code, kind, data):
+        """Broadcasts an event and returns its version, None when the bus numbers events itself."""
+        return None
+
+    def heartbeat(self, worker_id, interval):
+        return [worker_id]
+
+    def leave(self, worker_id):
+        pass
+
+
+class SQLiteBackend:
+    """Multi-worker coordination through a small SQLite file shared by the workers of one host.
+
+    Each publish allocates the game's next version and appends the event in one
+    transaction. Every worker polls the events table and applies those of the others.
+    """
+
+    shared = True
+
+    def __init__(self, path, poll_interval=0.05):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.epoch = None  # read from the file by start()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _connection(self):
+        # One connection per thread, in autocommit mode so reads never take the write lock
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def start(self, worker_id, on_event):
+        with self._transaction() as connection:
+            for statement in SQLITE_SCHEMA:
+                connection.execute(statement)
+            connection.execute("INSERT OR IGNORE INTO coordination_meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex[:8],))
+            # Versions live in the file, so the epoch only changes with it
+            self.epoch = connection.execute("SELECT value FROM coordination_meta WHERE key = 'epoch'").fetchone()[0]
+        last_id = self._connection().execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll, args=(worker_id, on_event, last_id), name="coordination-poll", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def version(self, game_code):
+        row = self._connection().execute("SELECT version FROM game_versions WHERE game_code = ?", (game_code,)).fetchone()
+        return row[0] if row else None
+
+    def publish(self, origin, game_code, kind, data):
+        with self._transaction() as connection:
+            version = None
+            if game_code is not None:
+                version = connection.execute(
+                    "INSERT INTO game_versions (game_code, version) VALUES (?, 1) "
+                    "ON CONFLICT (game_code) DO UPDATE SET version = version + 1 RETURNING version",
+                    (game_code,),
+                ).fetchone()[0]
+            connection.execute(
+                "INSERT INTO events (origin, game_code, kind, version, data, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (origin, game_code, kind, version, dumps(data).decode(), time.time()),
+            )
+        return version
+
+    def _poll(self, worker_id, on_event, last_id):
+        pruned_at = time.time()
+        while not self._stop.wait(self.poll_interval):
+            try:
+                rows = self._connection().execute(
+                    "SELECT id, origin, game_code, kind, version, data FROM events WHERE id > ? ORDER BY id", (last_id,)
+                ).fetchall()
+                if time.time() - pruned_at > SQLITE_EVENT_RETENTION:
+                    with self._transaction() as connection:
+                        connection.execute("DELETE FROM events WHERE created < ?", (time.time() - SQLITE_EVENT_RETENTION,))
+                    pruned_at = time.time()
+                for event_id, origin, game_code, kind, version, data in rows:
+                    last_id = event_id
+                    if origin != worker_id:
+                        on_event(game_code, kind, version, json.loads(data))
+            except Exception:
+                logger.exception("coordination poll failed")
+
+    def heartbeat(self, worker_id, interval):
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute("INSERT OR REPLACE INTO workers (worker_id, last_seen) VALUES (?, ?)", (worker_id, now))
+            connection.execute("DELETE FROM workers WHERE last_seen < ?", (now - interval * HEARTBEAT_MISSES * 10,))
+            rows = connection.execute("SELECT worker_id FROM workers WHERE last_seen >= ?", (now - interval * HEARTBEAT_MISSES,))
+            return sorted(row[0] for row in rows)
+
+    def leave(self, worker_id):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT around a block, on an autocommit sqlite3 connection."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
+
+
+class RedisBackend:
+    """Multi-worker coordination through Redis (or a compatible server): INCR for versions,
+    pub/sub for events and a hash of heartbeats for the worker list. Needs the redis package."""
+
+    shared = True
+    CHANNEL = "botc:events"
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("COORDINATION_BACKEND=redis needs the redis package (pip install redis)")
+        # Connections are only opened by the first command
+        self.client = redis.Redis.from_url(url)
+        self.epoch = None  # read from the server by start()
+        self._pubsub = None
+        self._thread = None
+
+    def start(self, worker_id, on_event):
+        self.client.setnx("botc:epoch", uuid.uuid4().hex[:8])
+        self.epoch = self.client.get("botc:epoch").decode()
+
+        def handle(message):
+            event = json.loads(message["data"])
+            if event["origin"] != worker_id:
+                on_event(event["game_code"], event["kind"], event["version"], event["data"])
+
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.CHANNEL: handle})
+        self._thread = self._pubsub.run_in_thread(sleep_time=0.05, daemon=True)
+
+    def stop(self):
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+            self._pubsub.close()
+
+    def version(self, game_code):
+        version = self.client.get(f"botc:version:{game_code}")
+        return int(version) if version is not None else None
+
+    def publish(self, origin, game_code, kind, data):
+        version = self.client.incr(f"botc:version:{game_code}") if game_code is not None else None
+        self.client.publish(self.CHANNEL, dumps({
+            "origin": origin, "game_code": game_code, "kind": kind, "version": version, "data": data,
+        }))
+        return version
+
+    def heartbeat(self, worker_id, interval):
+        now = time.time()
+        self.client.hset("botc:workers", worker_id, now)
+        workers = []
+        for worker, last_seen in self.client.hgetall("botc:workers").items():
+            if float(last_seen) >= now - interval * HEARTBEAT_MISSES:
+                workers.append(worker.decode())
+            elif float(last_seen) < now - interval * HEARTBEAT_MISSES * 10:
+                self.client.hdel("botc:workers", worker)
+        return sorted(workers)
+
+    def leave(self, worker_id):
+        self.client.hdel("botc:workers", worker_id)
+
+
+def create_backend(name, url=None, poll_interval=0.05, default_dir="."):
+    if name == "inprocess":
+        return InProcessBackend()
+    if name == "sqlite":
+        return SQLiteBackend(url or os.path.join(default_dir, "coordination.db"), poll_interval)
+    if name == "redis":
+        return RedisBackend(url or "redis://localhost:6379/0")
+    raise ValueError(f"Unknown coordination backend {name!r}")
+
+
+class Coordinator:
+    """This worker's view of the deployment: its id, the live workers and which games it owns.
+
+    A game is owned by one live worker (rendezvous hashing over the heartbeat list);
+    only the owner keeps the game's hot state in memory. on_membership_change is
+    called after the worker list changes so ownership can be handed over.
+    """
+
+    def __init__(self, backend, heartbeat_interval=2.0):
+        self.backend = backend
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.workers = [self.worker_id]
+        self.on_membership_change = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def shared(self):
+        return self.backend.shared
+
+    @property
+    def epoch(self):
+        """Changes whenever event versions start again from 0, part of every ETag."""
+        return self.backend.epoch
+
+    def start(self, on_event):
+        self.backend.start(self.worker_id, on_event)
+        if not self.shared:
+            return
+        self._beat()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="coordination-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.backend.leave(self.worker_id)
+        self.backend.stop()
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self._beat()
+            except Exception:
+                logger.exception("coordination heartbeat failed")
+
+    def _beat(self):
+        workers = self.backend.heartbeat(self.worker_id, self.heartbeat_interval)
+        if self.worker_id not in workers:
+            workers = sorted(workers + [self.worker_id])
+        if workers != self.workers:
+            self.workers = workers
+            if self.on_membership_change:
+                self.on_membership_change()
+
+    def owner(self, game_code):
+        return rendezvous_owner(game_code, self.workers)
+
+    def owns(self, game_code):
+        return not self.shared or self.owner(game_code) == self.worker_id
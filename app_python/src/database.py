@@ -1,15 +1,69 @@
-import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import config
 
-print('running database')
+# Async drivers used for each backend when DB_ASYNC is enabled
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
 
-# Path to the SQLite database file inside the database_files folder
-DATABASE_URL = "sqlite:///./database.db"
+# Path to the SQLite database file, or any other SQLAlchemy URL from the config
+DATABASE_URL = config.DATABASE_URL
+
+def engine_options(url):
+    options = {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+    if url.get_backend_name() == "sqlite":
+        # SQLite connections are shared with the threadpool running the routes
+        options["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            # In-memory databases only exist on a single connection
+            options = {"connect_args": options["connect_args"]}
+    return options
+
+def async_database_url(url):
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+def sqlite_pragmas():
+    """PRAGMA statements of the configured SQLite profile."""
+    if config.SQLITE_PROFILE == "off":
+        return []
+    return [
+        f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size={config.SQLITE_CACHE_SIZE}",
+        f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT}",
+    ]
+
+def apply_sqlite_pragmas(sync_engine):
+    pragmas = sqlite_pragmas()
+    if sync_engine.url.get_backend_name() != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+url = make_url(DATABASE_URL)
 
 # Create the database engine
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(url, **engine_options(url))
+apply_sqlite_pragmas(engine)
 
 # Create a base class for our models
 Base = declarative_base()
@@ -17,3 +71,13 @@ Base = declarative_base()
 # Create a session maker
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Optional async engine and session maker, None unless DB_ASYNC is enabled
+async_engine = None
+AsyncSessionLocal = None
+if config.DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_url = async_database_url(url)
+    async_engine = create_async_engine(async_url, **engine_options(async_url))
+    apply_sqlite_pragmas(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
@@ -0,0 +1,230 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from responses import dumps
+
+# Number of past events kept per game so reconnecting clients can resume
+HISTORY_SIZE = 512
+
+# Channels without subscribers are dropped after this long without an event,
+# looked for at most every PRUNE_INTERVAL seconds while events are published
+CHANNEL_IDLE_SECONDS = 3600
+PRUNE_INTERVAL = 60
+
+# Key the coordination backend counts writes covering every game under (never a game code)
+EPOCH_KEY = "*"
+
+
+class GameEvent:
+    __slots__ = ("version", "kind", "data", "remote")
+
+    def __init__(self, version, kind, data, remote=False):
+        self.version = version
+        self.kind = kind
+        self.data = data
+        self.remote = remote  # published by another worker, data went through JSON
+
+    def to_sse(self):
+        return f"id: {self.version}\nevent: {self.kind}\ndata: {dumps(self.data).decode()}\n\n"
+
+
+class GameChannel:
+    """Versioned event stream of a single game."""
+
+    def __init__(self, game_code, history_size=HISTORY_SIZE, version=0):
+        self.game_code = game_code
+        self.version = version
+        self.history = deque(maxlen=history_size)
+        self.subscribers = set()  # (event loop, asyncio.Queue)
+        self.last_event_at = time.time()
+
+    def since(self, version):
+        """Events newer than version, or None if some of them are no longer in the history."""
+        if version > self.version:
+            # Version from before a server restart
+            return None
+        if version == self.version:
+            return []
+        if not self.history or self.history[0].version > version + 1:
+            return None
+        return [event for event in self.history if event.version > version]
+
+    def append(self, event):
+        self.history.append(event)
+        if len(self.history) > 1 and self.history[-2].version > event.version:
+            # Events of other workers can arrive after a later local one, keep the history in order
+            self.history = deque(sorted(self.history, key=lambda item: item.version), maxlen=self.history.maxlen)
+
+
+class EventBus:
+    """Per-game pub/sub used to push state changes to connected clients.
+
+    publish() can be called from the threadpool running the sync routes as well
+    as from the event loop itself. With a shared coordination backend attached,
+    versions are allocated by the backend and every event is broadcast to the
+    other workers, which deliver it to their own subscribers and listeners.
+    """
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._forget_listeners = []
+        self._pruned_at = time.monotonic()
+        # Highest version of a dropped channel: a game's new channel starts there so
+        # its versions (and the ETags built on them) never repeat old ones
+        self._version_floor = 0
+        self.coordinator = None
+        self.state_epoch = 0  # bumped by writes covering every game at once
+
+    def attach(self, coordinator):
+        self.coordinator = coordinator
+        if coordinator.shared:
+            self.state_epoch = coordinator.backend.version(EPOCH_KEY) or 0
+
+    @property
+    def shared(self):
+        return self.coordinator is not None and self.coordinator.shared
+
+    def channel(self, game_code):
+        channel = self._channels.get(game_code)
+        if channel is None:
+            # A game other workers already wrote to continues from the shared version
+            version = (self.coordinator.backend.version(game_code) or 0) if self.shared else self._version_floor
+            with self._lock:
+                channel = self._channels.setdefault(game_code, GameChannel(game_code, version=version))
+        return channel
+
+    def behind(self, game_code):
+        """Whether another worker published an event of the game that has not been delivered here yet."""
+        if not self.shared:
+            return False
+        return self.channel(game_code).version < (self.coordinator.backend.version(game_code) or 0)
+
+    def catch_up(self, game_code, timeout=1.0):
+        """Waits until the events other workers published for the game have been delivered here."""
+        deadline = time.monotonic() + timeout
+        while self.behind(game_code) and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def game_codes(self):
+        return list(self._channels)
+
+    def version(self, game_code):
+        channel = self._channels.get(game_code)
+        # Without a channel the game had no event since its channel was dropped (or since startup)
+        return channel.version if channel else self._version_floor
+
+    def last_event_at(self, game_code):
+        """Unix time of the game's last published event, None if it had none since startup."""
+        channel = self._channels.get(game_code)
+        return channel.last_event_at if channel and channel.version else None
+
+    def add_listener(self, callback):
+        """Registers callback(game_code, event), called synchronously for every published event."""
+        self._listeners.append(callback)
+
+    def add_forget_listener(self, callback):
+        """Registers callback(game_codes), called with the games whose channels were dropped."""
+        self._forget_listeners.append(callback)
+
+    def forget(self, game_codes):
+        """Drops the channels of games, with their history. Returns the game codes dropped."""
+        dropped = []
+        with self._lock:
+            for game_code in game_codes:
+                channel = self._channels.pop(game_code, None)
+                if channel is not None:
+                    self._version_floor = max(self._version_floor, channel.version)
+                    dropped.append(game_code)
+        if dropped:
+            for callback in self._forget_listeners:
+                callback(dropped)
+        return dropped
+
+    def prune(self, idle_after=CHANNEL_IDLE_SECONDS):
+        """Drops the channels nobody subscribes to that had no event for idle_after seconds."""
+        cutoff = time.time() - idle_after
+        with self._lock:
+            idle = [game_code for game_code, channel in self._channels.items()
+                    if not channel.subscribers and channel.last_event_at < cutoff]
+        return self.forget(idle)
+
+    def publish(self, game_code, kind, data):
+        version = None
+        if self.shared:
+            version = self.coordinator.backend.publish(self.coordinator.worker_id, game_code, kind, data)
+        return self._deliver(game_code, GameEvent(version, kind, data))
+
+    def receive(self, game_code, kind, version, data):
+        """Delivers an event published by another worker (called by the coordination backend)."""
+        if game_code == EPOCH_KEY:
+            with self._lock:
+                self.state_epoch = max(self.state_epoch, version)
+            return None
+        return self._deliver(game_code, GameEvent(version, kind, data, remote=True))
+
+    def bump_epoch(self):
+        """Marks every game as changed, for writes that do not go through a single game."""
+        if self.shared:
+            version = self.coordinator.backend.publish(self.coordinator.worker_id, EPOCH_KEY, "epoch", {})
+            with self._lock:
+                self.state_epoch = max(self.state_epoch, version)
+        else:
+            with self._lock:
+                self.state_epoch += 1
+
+    def _deliver(self, game_code, event):
+        while True:
+            channel = self.channel(game_code)
+            with self._lock:
+                if self._channels.get(game_code) is not channel:
+                    # Dropped since it was looked up, deliver to the game's new channel
+                    continue
+                if event.version is None:
+                    channel.version += 1
+                    event.version = channel.version
+                else:
+                    channel.version = max(channel.version, event.version)
+                channel.append(event)
+                channel.last_event_at = time.time()
+                subscribers = list(channel.subscribers)
+            break
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The subscriber's loop is closed, it will be removed on unsubscribe
+                pass
+        for callback in self._listeners:
+            callback(game_code, event)
+        if time.monotonic() - self._pruned_at > PRUNE_INTERVAL:
+            self._pruned_at = time.monotonic()
+            self.prune()
+        return event
+
+    def subscribe(self, game_code, since=None):
+        """Returns (version, backlog, queue).
+
+        backlog is None when the client has to resync from a snapshot taken at version.
+        """
+        channel = self.channel(game_code)
+        queue = asyncio.Queue()
+        with self._lock:
+            backlog = channel.since(since) if since is not None else None
+            channel.subscribers.add((asyncio.get_running_loop(), queue))
+            version = channel.version
+        return version, backlog, queue
+
+    def unsubscribe(self, game_code, queue):
+        channel = self._channels.get(game_code)
+        if channel is None:
+            # Dropped with the game's archival
+            return
+        with self._lock:
+            channel.subscribers = {sub for sub in channel.subscribers if sub[1] is not queue}
+
+
+bus = EventBus()
@@ -0,0 +1,215 @@
+import json
+import threading
+import time
+from collections import Counter
+from sqlalchemy import select, insert, func, bindparam, Integer, Float, String, Text
+import models
+from responses import dumps
+
+# Entries of a game between two snapshots. Replaying any point of a game folds
+# at most this many entries on top of the snapshot before it.
+SNAPSHOT_EVERY = 100
+
+# Game codes per IN (...) query when counting the entries of games written to for the first time
+COUNT_CHUNK = 500
+
+# One statement for every entry: the position (turn, time_of_day) is read from the
+# game's row when the writer does not know it, and entries of unknown games are dropped
+INSERT_ENTRY = insert(models.GameLogEntry.__table__).from_select(
+    [models.GameLogEntry.game_code, models.GameLogEntry.kind, models.GameLogEntry.turn,
+     models.GameLogEntry.time_of_day, models.GameLogEntry.data, models.GameLogEntry.created],
+    select(
+        models.Game.game_code,
+        bindparam("kind", type_=String),
+        func.coalesce(bindparam("turn", type_=Integer), models.Game.turn),
+        func.coalesce(bindparam("time_of_day", type_=String), models.Game.time_of_day),
+        bindparam("data", type_=Text),
+        bindparam("created", type_=Float),
+    ).where(models.Game.game_code == bindparam("entry_game_code", type_=String))
+)
+
+
+def empty_state():
+    return {"game": {}, "players": {}, "actions": [], "information": []}
+
+
+def fold(state, kind, data):
+    """Applies one log entry to a replayed state."""
+    if kind == "game":
+        turn = state["game"].get("turn")
+        state["game"].update(data)
+        if state["game"].get("turn") != turn:
+            # The state carries the actions and information of the game's current turn only
+            current = state["game"]["turn"]
+            state["actions"] = [row for row in state["actions"] if row.get("turn", current) >= current]
+            state["information"] = [row for row in state["information"] if row.get("turn", current) >= current]
+    elif kind == "player":
+        state["players"].setdefault(data["player_id"], {}).update(data)
+    elif kind == "action":
+        state["actions"].append(data)
+    elif kind == "information":
+        state["information"].append(data)
+    return state
+
+
+class GameLog:
+    """Append-only log of every change made to a game, with periodic snapshots of the folded state.
+
+    Entries are written in the transaction of the change they record, or with the
+    write-behind store in the flush writing that change. The state of a game at any
+    entry is the latest snapshot at or before it with the entries after it folded on
+    top, so a replay reads at most snapshot_every entries however long the game ran.
+    """
+
+    def __init__(self, snapshot_every=SNAPSHOT_EVERY):
+        self.snapshot_every = snapshot_every
+        self.entries_written = 0
+        self.snapshots_taken = 0
+        self._since_snapshot = {}  # game_code -> entries written after its latest snapshot
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def entry(game_code, kind, data, turn=None, time_of_day=None):
+        """An entry for write(). Without turn and time_of_day they are read from the game's row as the entry is written."""
+        return {"game_code": game_code, "kind": kind, "data": dumps(data).decode(),
+                "turn": turn, "time_of_day": time_of_day, "created": time.time()}
+
+    # Writes
+
+    def write(self, db, entries, skip_existing=False):
+        """Inserts entries in order inside db's transaction and snapshots the games due one.
+
+        skip_existing leaves out entries already in the log, for replaying a journal.
+        """
+        if skip_existing:
+            entries = self._not_written(db, entries)
+        if not entries:
+            return 0
+        db.execute(INSERT_ENTRY, [{**entry, "entry_game_code": entry["game_code"]} for entry in entries])
+        self.entries_written += len(entries)
+        for game_code, count in self._counts(db, Counter(entry["game_code"] for entry in entries)).items():
+            if count >= self.snapshot_every:
+                self.snapshot(db, game_code)
+        return len(entries)
+
+    def _counts(self, db, written):
+        """{game_code: entries after its latest snapshot} of the games of written ({game_code: entries just written})."""
+        counts, unknown = {}, []
+        with self._lock:
+            for game_code, count in written.items():
+                if game_code in self._since_snapshot:
+                    self._since_snapshot[game_code] += count
+                    counts[game_code] = self._since_snapshot[game_code]
+                else:
+                    unknown.append(game_code)
+        # Games first written to since this process started, counted in one query per chunk; the entries just written are included
+        for start in range(0, len(unknown), COUNT_CHUNK):
+            chunk = unknown[start:start + COUNT_CHUNK]
+            latest = (select(models.GameSnapshot.game_code, func.max(models.GameSnapshot.entry_id).label("entry_id"))
+                      .where(models.GameSnapshot.game_code.in_(chunk))
+                      .group_by(models.GameSnapshot.game_code).subquery())
+            totals = dict(db.execute(
+                select(models.GameLogEntry.game_code, func.count())
+                .outerjoin(latest, latest.c.game_code == models.GameLogEntry.game_code)
+                .where(models.GameLogEntry.game_code.in_(chunk),
+                       models.GameLogEntry.entry_id > func.coalesce(latest.c.entry_id, 0))
+                .group_by(models.GameLogEntry.game_code)
+            ).all())
+            with self._lock:
+                for game_code in chunk:
+                    counts[game_code] = self._since_snapshot[game_code] = totals.get(game_code, 0)
+        return counts
+
+    def _not_written(self, db, entries):
+        if not entries:
+            return []
+        written = set(db.execute(
+            select(models.GameLogEntry.game_code, models.GameLogEntry.created).where(
+                models.GameLogEntry.game_code.in_({entry["game_code"] for entry in entries}),
+                models.GameLogEntry.created >= min(entry["created"] for entry in entries))
+        ).all())
+        return [entry for entry in entries if (entry["game_code"], entry["created"]) not in written]
+
+    def snapshot(self, db, game_code):
+        """Stores the game's current folded state inside db's transaction."""
+        state, entry_id, _, _ = self._replay(db, game_code)
+        if not entry_id:
+            return None
+        db.execute(insert(models.GameSnapshot).values(
+            game_code=game_code,
+            entry_id=entry_id,
+            turn=state["game"].get("turn", 0),
+            time_of_day=state["game"].get("time_of_day", ""),
+            state=dumps(state).decode(),
+            created=time.time(),
+        ))
+        with self._lock:
+            self._since_snapshot[game_code] = 0
+        self.snapshots_taken += 1
+        return entry_id
+
+    def forget(self, game_codes):
+        with self._lock:
+            for game_code in game_codes:
+                self._since_snapshot.pop(game_code, None)
+
+    # Reads
+
+    def _replay(self, db, game_code, until=None):
+        """(state, last entry folded, entry of the snapshot started from, entries folded) up to entry until."""
+        query = (select(models.GameSnapshot.entry_id, models.GameSnapshot.state)
+                 .where(models.GameSnapshot.game_code == game_code)
+                 .order_by(models.GameSnapshot.entry_id.desc()).limit(1))
+        if until is not None:
+            query = query.where(models.GameSnapshot.entry_id <= until)
+        snapshot = db.execute(query).first()
+        state = json.loads(snapshot.state) if snapshot else empty_state()
+        start = last = snapshot.entry_id if snapshot else 0
+
+        query = (select(models.GameLogEntry.entry_id, models.GameLogEntry.kind, models.GameLogEntry.data)
+                 .where(models.GameLogEntry.game_code == game_code, models.GameLogEntry.entry_id > start)
+                 .order_by(models.GameLogEntry.entry_id))
+        if until is not None:
+            query = query.where(models.GameLogEntry.entry_id <= until)
+        replayed = 0
+        for entry_id, kind, data in db.execute(query):
+            fold(state, kind, json.loads(data))
+            last = entry_id
+            replayed += 1
+        return state, last, start, replayed
+
+    def state_at(self, db, game_code, turn=None, time_of_day=None, entry_id=None):
+        """The game as it was after entry_id, or at the end of a turn (of one time of day of it).
+        Without any of them its latest state. None if the log holds no such point."""
+        query = select(func.max(models.GameLogEntry.entry_id)).where(models.GameLogEntry.game_code == game_code)
+        if entry_id is not None:
+            query = query.where(models.GameLogEntry.entry_id <= entry_id)
+        if turn is not None:
+            query = query.where(models.GameLogEntry.turn == turn if time_of_day is not None else models.GameLogEntry.turn <= turn)
+        if time_of_day is not None:
+            query = query.where(models.GameLogEntry.time_of_day == time_of_day)
+        until = db.execute(query).scalar()
+        if until is None:
+            return None
+        state, last, start, replayed = self._replay(db, game_code, until)
+        return {
+            "entry_id": last,
+            "snapshot_entry_id": start or None,
+            "replayed": replayed,
+            "game": state["game"],
+            "players": list(state["players"].values()),
+            "actions": state["actions"],
+            "information": state["information"],
+        }
+
+    def last_written(self, db, game_code):
+        """Unix time of the game's latest entry, None if it has none."""
+        return db.execute(select(func.max(models.GameLogEntry.created)).where(models.GameLogEntry.game_code == game_code)).scalar()
+
+    def entries(self, db, game_code, after_id=0, limit=100):
+        rows = db.execute(
+            select(*models.GameLogEntry.__table__.columns)
+            .where(models.GameLogEntry.game_code == game_code, models.GameLogEntry.entry_id > after_id)
+            .order_by(models.GameLogEntry.entry_id).limit(limit)
+        ).mappings()
+        return [{**row, "data": json.loads(row["data"])} for row in rows]
@@ -0,0 +1,78 @@
+import random
+
+# Trouble Brewing character split by player count: (townsfolk, outsiders, minions, demons)
+DISTRIBUTION = {
+    5: (3, 0, 1, 1),
+    6: (3, 1, 1, 1),
+    7: (5, 0, 1, 1),
+    8: (5, 1, 1, 1),
+    9: (5, 2, 1, 1),
+    10: (7, 0, 2, 1),
+    11: (7, 1, 2, 1),
+    12: (7, 2, 2, 1),
+    13: (9, 0, 3, 1),
+    14: (9, 1, 3, 1),
+    15: (9, 2, 3, 1),
+}
+DESIGNATIONS = ("townsfolk", "outsider", "minion", "demon")
+
+# Characters that change the split when they are in play, as changes per designation
+SETUP_MODIFIERS = {
+    "Baron": {"townsfolk": -2, "outsider": 2},
+}
+
+
+class SetupError(ValueError):
+    """A player count or script the setup cannot be drawn for."""
+
+
+def distribution(player_count):
+    """{designation: count} for a player count, before modifiers."""
+    if player_count not in DISTRIBUTION:
+        raise SetupError(f"Setups exist for {min(DISTRIBUTION)} to {max(DISTRIBUTION)} players, not {player_count}")
+    return dict(zip(DESIGNATIONS, DISTRIBUTION[player_count]))
+
+
+class SetupGenerator:
+    """Draws setups of one script. The characters are split by designation once, so
+    drawing many games (bulk setup, the simulator) only samples from the pools."""
+
+    def __init__(self, characters):
+        self.pools = {designation: [] for designation in DESIGNATIONS}
+        for character in characters:
+            if character["designation"] in self.pools:
+                self.pools[character["designation"]].append(character)
+
+    def draw(self, player_count, rng=None):
+        """Draws the characters of one game, in seating order.
+
+        Minions and the demon are drawn first so their modifiers (the Baron adding
+        outsiders) apply to the good characters drawn after them.
+        """
+        rng = rng or random
+        counts = distribution(player_count)
+        chosen = []
+        for designation in ("demon", "minion", "outsider", "townsfolk"):
+            pool = self.pools[designation]
+            count = counts[designation]
+            if count < 0 or count > len(pool):
+                raise SetupError(f"Not enough {designation} characters for {player_count} players")
+            picked = rng.sample(pool, count)
+            for character in picked:
+                for affected, change in SETUP_MODIFIERS.get(character["character_name"], {}).items():
+                    counts[affected] += change
+            chosen.extend(picked)
+        rng.shuffle(chosen)
+        return chosen
+
+    def assign(self, player_ids, rng=None):
+        """{player_id: character} for the players of one game."""
+        return dict(zip(player_ids, self.draw(len(player_ids), rng)))
+
+
+def draw_setup(characters, player_count, rng=None):
+    """Draws the characters of one game, in seating order.
+
+    characters are the script's character dicts (character_name, designation).
+    """
+    return SetupGenerator(characters).draw(player_count, rng)
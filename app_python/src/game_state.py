@@ -0,0 +1,492 @@
+import json
+import logging
+import os
+import threading
+import time
+from sqlalchemy import select
+import models
+from bulk import transaction, bulk_update
+
+logger = logging.getLogger(__name__)
+
+# time_of_day values that mark a game as over
+FINISHED_STATES = {"finished", "ended", "over"}
+
+GAME_FIELDS = ("player_count", "game_version", "ai_game_master", "turn", "time_of_day")
+PLAYER_FIELDS = ("player_name", "character_id", "dead", "vote_token_remaining", "protected")
+
+# Game codes per IN (...) query when get_many loads games
+LOAD_CHUNK = 500
+
+
+class PlayerState:
+    __slots__ = ("player_id", "game_code", "player_name", "creation_date", "character_id",
+                 "dead", "vote_token_remaining", "protected")
+
+    def __init__(self, player_id, game_code, player_name, creation_date, character_id,
+                 dead, vote_token_remaining, protected):
+        self.player_id = player_id
+        self.game_code = game_code
+        self.player_name = player_name
+        self.creation_date = creation_date
+        self.character_id = character_id
+        self.dead = dead
+        self.vote_token_remaining = vote_token_remaining
+        self.protected = protected
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row.player_id, row.game_code, row.player_name, row.creation_date, row.character_id,
+                   row.dead, row.vote_token_remaining, row.protected)
+
+
+class GameState:
+    __slots__ = ("id", "game_code", "player_count", "created_date", "game_version", "ai_game_master",
+                 "turn", "time_of_day", "players", "last_activity", "finished_at",
+                 "dirty", "dirty_players")
+
+    def __init__(self, game, players):
+        self.id = game.id
+        self.game_code = game.game_code
+        self.player_count = game.player_count
+        self.created_date = game.created_date
+        self.game_version = game.game_version
+        self.ai_game_master = game.ai_game_master
+        self.turn = game.turn
+        self.time_of_day = game.time_of_day
+        self.players = {player.player_id: PlayerState.from_row(player) for player in players}
+        self.last_activity = time.monotonic()
+        self.finished_at = self.last_activity if is_finished(self.time_of_day) else None
+        self.dirty = False  # game row changed since the last flush
+        self.dirty_players = set()  # player_ids changed since the last flush
+
+
+def is_finished(time_of_day):
+    return (time_of_day or "").lower() in FINISHED_STATES
+
+
+class GameStateStore:
+    """Authoritative in-memory state of the active games, written behind to the database.
+
+    Reads are served from memory. Every write is appended to a journal file before it
+    is applied, and a background thread flushes the changed games and players to the
+    database in one transaction per interval. On start, recover() replays whatever the
+    journal still holds into the database, so a crash loses no acknowledged write.
+
+    With several workers (shared=True) a worker cannot see another one's unflushed
+    changes, so every write goes straight to the database and memory is only a read
+    cache. owns(game_code) tells whether this worker caches a game; a cached game is
+    read again from the database once is_stale(game_code) reports a newer write by
+    another worker.
+
+    With a GameLog, every change is also recorded as a log entry. Entries are journaled
+    with the change and written in the flush (or write) of the rows they describe, in
+    the order they were recorded.
+    """
+
+    def __init__(self, session_factory, journal_path, flush_interval=1.0, evict_after=600,
+                 idle_evict_after=3600, fsync=False, shared=False, owns=None, is_stale=None, log=None):
+        self.session_factory = session_factory
+        self.journal_path = journal_path
+        self.shared = shared
+        self.owns = owns or (lambda game_code: True)
+        self.is_stale = is_stale or (lambda game_code: False)
+        self.flush_interval = flush_interval
+        self.evict_after = evict_after  # seconds a finished game stays in memory
+        self.idle_evict_after = idle_evict_after  # seconds an untouched game stays in memory
+        self.fsync = fsync
+        self.log = log
+        self.games = {}
+        self.player_games = {}  # player_id -> game_code
+        self.log_entries = []  # game log entries not written yet, in the order they were recorded
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._journal = None
+        self._unwritten_journals = []  # rotated journals of failed flushes, their changes are in memory again
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Lifecycle
+
+    def start(self):
+        # Also replays what a single worker run left behind before switching to several workers
+        self.recover()
+        if not self.shared:
+            self._journal = open(self.journal_path, "a")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="game-state-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                self.evict()
+            except Exception as e:
+                # Keep the journal, the next interval retries
+                logger.exception("game state flush failed: %s", e)
+
+    # Reads
+
+    def _held(self, game_code):
+        # The GameState to serve from memory, None when it has to be loaded
+        state = self.games.get(game_code)
+        if state is not None:
+            if not self.shared or (self.owns(game_code) and not self.is_stale(game_code)):
+                return state
+            self.release(game_code)
+        return None
+
+    def _keep(self, game_code, loaded):
+        if not self.owns(game_code):
+            # Another worker caches this game, a copy kept here would go stale
+            return loaded
+        with self._lock:
+            state = self.games.setdefault(game_code, loaded)
+            for player_id in state.players:
+                self.player_games[player_id] = game_code
+        return state
+
+    def get(self, game_code):
+        """Returns the GameState of a game, loading it from the database the first time. None if unknown."""
+        state = self._held(game_code)
+        if state is not None:
+            return state
+
+        db = self.session_factory()
+        try:
+            game = db.scalars(select(models.Game).where(models.Game.game_code == game_code)).first()
+            if game is None:
+                return None
+            players = db.scalars(select(models.Player).where(models.Player.game_code == game_code)).all()
+            loaded = GameState(game, players)
+        finally:
+            db.close()
+        return self._keep(game_code, loaded)
+
+    def get_many(self, game_codes):
+        """{game_code: GameState} of the games that exist, the ones not held yet loaded with one query per chunk of games."""
+        states, missing = {}, []
+        for game_code in game_codes:
+            state = self._held(game_code)
+            if state is not None:
+                states[game_code] = state
+            else:
+                missing.append(game_code)
+
+        db = self.session_factory()
+        try:
+            for start in range(0, len(missing), LOAD_CHUNK):
+                chunk = missing[start:start + LOAD_CHUNK]
+                # Plain rows, GameState only reads their columns
+                games = db.execute(select(*models.Game.__table__.columns).where(models.Game.game_code.in_(chunk))).all()
+                players = {}
+                for player in db.execute(select(*models.Player.__table__.columns).where(models.Player.game_code.in_(chunk))):
+                    players.setdefault(player.game_code, []).append(player)
+                for game in games:
+                    states[game.game_code] = self._keep(game.game_code, GameState(game, players.get(game.game_code, [])))
+        finally:
+            db.close()
+        return {game_code: states[game_code] for game_code in game_codes if game_code in states}
+
+    def player(self, player_id):
+        """Returns (GameState, PlayerState) for a player, or (None, None) if unknown."""
+        game_code = self.player_games.get(player_id)
+        if game_code is None:
+            db = self.session_factory()
+            try:
+                game_code = db.scalars(select(models.Player.game_code).where(models.Player.player_id == player_id)).first()
+            finally:
+                db.close()
+            if game_code is None:
+                return None, None
+        state = self.get(game_code)
+        if state is None:
+            return None, None
+        return state, state.players.get(player_id)
+
+    # Writes
+
+    def update_game(self, game_code, changes):
+        state = self.get(game_code)
+        if state is None:
+            return None
+        changes = {field: value for field, value in changes.items() if field in GAME_FIELDS and value is not None}
+        entries = self._log_entries(game_code, "game", [changes] if changes else [],
+                                    changes.get("turn", state.turn), changes.get("time_of_day", state.time_of_day))
+        if self.shared and changes:
+            self._write([{"game_code": game_code, **changes}], [], entries)
+        with self._lock:
+            if not self.shared:
+                # The game may have been evicted since get(), keep the instance we are writing to
+                state = self.games.setdefault(game_code, state)
+            self._append({"type": "game", "game_code": game_code, "changes": changes})
+            for field, value in changes.items():
+                setattr(state, field, value)
+            state.dirty = not self.shared
+            self._pend(entries)
+            self._touch(state)
+        return state
+
+    def update_player(self, player_id, changes):
+        """Returns (GameState, PlayerState) after the change, or (None, None) if the player is unknown."""
+        state, player = self.player(player_id)
+        if player is None:
+            return None, None
+        self.update_players(state, {player_id: changes})
+        return state, state.players[player_id]
+
+    def update_players(self, state, changes_by_player):
+        """Applies {player_id: changes} for players of one game as a single journal entry."""
+        changes_by_player = {
+            player_id: {field: value for field, value in changes.items() if field in PLAYER_FIELDS and value is not None}
+            for player_id, changes in changes_by_player.items()
+        }
+        entries = self._log_entries(state.game_code, "player", [
+            {"player_id": player_id, **changes} for player_id, changes in changes_by_player.items() if changes
+        ], state.turn, state.time_of_day)
+        if self.shared:
+            self._write([], [{"player_id": player_id, **changes} for player_id, changes in changes_by_player.items() if changes], entries)
+        with self._lock:
+            if not self.shared:
+                # The game may have been evicted since it was read, keep the instance we are writing to
+                state = self.games.setdefault(state.game_code, state)
+            self._append({"type": "players", "changes": changes_by_player})
+            for player_id, changes in changes_by_player.items():
+                player = state.players[player_id]
+                for field, value in changes.items():
+                    setattr(player, field, value)
+                if not self.shared:
+                    state.dirty_players.add(player_id)
+            self._pend(entries)
+            self._touch(state)
+        return state
+
+    def record(self, game_code, kind, data):
+        """Queues log entries for rows the routes wrote themselves (new games, players, actions,
+        information) behind the game's pending changes. With shared=True the routes write
+        their entries in their own transaction instead.
+        """
+        if self.log is None or not data:
+            return
+        state = self.get(game_code)
+        if state is not None:
+            position = state.turn, state.time_of_day
+        else:
+            # A game being created, not committed yet
+            position = data[-1].get("turn"), data[-1].get("time_of_day")
+        with self._lock:
+            self._pend(self._log_entries(game_code, kind, data, *position))
+
+    def _log_entries(self, game_code, kind, data, turn, time_of_day):
+        if self.log is None:
+            return []
+        return [self.log.entry(game_code, kind, item, turn, time_of_day) for item in data]
+
+    def _pend(self, entries):
+        # Called with the lock held. With shared=True the entries were written already.
+        if entries and not self.shared:
+            self._append({"type": "log", "entries": entries})
+            self.log_entries.extend(entries)
+
+    def add_player(self, player_row):
+        """Registers a player already committed to the database by create_player."""
+        with self._lock:
+            state = self.games.get(player_row.game_code)
+            if state is not None:
+                state.players[player_row.player_id] = PlayerState.from_row(player_row)
+                self.player_games[player_row.player_id] = player_row.game_code
+                self._touch(state)
+
+    def release(self, game_code):
+        """Writes a game's pending changes and drops it from memory."""
+        self.flush(game_code)
+        with self._lock:
+            state = self.games.get(game_code)
+            if state is not None and not state.dirty and not state.dirty_players and not self._has_log_entries(game_code):
+                self._drop(game_code)
+
+    def _drop(self, game_code):
+        state = self.games.pop(game_code)
+        for player_id in state.players:
+            self.player_games.pop(player_id, None)
+
+    def on_event(self, game_code, event):
+        """Event bus listener: another worker wrote to a game cached here, read it again next time."""
+        if event.remote and game_code in self.games and event.kind in ("game", "player", "archived"):
+            self.release(game_code)
+
+    def _has_log_entries(self, game_code):
+        return any(entry["game_code"] == game_code for entry in self.log_entries)
+
+    def _touch(self, state):
+        state.last_activity = time.monotonic()
+        if is_finished(state.time_of_day):
+            state.finished_at = state.finished_at or state.last_activity
+        else:
+            state.finished_at = None
+
+    def _append(self, entry):
+        if self._journal is None:
+            return
+        self._journal.write(json.dumps(entry) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    # Persistence
+
+    def flush(self, game_code=None):
+        """Writes the changed games and players (of one game, or all) to the database in one transaction."""
+        with self._flush_lock:
+            with self._lock:
+                if game_code is None:
+                    states = list(self.games.values())
+                else:
+                    states = [self.games[game_code]] if game_code in self.games else []
+                game_rows, player_rows = [], []
+                for state in states:
+                    if state.dirty:
+                        game_rows.append({"game_code": state.game_code, **{field: getattr(state, field) for field in GAME_FIELDS}})
+                    for player_id in state.dirty_players:
+                        player = state.players[player_id]
+                        player_rows.append({"player_id": player_id, **{field: getattr(player, field) for field in PLAYER_FIELDS}})
+                if game_code is None:
+                    log_entries, self.log_entries = self.log_entries, []
+                else:
+                    log_entries = [entry for entry in self.log_entries if entry["game_code"] == game_code]
+                    self.log_entries = [entry for entry in self.log_entries if entry["game_code"] != game_code]
+                if not game_rows and not player_rows and not log_entries:
+                    return 0
+                for state in states:
+                    state.dirty = False
+                    state.dirty_players = set()
+                # Entries appended from now on belong to the next flush
+                rotated = self._rotate_journal() if game_code is None else None
+
+            try:
+                self._write(game_rows, player_rows, log_entries)
+            except Exception:
+                with self._lock:
+                    self._mark_dirty(game_rows, player_rows)
+                    # Ahead of the entries recorded since, the order of a game's log is kept
+                    self.log_entries[:0] = log_entries
+                    if rotated:
+                        # Replayed by recover() if the process dies before the next flush of every game
+                        self._unwritten_journals.append(rotated)
+                raise
+            if rotated:
+                # Every change of the journals of failed flushes was written again with this one
+                for path in self._unwritten_journals + [rotated]:
+                    os.remove(path)
+                self._unwritten_journals = []
+            return len(game_rows) + len(player_rows) + len(log_entries)
+
+    def _mark_dirty(self, game_rows, player_rows):
+        for row in game_rows:
+            if row["game_code"] in self.games:
+                self.games[row["game_code"]].dirty = True
+        for row in player_rows:
+            game_code = self.player_games.get(row["player_id"])
+            if game_code in self.games:
+                self.games[game_code].dirty_players.add(row["player_id"])
+
+    def _rotate_journal(self):
+        if self._journal is None:
+            return None
+        self._journal.close()
+        rotated = f"{self.journal_path}.{time.time_ns()}"
+        try:
+            os.replace(self.journal_path, rotated)
+        except FileNotFoundError:
+            rotated = None
+        self._journal = open(self.journal_path, "a")
+        return rotated
+
+    def _write(self, game_rows, player_rows, log_entries=(), recovering=False):
+        db = self.session_factory()
+        try:
+            with transaction(db):
+                if game_rows:
+                    # Games are keyed by game_code in the routes, map them to the primary key
+                    ids = dict(db.execute(
+                        select(models.Game.game_code, models.Game.id).where(
+                            models.Game.game_code.in_([row["game_code"] for row in game_rows]))
+                    ).all())
+                    bulk_update(db, models.Game, [
+                        {"id": ids[row["game_code"]], **{field: value for field, value in row.items() if field != "game_code"}}
+                        for row in game_rows if row["game_code"] in ids
+                    ])
+                bulk_update(db, models.Player, player_rows)
+                if self.log is not None and log_entries:
+                    # After the rows, so entries without a position read the game's new turn.
+                    # A journal can hold entries a flush of one game already wrote, those are skipped.
+                    self.log.write(db, list(log_entries), skip_existing=recovering)
+        finally:
+            db.close()
+
+    def recover(self):
+        """Replays journal entries that were not flushed before the last shutdown or crash."""
+        directory = os.path.dirname(os.path.abspath(self.journal_path))
+        prefix = os.path.basename(self.journal_path)
+        # Rotated journals in the order they were rotated, then the live one holding the latest changes
+        rotated = sorted(
+            int(name[len(prefix) + 1:]) for name in os.listdir(directory)
+            if name.startswith(prefix + ".") and name[len(prefix) + 1:].isdigit()
+        )
+        journals = [os.path.join(directory, f"{prefix}.{rotated_at}") for rotated_at in rotated]
+        if os.path.exists(self.journal_path):
+            journals.append(os.path.abspath(self.journal_path))
+        game_changes, player_changes, log_entries = {}, {}, []
+        for path in journals:
+            with open(path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line of a crashed write, nothing after it was acknowledged
+                        break
+                    if entry["type"] == "game":
+                        game_changes.setdefault(entry["game_code"], {}).update(entry["changes"])
+                    elif entry["type"] == "log":
+                        log_entries.extend(entry["entries"])
+                    else:
+                        for player_id, changes in entry["changes"].items():
+                            player_changes.setdefault(player_id, {}).update(changes)
+
+        if game_changes or player_changes or log_entries:
+            self._write(
+                [{"game_code": game_code, **changes} for game_code, changes in game_changes.items()],
+                [{"player_id": player_id, **changes} for player_id, changes in player_changes.items()],
+                log_entries,
+                recovering=True,
+            )
+        for path in journals:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Replayed by another worker starting at the same time
+                pass
+        return len(game_changes) + len(player_changes) + len(log_entries)
+
+    def evict(self):
+        """Drops finished and idle games from memory once they are flushed, and games now cached by another worker."""
+        now = time.monotonic()
+        with self._lock:
+            for game_code, state in list(self.games.items()):
+                if state.dirty or state.dirty_players or self._has_log_entries(game_code):
+                    continue
+                finished = state.finished_at is not None and now - state.finished_at > self.evict_after
+                idle = now - state.last_activity > self.idle_evict_after
+                if finished or idle or not self.owns(game_code):
+                    self._drop(game_code)
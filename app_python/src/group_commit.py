@@ -0,0 +1,99 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from bulk import transaction, bulk_insert
+
+
+class GroupCommitWriter:
+    """Coalesces single-row inserts arriving within a few milliseconds into one transaction.
+
+    Routes call submit() from the threadpool and wait on the returned Future, which
+    resolves to the inserted ORM object once the batch holding it is committed.
+    on_insert(db, model, rows) is called with each model's inserted rows inside the
+    batch's transaction, for writes that have to commit together with them.
+    """
+
+    def __init__(self, session_factory, window_ms=5, max_batch=256, on_insert=None):
+        self.session_factory = session_factory
+        self.on_insert = on_insert
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self.batches = 0
+        self.rows = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, model, values):
+        future = Future()
+        self._queue.put((model, values, future))
+        return future
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Write what we have, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                self._write(batch)
+            except Exception:
+                # One bad row must not fail the requests it was batched with, retry them one by one
+                for item in batch:
+                    try:
+                        self._write([item])
+                    except Exception as e:
+                        item[2].set_exception(e)
+
+    def _write(self, batch):
+        db = self.session_factory(expire_on_commit=False)
+        try:
+            by_model = {}
+            for model, values, future in batch:
+                by_model.setdefault(model, []).append((values, future))
+
+            results = []
+            with transaction(db):
+                for model, items in by_model.items():
+                    rows = bulk_insert(db, model, [values for values, _ in items], returning=True)
+                    if self.on_insert:
+                        self.on_insert(db, model, rows)
+                    results.extend(zip(rows, (future for _, future in items)))
+        finally:
+            db.close()
+
+        self.batches += 1
+        self.rows += len(results)
+        for row, future in results:
+            future.set_result(row)
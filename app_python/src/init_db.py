@@ -1,6 +1,12 @@
-from database import engine, Base
-from models import Game, Player
+from database import engine
+from migrations import upgrade
 
-print('running...')
-# Create the database tables
-Base.metadata.create_all(bind=engine)
+
+def init_db():
+    # Create the database tables and migrate the ones from older versions
+    upgrade(engine)
+
+
+if __name__ == "__main__":
+    init_db()
+    print("database ready")
@@ -1,32 +1,275 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Header, BackgroundTasks, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from sqlalchemy.orm import Session
-from database import SessionLocal  # Import from the 'database' folder
+from database import SessionLocal, AsyncSessionLocal, engine, async_engine  # Import from the 'database' folder
+import config
 import models as models
-import random
-import string
 from fastapi.middleware.cors import CORSMiddleware
-from schema import PlayerCreate
+from schema import PlayerCreate, GameResponse, GamesPageResponse, PlayerResponse, PlayerDetailResponse, PlayersResponse
+from responses import FastJSONResponse, dumps
+from content import registry, ContentPackError
+from events import bus
+from bulk import transaction, fetch_by_ids, bulk_update, bulk_insert
+from migrations import upgrade
+from group_commit import GroupCommitWriter
+from game_state import GameStateStore
+from allocator import allocator
+from sqlalchemy.exc import IntegrityError
+from schedule import ScheduleEngine
+from metrics import metrics, instrument_engine, MetricsMiddleware, SlowRequestProfiler
+from archive import Archiver
+from voting import VoteEngine, VotingError
+from night import resolve_night, NIGHT_INFO_TYPE
+from coordination import Coordinator, create_backend
+from game_log import GameLog
+from coalescing import ReadCoalescer
+from game_setup import SetupGenerator, SetupError, DESIGNATIONS
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
-import json
-import requests
-import psutil
-import socket
+from anyio import to_thread
+from sqlalchemy import select, update, insert
 from typing import Optional, List
+from datetime import datetime, timedelta
+
+# Inserts retried with a new code/id when they hit one issued before the allocator existed
+ALLOCATION_ATTEMPTS = 3
+
+# Page size of /games/ and /games/{game_code}/log, and rows fetched per round trip by /export/{table}
+GAMES_PAGE_SIZE = 100
+GAMES_PAGE_SIZE_MAX = 1000
+EXPORT_BATCH_SIZE = 1000
+
+# Seconds between keep-alive comments on idle event streams
+EVENT_STREAM_KEEPALIVE = 15
 
 def generate_game_code():
-    """Generates a 6-character game code consisting of uppercase letters and digits."""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-
-app = FastAPI()
-
-# Add CORS middleware to allow frontend requests from different origins
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # or you can specify the exact frontend origin URL
-    allow_credentials=True,
-    allow_methods=["*"],  # allows all methods (GET, POST, etc.)
-    allow_headers=["*"],  # allows all headers
+    """Allocates a 6-character game code of uppercase letters and digits, unique across workers."""
+    return allocator.next_game_code()
+
+# Routes, mounted on the application built by create_app()
+router = APIRouter()
+
+# Per-route latency and database statistics, exposed on /metrics
+profiler = SlowRequestProfiler(config.PROFILE_SLOW_MS, config.PROFILE_SAMPLE_RATE)
+profiler.set_enabled(config.PROFILE_SLOW_REQUESTS)
+instrument_engine(engine)
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine)
+metrics.add_counter("content_json_loads_total", "Game content JSON files parsed.", lambda: {(): registry.load_count})
+metrics.add_counter("content_pack_loads_total", "Compiled content packs mapped.", lambda: {(): registry.pack_loads})
+metrics.add_gauge("event_bus_games", "Games with an event channel.", lambda: len(bus.game_codes()))
+
+def size_threadpool():
+    # The sync routes run in anyio's threadpool, keep it in line with the connection pool
+    to_thread.current_default_thread_limiter().total_tokens = config.DB_POOL_SIZE + config.DB_MAX_OVERFLOW
+
+def migrate_database():
+    # Older database.db files get the new columns and indexes before serving requests
+    upgrade(engine)
+
+def load_game_content():
+    # Compile (if needed) and map every content pack once, later requests are served from the registry
+    registry.preload()
+
+# Append-only log of every change to a game with periodic snapshots, replayed by GET /games/{game_code}/replay
+game_log = GameLog(config.GAME_LOG_SNAPSHOT_EVERY) if config.GAME_LOG else None
+
+def log_changes(db, game_code, kind, data):
+    """Records changes of one kind to a game in its log: in db's transaction, before the caller
+    commits, or with the write-behind store's next flush."""
+    log_changes_by_game(db, kind, {game_code: data})
+
+def log_changes_by_game(db, kind, data_by_game):
+    # log_changes for several games ({game_code: data}) with a single write to the log
+    if not game_log:
+        return
+    if game_store and not game_store.shared:
+        for game_code, data in data_by_game.items():
+            if data:
+                game_store.record(game_code, kind, data)
+    else:
+        game_log.write(db, [game_log.entry(game_code, kind, item) for game_code, data in data_by_game.items() for item in data])
+
+def log_inserted(db, model, rows):
+    # New Actions and Information rows, in the log of their games
+    if model is models.Actions:
+        kind, to_dict = "action", action_to_dict
+    elif model is models.Information:
+        kind, to_dict = "information", information_to_dict
+    else:
+        return
+    by_game = {}
+    for row in rows:
+        if row.game_code:
+            by_game.setdefault(row.game_code, []).append(to_dict(row))
+    log_changes_by_game(db, kind, by_game)
+
+# Shared writer for add_action/add_information inserts, only when group commit is enabled
+group_commit_writer = None
+if config.GROUP_COMMIT_MS > 0:
+    group_commit_writer = GroupCommitWriter(SessionLocal, config.GROUP_COMMIT_MS, config.GROUP_COMMIT_MAX_BATCH,
+                                            on_insert=log_inserted if game_log else None)
+
+def start_group_commit_writer():
+    if group_commit_writer:
+        group_commit_writer.start()
+
+def stop_group_commit_writer():
+    if group_commit_writer:
+        # Flushes the rows still waiting in the queue
+        group_commit_writer.stop()
+
+# Shared event versions, change events and game ownership between workers.
+# The default in-process backend keeps everything local to this process.
+coordinator = Coordinator(
+    create_backend(config.COORDINATION_BACKEND, config.COORDINATION_URL or None,
+                   config.COORDINATION_POLL_MS / 1000, config.APP_DIR),
+    heartbeat_interval=config.WORKER_HEARTBEAT_SECONDS
+)
+
+def start_coordinator():
+    # Registers this worker and starts applying the events published by the others
+    coordinator.start(bus.receive)
+    bus.attach(coordinator)
+
+# In-memory game state written behind to the database, only when WRITE_BEHIND is enabled
+game_store = None
+if config.WRITE_BEHIND:
+    game_store = GameStateStore(
+        SessionLocal,
+        config.GAME_STATE_JOURNAL,
+        flush_interval=config.GAME_STATE_FLUSH_INTERVAL,
+        evict_after=config.GAME_STATE_EVICT_MINUTES * 60,
+        idle_evict_after=config.GAME_STATE_IDLE_EVICT_MINUTES * 60,
+        fsync=config.GAME_STATE_JOURNAL_FSYNC,
+        # With several workers each game is cached by one of them and written through
+        shared=coordinator.shared,
+        owns=coordinator.owns,
+        is_stale=bus.behind,
+        log=game_log
+    )
+    bus.add_listener(game_store.on_event)
+
+def start_game_store():
+    if game_store:
+        # Replays the journal left by a crash before serving requests
+        game_store.start()
+
+def stop_game_store():
+    if game_store:
+        game_store.stop()
+
+def stop_coordinator():
+    # After the last flush, so the games this worker held move on with their changes written
+    coordinator.stop()
+
+metrics.add_gauge("coordination_workers", "Live workers seen by this worker.", lambda: len(coordinator.workers))
+
+def flush_game_state(game_code):
+    """Writes a game's (or with None every game's) pending in-memory changes before a route reads rows from the database."""
+    if game_store:
+        game_store.flush(game_code)
+
+if group_commit_writer:
+    metrics.add_counter("group_commit_batches_total", "Transactions written by the group commit writer.",
+                        lambda: {(): group_commit_writer.batches})
+    metrics.add_counter("group_commit_rows_total", "Rows written by the group commit writer.",
+                        lambda: {(): group_commit_writer.rows})
+if game_log:
+    metrics.add_counter("game_log_entries_total", "Entries written to the game log.", lambda: {(): game_log.entries_written})
+    metrics.add_counter("game_log_snapshots_total", "Snapshots taken of logged games.", lambda: {(): game_log.snapshots_taken})
+if game_store:
+    metrics.add_gauge("game_state_games", "Games held in memory by the write-behind store.", lambda: len(game_store.games))
+
+def insert_row(db, model, values):
+    """Inserts one row, through the group commit writer when it is enabled."""
+    if group_commit_writer:
+        return group_commit_writer.submit(model, values).result()
+    row = model(**values)
+    db.add(row)
+    db.flush()
+    # Logged in the insert's transaction
+    log_inserted(db, model, [row])
+    db.commit()
+    return row
+
+# Per-game wake order, rebuilt only when a player's character or dead flag changes
+schedules = ScheduleEngine(registry, bus.version)
+bus.add_listener(schedules.on_event)
+
+# Single-flight database reads of the polled game routes, keyed by the same version as their ETags
+reads = None
+if config.READ_COALESCING:
+    reads = ReadCoalescer(lambda game_code: (bus.state_epoch, bus.version(game_code)), config.READ_COALESCING_TTL_MS / 1000)
+    bus.add_listener(reads.on_event)
+    metrics.add_counter("read_coalescing_total", "Coalesced game reads by outcome: hit (recent result), "
+                        "coalesced (joined a running query) or miss (ran the query).",
+                        lambda: {(("read", name), ("outcome", outcome)): count for (name, outcome), count in reads.counts.items()})
+
+def coalesced_read(name, game_code, load):
+    """load() run once for concurrent identical reads of a game, when read coalescing is enabled."""
+    return reads.get(name, game_code, load) if reads else load()
+
+# Nominations and votes of the current day of each game, tallied in memory
+votes = VoteEngine()
+bus.add_listener(votes.on_event)
+
+def forget_games(game_codes):
+    # The event bus dropped the channels of idle or archived games, drop what the process caches about
+    # them too, and about games it only read since (they have no channel to be dropped with)
+    tracked = set(bus.game_codes())
+    for player_id, game_code in list(player_games.items()):
+        if game_code not in tracked:
+            player_games.pop(player_id, None)
+    schedules.retain(tracked)
+    if game_log:
+        game_log.forget(game_codes)
+
+bus.add_forget_listener(forget_games)
+
+def forget_archived_games(game_codes):
+    # Drop what the process still caches about games whose rows were moved to the archive
+    for game_code in game_codes:
+        # Moves the game's version on, so ETags of its archived state stop matching
+        bus.publish(game_code, "archived", {})
+    bus.forget(game_codes)
+
+def last_game_activity(game_code):
+    """Unix time of the game's last write: its last event, or for a game whose channel was dropped
+    while idle its latest log entry. None if neither is known."""
+    last_event = bus.last_event_at(game_code)
+    if last_event is not None or not game_log:
+        return last_event
+    db = SessionLocal()
+    try:
+        return game_log.last_written(db, game_code)
+    finally:
+        db.close()
+
+# Moves finished and idle games out of the live tables, on a timer when ARCHIVE_ENABLED is set
+archiver = Archiver(
+    SessionLocal,
+    engine,
+    config.ARCHIVE_DIR,
+    finished_after=timedelta(hours=config.ARCHIVE_FINISHED_HOURS),
+    idle_after=timedelta(days=config.ARCHIVE_IDLE_DAYS),
+    chunk_size=config.ARCHIVE_CHUNK_SIZE,
+    last_activity=last_game_activity,
+    # Games held by the write-behind store are still being played
+    is_active=lambda game_code: game_store is not None and game_code in game_store.games,
+    on_archived=forget_archived_games,
 )
+metrics.add_counter("games_archived_total", "Games moved to the archive.", lambda: {(): archiver.games_archived})
+
+def start_archiver():
+    if config.ARCHIVE_ENABLED:
+        archiver.start(config.ARCHIVE_INTERVAL_MINUTES * 60)
+
+def stop_archiver():
+    archiver.stop()
 
 # Dependency to get the database session
 def get_db():
@@ -36,6 +279,103 @@ def get_db():
     finally:
         db.close()
 
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@router.put("/metrics/profiler")
+def set_profiler(enabled: bool):
+    profiler.set_enabled(enabled)
+    return {"result": "success", "enabled": profiler.enabled}
+
+@router.get("/metrics/slow_requests")
+def get_slow_requests():
+    return {"result": "success", "enabled": profiler.enabled, "slow_requests": list(profiler.slow_requests)}
+
+# Column-only selects: rows come back as tuples without building ORM instances
+PLAYER_COLUMNS = tuple(models.Player.__table__.columns)
+GAME_COLUMNS = tuple(models.Game.__table__.columns)
+
+def player_to_dict(player):
+    return {
+        "player_id": player.player_id,
+        "game_code": player.game_code,
+        "player_name": player.player_name,
+        "creation_date": player.creation_date,
+        "character_id": player.character_id,
+        "dead": player.dead,
+        "vote_token_remaining": player.vote_token_remaining,
+        "protected": player.protected
+    }
+
+def game_to_dict(game):
+    return {
+        "id": game.id,
+        "game_code": game.game_code,
+        "player_count": game.player_count,
+        "created_date": game.created_date,
+        "game_version": game.game_version,
+        "ai_game_master": game.ai_game_master,
+        "turn": game.turn,
+        "time_of_day": game.time_of_day
+    }
+
+def action_to_dict(action):
+    return {
+        "action_id": action.action_id,
+        "player_id": action.player_id,
+        "action_type": action.action_type,
+        "action_input": action.action_input,
+        "turn": action.turn,
+        "response_required": action.response_required
+    }
+
+def information_to_dict(info):
+    return {
+        "information_id": info.information_id,
+        "player_id": info.player_id,
+        "information_type": info.information_type,
+        "information_input": info.information_input,
+        "turn": info.turn,
+        "response_required": info.response_required
+    }
+
+# Conditional GETs of the polled routes. The ETag is the game's event bus version, which
+# every write bumps, so a poll with an unchanged version gets a 304 without a query.
+# coordinator.epoch changes whenever versions start again from 0 (a restart, or a new coordination
+# file or server), bus.state_epoch is bumped by writes covering every game at once.
+def game_etag(game_code):
+    """Weak ETag of a game's current state. Read it before the data so a racing write is never hidden."""
+    return f'W/"{coordinator.epoch}.{bus.state_epoch}.{bus.version(game_code)}"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        # Weak comparison, W/ prefixes are ignored
+        if tag == "*" or tag.removeprefix("W/") == etag.removeprefix("W/"):
+            return True
+    return False
+
+def not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def etag_headers(etag):
+    # no-cache: browsers keep the response but revalidate it with If-None-Match on every poll
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+# player_id -> game_code, a player never moves to another game
+player_games = {}
+
+def get_player_game_code(db, player_id):
+    game_code = player_games.get(player_id)
+    if game_code is None:
+        player = db.query(models.Player.game_code).filter(models.Player.player_id == player_id).first()
+        if player:
+            game_code = player_games[player_id] = player.game_code
+    return game_code
+
 class GameCreateRequest(BaseModel):
     player_count: Optional[int | None] = None
     game_version: Optional[str | None] = None
@@ -47,19 +387,34 @@ class PlayerCreateRequest(BaseModel):
     game_code: str
     player_name: str
 
+# Addresses rarely change, keep the interface lookup for a while: interface -> (looked up at, address)
+IP_CACHE_SECONDS = 60
+ip_addresses = {}
+
 def get_ip_address(interface='en0'):
+    cached = ip_addresses.get(interface)
+    if cached and time.monotonic() - cached[0] < IP_CACHE_SECONDS:
+        return cached[1]
+
+    # psutil is only needed here, import it on the first call rather than at startup
+    import psutil
+    import socket
+
     # Get all network interfaces and their addresses
     interfaces = psutil.net_if_addrs()
 
+    address = None
     # Check if the specified interface exists
     if interface in interfaces:
         # Get the first address of the interface (IPv4 usually)
         for addr in interfaces[interface]:
             if addr.family == socket.AF_INET:  # Use socket.AF_INET for IPv4
-                return addr.address
-    return None
+                address = addr.address
+                break
+    ip_addresses[interface] = (time.monotonic(), address)
+    return address
 
-@app.get("/get_ip/")
+@router.get("/get_ip/")
 def get_ip():
     interface = 'en0'
     ip = get_ip_address(interface)
@@ -68,28 +423,123 @@ def get_ip():
     else:
         return {"error": f"IP address for interface {interface} not found"}
 
+
+def snapshot_queries(game_code, turn):
+    return (
+        select(models.Player).where(models.Player.game_code == game_code),
+        select(models.Actions).where(models.Actions.game_code == game_code, models.Actions.turn == turn),
+        select(models.Information).where(models.Information.game_code == game_code, models.Information.turn == turn)
+    )
+
+def build_snapshot(game, players, actions, information):
+    return {
+        "game": game_to_dict(game),
+        "players": [player_to_dict(player) for player in players],
+        "actions": [action_to_dict(action) for action in actions],
+        "information": [information_to_dict(info) for info in information]
+    }
+
+def load_game_snapshot(game_code):
+    """Full state of a game, sent to event stream clients that cannot resume from their version."""
+    flush_game_state(game_code)
+    db = SessionLocal()
+    try:
+        game = db.scalars(select(models.Game).where(models.Game.game_code == game_code)).first()
+        if not game:
+            return None
+        players, actions, information = (db.scalars(query).all() for query in snapshot_queries(game_code, game.turn))
+        return build_snapshot(game, players, actions, information)
+    finally:
+        db.close()
+
+async def load_game_snapshot_async(game_code):
+    """Same as load_game_snapshot, on the async engine when it is enabled, otherwise in the threadpool."""
+    if AsyncSessionLocal is None:
+        return await asyncio.to_thread(load_game_snapshot, game_code)
+    if game_store:
+        await asyncio.to_thread(flush_game_state, game_code)
+    async with AsyncSessionLocal() as db:
+        game = (await db.scalars(select(models.Game).where(models.Game.game_code == game_code))).first()
+        if not game:
+            return None
+        players, actions, information = [(await db.scalars(query)).all() for query in snapshot_queries(game_code, game.turn)]
+        return build_snapshot(game, players, actions, information)
+
+@router.get("/games/{game_code}/events")
+async def game_events(game_code: str, since: Optional[int] = None, last_event_id: Optional[str] = Header(None)):
+    """Server-sent events stream of the changes made to a game.
+
+    The first message is either a "snapshot" of the whole game or, when the client
+    passes the last version it saw (since or the Last-Event-ID header sent by
+    EventSource on reconnect), only the events it missed.
+    """
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    version, backlog, queue = bus.subscribe(game_code, since)
+    snapshot = None
+    if backlog is None:
+        snapshot = await load_game_snapshot_async(game_code)
+        if snapshot is None:
+            bus.unsubscribe(game_code, queue)
+            raise HTTPException(status_code=404, detail="Game not found")
+
+    async def stream():
+        try:
+            if snapshot is not None:
+                yield f"id: {version}\nevent: snapshot\ndata: {dumps(snapshot).decode()}\n\n"
+            else:
+                for event in backlog:
+                    yield event.to_sse()
+
+            last_version = version
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENT_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event.version <= last_version:
+                    continue
+                last_version = event.version
+                yield event.to_sse()
+        finally:
+            bus.unsubscribe(game_code, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
     
-@app.post("/games/")
+@router.post("/games/")
 def create_game(game_data: GameCreateRequest, db: Session = Depends(get_db)):
     errors = []
-    game_code = generate_game_code()  # Your function to generate a 6-character game code
-
-    # Ensure unique game_code
-    while db.query(models.Game).filter(models.Game.game_code == game_code).first():
-        game_code = generate_game_code()
-
     try:
-        db_game = models.Game(
-            game_code=game_code,
-            player_count=game_data.player_count,
-            game_version=game_data.game_version,
-            ai_game_master=game_data.ai_game_master,
-            turn=game_data.turn,
-            time_of_day=game_data.time_of_day
-        )
-        db.add(db_game)
-        db.commit()
+        for attempt in range(ALLOCATION_ATTEMPTS):
+            # Allocated codes never repeat, a retry only happens on a code created before the allocator
+            game_code = generate_game_code()
+            db_game = models.Game(
+                game_code=game_code,
+                player_count=game_data.player_count,
+                game_version=game_data.game_version,
+                ai_game_master=game_data.ai_game_master,
+                turn=game_data.turn,
+                time_of_day=game_data.time_of_day
+            )
+            db.add(db_game)
+            try:
+                # A code taken already fails the flush, the log entry goes in the same transaction
+                db.flush()
+                log_changes(db, game_code, "game", [game_to_dict(db_game)])
+                db.commit()
+                break
+            except IntegrityError:
+                db.rollback()
+                if attempt == ALLOCATION_ATTEMPTS - 1:
+                    raise
         db.refresh(db_game)
+        bus.publish(game_code, "game", game_to_dict(db_game))
 
         return {"result": "success", "game_code": game_code, "errors": []}
 
@@ -98,86 +548,206 @@ def create_game(game_data: GameCreateRequest, db: Session = Depends(get_db)):
         errors.append(str(e))
         return {"result": "failure", "game_code": None, "errors": errors}
     
-@app.get("/games/")
-def get_all_games(db: Session = Depends(get_db)):
+@router.get("/games/", response_model=GamesPageResponse, response_model_exclude_unset=True)
+def get_all_games(
+    limit: int = GAMES_PAGE_SIZE,
+    after_id: Optional[int] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    game_version: Optional[str] = None,
+    time_of_day: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """One page of games ordered by id. Pass next_after_id back as after_id for the next page."""
     try:
-        games = db.query(models.Game).all()
-        return {"result": "success", "games": games}
+        flush_game_state(None)
+        query = select(*models.Game.__table__.columns).order_by(models.Game.id)
+        if after_id is not None:
+            query = query.where(models.Game.id > after_id)
+        if created_after is not None:
+            query = query.where(models.Game.created_date >= created_after)
+        if created_before is not None:
+            query = query.where(models.Game.created_date < created_before)
+        if game_version is not None:
+            query = query.where(models.Game.game_version == game_version)
+        if time_of_day is not None:
+            query = query.where(models.Game.time_of_day == time_of_day)
+
+        limit = max(1, min(limit, GAMES_PAGE_SIZE_MAX))
+        games = [dict(row) for row in db.execute(query.limit(limit)).mappings()]
+        next_after_id = games[-1]["id"] if len(games) == limit else None
+        return {"result": "success", "games": games, "next_after_id": next_after_id}
     except Exception as e:
         return {"result": "failure", "error": str(e)}
+
+# Tables available to /export/{table}, with the column they are filtered on by game
+EXPORT_TABLES = {
+    "games": (models.Game, models.Game.game_code),
+    "players": (models.Player, models.Player.game_code),
+    "actions": (models.Actions, models.Actions.game_code),
+    "information": (models.Information, models.Information.game_code),
+}
+
+def export_rows(model, game_column, game_code):
+    # Own session: the response is streamed after the request's dependencies are done
+    db = SessionLocal()
+    try:
+        query = select(*model.__table__.columns)
+        if game_code is not None:
+            query = query.where(game_column == game_code)
+        primary_key = model.__table__.primary_key.columns.values()[0]
+        # Server-side cursor, rows are fetched and written EXPORT_BATCH_SIZE at a time
+        result = db.execute(
+            query.order_by(primary_key).execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+        ).mappings()
+        for rows in result.partitions():
+            yield b"".join(dumps(dict(row)) + b"\n" for row in rows)
+    finally:
+        db.close()
+
+@router.get("/export/{table}")
+def export_table(table: str, game_code: Optional[str] = None):
+    """Streams a whole table (or one game's rows) as newline-delimited JSON."""
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown table {table}")
+    flush_game_state(None)
+    model, game_column = EXPORT_TABLES[table]
+    return StreamingResponse(
+        export_rows(model, game_column, game_code),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{table}.ndjson"'}
+    )
     
-@app.get("/games/{game_code}")
-def get_game_by_code(game_code: str, db: Session = Depends(get_db)):
+@router.get("/games/{game_code}", response_model=GameResponse, response_model_exclude_unset=True)
+def get_game_by_code(game_code: str, response: Response, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
     try:
-        game = db.query(models.Game).filter(models.Game.game_code == game_code).first()
+        etag = game_etag(game_code)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+        if game_store:
+            game = game_store.get(game_code)
+            if game:
+                response.headers.update(etag_headers(etag))
+                return {"result": "success", "game": game_to_dict(game)}
+            return {"result": "failure", "error": "Game not found"}
+
+        game = coalesced_read("game", game_code, lambda: db.execute(
+            select(*GAME_COLUMNS).where(models.Game.game_code == game_code)).mappings().first())
         if game:
+            response.headers.update(etag_headers(etag))
             return {"result": "success", "game": game}
         return {"result": "failure", "error": "Game not found"}
     except Exception as e:
         return {"result": "failure", "error": str(e)}
 
-@app.put("/games/{game_id}")
+@router.put("/games/{game_id}", response_model=GameResponse, response_model_exclude_unset=True)
 def update_game(game_id: str, game_data: GameCreateRequest, db: Session = Depends(get_db)):
     try:
-        print(game_id)
-        game = db.query(models.Game).filter(models.Game.game_code == game_id).first()
+        if game_store:
+            game = game_store.update_game(game_id, game_data.model_dump())
+            if not game:
+                return {"result": "failure", "error": "Game not found"}
+            game_data = game_to_dict(game)
+            bus.publish(game_id, "game", game_data)
+            return {"result": "success", "game": game_data}
+
+        changes = {field: value for field, value in game_data.model_dump().items() if value is not None}
+        # One UPDATE ... RETURNING instead of load, modify, commit and refresh
+        if changes:
+            statement = update(models.Game).where(models.Game.game_code == game_id).values(changes).returning(*GAME_COLUMNS)
+        else:
+            statement = select(*GAME_COLUMNS).where(models.Game.game_code == game_id)
+        game = db.execute(statement).mappings().first()
         if not game:
+            db.rollback()
             return {"result": "failure", "error": "Game not found"}
-
-        if game_data.player_count is not None:
-            game.player_count = game_data.player_count
-        if game_data.game_version is not None:
-            game.game_version = game_data.game_version
-        if game_data.ai_game_master is not None:
-            game.ai_game_master = game_data.ai_game_master
-        if game_data.turn is not None:
-            game.turn = game_data.turn
-        if game_data.time_of_day is not None:
-            game.time_of_day = game_data.time_of_day
-
+        log_changes(db, game_id, "game", [changes] if changes else [])
         db.commit()
-        db.refresh(game)
-        return {"result": "success", "game": game}
+
+        game_data = dict(game)
+        bus.publish(game_id, "game", game_data)
+        return {"result": "success", "game": game_data}
     except Exception as e:
         db.rollback()
         return {"result": "failure", "error": str(e)}
     
 
-@app.post("/players/")
+@router.post("/players/", response_model=PlayerResponse, response_model_exclude_unset=True)
 def create_player(player_data: PlayerCreateRequest, db: Session = Depends(get_db)):
     try:
-        db_player = models.Player(
-            game_code=player_data.game_code,
-            player_name=player_data.player_name,
-            character_id=0,
-            dead=False,
-            vote_token_remaining=True,
-            protected=False
-        )
-        db.add(db_player)
-        db.commit()
-        db.refresh(db_player)
+        for attempt in range(ALLOCATION_ATTEMPTS):
+            # The id is allocated before any write of this session so the allocator never waits on our own lock
+            statement = insert(models.Player).values(
+                player_id=allocator.next_player_id(),
+                game_code=player_data.game_code,
+                player_name=player_data.player_name,
+                character_id=0,
+                dead=False,
+                vote_token_remaining=True,
+                protected=False
+            ).returning(*PLAYER_COLUMNS)
+            try:
+                db_player = db.execute(statement).first()
+                log_changes(db, player_data.game_code, "player", [player_to_dict(db_player)])
+                db.commit()
+                break
+            except IntegrityError:
+                db.rollback()
+                if attempt == ALLOCATION_ATTEMPTS - 1:
+                    raise
+        if game_store:
+            game_store.add_player(db_player)
+        player = player_to_dict(db_player)
+        bus.publish(db_player.game_code, "player", player)
 
-        return {"result": "success", "player": db_player}
+        return {"result": "success", "player": player}
     except Exception as e:
         db.rollback()
         return {"result": "failure", "error": str(e)}
 
-@app.get("/players/game/{game_code}")
-def get_players_by_game(game_code: str, db: Session = Depends(get_db)):
+@router.get("/players/game/{game_code}", response_model=PlayersResponse, response_model_exclude_unset=True)
+def get_players_by_game(game_code: str, response: Response, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
     try:
-        players = db.query(models.Player).filter(models.Player.game_code == game_code).all()
+        etag = game_etag(game_code)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        response.headers.update(etag_headers(etag))
+
+        if game_store:
+            game = game_store.get(game_code)
+            players = [player_to_dict(player) for player in game.players.values()] if game else []
+            return {"result": "success", "players": players}
+
+        players = coalesced_read("players", game_code, lambda: db.execute(
+            select(*PLAYER_COLUMNS).where(models.Player.game_code == game_code)).mappings().all())
         return {"result": "success", "players": players}
     except Exception as e:
         return {"result": "failure", "error": str(e)}
 
-@app.get("/players/{player_id}")
-def get_player_by_id(player_id: str, db: Session = Depends(get_db)):
+@router.get("/players/{player_id}", response_model=PlayerDetailResponse, response_model_exclude_unset=True)
+def get_player_by_id(player_id: str, response: Response, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
     try:
-
-        # Fetch player from database
-        player = db.query(models.Player).filter(models.Player.player_id == player_id).first()
-        game = db.query(models.Game).filter(models.Game.game_code == player.game_code).first()
+        # The player's game comes from the player -> game map, a query only on its first lookup
+        game_code = get_player_game_code(db, player_id)
+        if game_code is None:
+            return {"result": "failure", "error": "Player not found"}
+        etag = game_etag(game_code)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+        if game_store:
+            # Served from memory
+            game, player = game_store.player(player_id)
+            turn, game_version = (game.turn, game.game_version) if game else (None, None)
+        else:
+            # Player columns and the game's turn and version in one query
+            player = db.execute(
+                select(*PLAYER_COLUMNS, models.Game.turn, models.Game.game_version)
+                .join(models.Game, models.Game.game_code == models.Player.game_code)
+                .where(models.Player.player_id == player_id)
+            ).first()
+            turn, game_version = (player.turn, player.game_version) if player else (None, None)
         if not player:
             return {"result": "failure", "error": "Player not found"}
 
@@ -186,7 +756,7 @@ def get_player_by_id(player_id: str, db: Session = Depends(get_db)):
             "player_id": player.player_id,
             "player_name": player.player_name,
             "game_code": player.game_code,
-            "turn": game.turn,
+            "turn": turn,
             "character_id": player.character_id,
             "vote_token_remaining": player.vote_token_remaining,
             "creation_date": player.creation_date,
@@ -194,13 +764,13 @@ def get_player_by_id(player_id: str, db: Session = Depends(get_db)):
             "protected": player.protected
         }
 
-        # Load characters from JSON file
-        with open("game_files/trouble_brewing/characters.json", "r") as file:
-            characters_data = json.load(file)
-
         # Find character details if character_id is not 0
         if player.character_id != 0:
-            character = next((char for char in characters_data if char["character_id"] == player.character_id), None)
+            # Looked up in the script the game is played with
+            try:
+                character = registry.character(game_version, player.character_id)
+            except FileNotFoundError:
+                character = None
             if character:
                 player_data["character"] = {
                     "character_id": character["character_id"],
@@ -209,6 +779,7 @@ def get_player_by_id(player_id: str, db: Session = Depends(get_db)):
                     "character_description": character["character_description"]
                 }
 
+        response.headers.update(etag_headers(etag))
         return {"result": "success", "player": player_data}
 
     except Exception as e:
@@ -225,20 +796,56 @@ class PlayerUpdate(BaseModel):
 class PlayerUpdateRequest(BaseModel):
     players: list[PlayerUpdate]
 
-@app.put("/players/update_multiple")
+def update_multiple_players_in_memory(request):
+    # Group the players by game, nothing is changed if one of them is missing
+    games = {}
+    for player in request.players:
+        game, existing_player = game_store.player(player.player_id)
+        if not existing_player:
+            return {"result": "failure", "error": f"Player {player.player_id} not found"}
+        if player.character_id is not None:
+            games.setdefault(game.game_code, (game, {}))[1][player.player_id] = {"character_id": player.character_id}
+
+    for game, changes in games.values():
+        game_store.update_players(game, changes)
+        for player_id in changes:
+            bus.publish(game.game_code, "player", player_to_dict(game.players[player_id]))
+
+    return {"result": "success", "players": request.players}
+
+@router.put("/players/update_multiple")
 def update_multiple_players(request: PlayerUpdateRequest, db: Session = Depends(get_db)):
     try:
-        # Now we can access players as request.players
+        if game_store:
+            return update_multiple_players_in_memory(request)
+
+        # Fetch every player in one query, nothing is written if one of them is missing
+        existing_players = fetch_by_ids(db, models.Player, models.Player.player_id, [player.player_id for player in request.players])
         for player in request.players:
-            existing_player = db.query(models.Player).filter(models.Player.player_id == player.player_id).first()
-            if not existing_player:
+            if player.player_id not in existing_players:
                 return {"result": "failure", "error": f"Player {player.player_id} not found"}
-            
-            if player.character_id is not None:
-                existing_player.character_id = player.character_id
-            
-            db.commit()
-            db.refresh(existing_player)
+
+        updates = [
+            {"player_id": player.player_id, "character_id": player.character_id}
+            for player in request.players
+            if player.character_id is not None
+        ]
+        updated_players = []
+        for row in updates:
+            player_data = player_to_dict(existing_players[row["player_id"]])
+            player_data["character_id"] = row["character_id"]
+            updated_players.append(player_data)
+
+        # One executemany UPDATE and a single commit for the whole table, with the log entries of every game
+        changes_by_game = {}
+        for row in updates:
+            changes_by_game.setdefault(existing_players[row["player_id"]].game_code, []).append(row)
+        with transaction(db):
+            bulk_update(db, models.Player, updates)
+            log_changes_by_game(db, "player", changes_by_game)
+
+        for player_data in updated_players:
+            bus.publish(player_data["game_code"], "player", player_data)
 
         return {"result": "success", "players": request.players}
     except Exception as e:
@@ -246,32 +853,52 @@ def update_multiple_players(request: PlayerUpdateRequest, db: Session = Depends(
         return {"result": "failure", "error": str(e)}
 
 
-@app.put("/players/{player_id}")
+@router.put("/players/{player_id}", response_model=PlayerResponse, response_model_exclude_unset=True)
 def update_player(player_id: str, player_name: str = None, character_id: int = None, dead: bool = None, vote_token_remaining: bool = None, protected: bool = None, db: Session = Depends(get_db)):
     try:
-        player = db.query(models.Player).filter(models.Player.player_id == player_id).first()
+        if game_store:
+            _, player = game_store.update_player(player_id, {
+                "player_name": player_name,
+                "character_id": character_id,
+                "dead": dead,
+                "vote_token_remaining": vote_token_remaining,
+                "protected": protected
+            })
+            if not player:
+                return {"result": "failure", "error": "Player not found"}
+            player_data = player_to_dict(player)
+            bus.publish(player.game_code, "player", player_data)
+            return {"result": "success", "player": player_data}
+
+        changes = {
+            field: value for field, value in (
+                ("player_name", player_name),
+                ("character_id", character_id),
+                ("dead", dead),
+                ("vote_token_remaining", vote_token_remaining),
+                ("protected", protected),
+            ) if value is not None
+        }
+        # One UPDATE ... RETURNING instead of load, modify, commit and refresh
+        if changes:
+            statement = update(models.Player).where(models.Player.player_id == player_id).values(changes).returning(*PLAYER_COLUMNS)
+        else:
+            statement = select(*PLAYER_COLUMNS).where(models.Player.player_id == player_id)
+        player = db.execute(statement).mappings().first()
         if not player:
+            db.rollback()
             return {"result": "failure", "error": "Player not found"}
-
-        if player_name is not None:
-            player.player_name = player_name
-        if character_id is not None:
-            player.character_id = character_id
-        if dead is not None:
-            player.dead = dead
-        if vote_token_remaining is not None:
-            player.vote_token_remaining = vote_token_remaining
-        if protected is not None:
-            player.protected = protected
-
+        log_changes(db, player["game_code"], "player", [{"player_id": player_id, **changes}] if changes else [])
         db.commit()
-        db.refresh(player)
-        return {"result": "success", "player": player}
+
+        player_data = dict(player)
+        bus.publish(player_data["game_code"], "player", player_data)
+        return {"result": "success", "player": player_data}
     except Exception as e:
         db.rollback()
         return {"result": "failure", "error": str(e)}
     
-@app.post("/characters/")
+@router.post("/characters/")
 def create_character(character_name: str, designation: str, game_version: str, character_description: str, power_usage_count: int, power_usage_count_max: int, first_day_order: int = None, night_order: int = None, db: Session = Depends(get_db)):
     try:
         db_character = models.Characters(
@@ -292,7 +919,7 @@ def create_character(character_name: str, designation: str, game_version: str, c
         db.rollback()
         return {"result": "failure", "error": str(e)}
 
-@app.get("/characters/game_version/{game_version}")
+@router.get("/characters/game_version/{game_version}")
 def get_characters_by_game_version(game_version: str, db: Session = Depends(get_db)):
     # try:
     #     characters = db.query(models.Characters).filter(models.Characters.game_version == game_version).all()
@@ -300,14 +927,8 @@ def get_characters_by_game_version(game_version: str, db: Session = Depends(get_
     # except Exception as e:
     #     return {"result": "failure", "error": str(e)}
     try:
-        # Read the characters from the JSON file
-        with open("game_files/trouble_brewing/characters.json", "r") as file:
-            characters_data = json.load(file)
-        
-        # Filter the characters by the provided game_version
-        filtered_characters = [
-            character for character in characters_data if character["game_version"] == game_version
-        ]
+        # Characters of the provided game_version, from the content registry
+        filtered_characters = registry.characters_for_version(game_version)
 
         if not filtered_characters:
             return {"result": "failure", "error": "No characters found for this game version"}
@@ -316,7 +937,7 @@ def get_characters_by_game_version(game_version: str, db: Session = Depends(get_
     except Exception as e:
         return {"result": "failure", "error": str(e)}
     
-@app.post("/characteractions/")
+@router.post("/characteractions/")
 def create_character_action(character_id: int, time_of_day: str, recieve_information: bool, information_recieved: str, first_day: bool, make_action: bool, action: str, response_required: bool, db: Session = Depends(get_db)):
     try:
         db_action = models.CharacterActions(
@@ -337,20 +958,16 @@ def create_character_action(character_id: int, time_of_day: str, recieve_informa
         db.rollback()
         return {"result": "failure", "error": str(e)}
 
-@app.get("/character_actions/first_night/{game_version}")
+@router.get("/content/packs")
+def get_content_packs():
+    """Scripts available to games, and the folders that failed validation."""
+    return {"result": "success", "packs": registry.packs(), "errors": registry.errors}
+
+@router.get("/character_actions/first_night/{game_version}")
 def get_first_night_actions(game_version: str):
     try:
-        #print('here', game_version)
-        # Load character actions from JSON file
-        with open(f"game_files/{game_version}/characteractions.json", "r") as file:
-            #print('here2')
-            character_actions = json.load(file)
-        #print(character_actions)
-        # Filter actions where first_night is True
-        first_night_actions = [
-            action for action in character_actions 
-            if action.get("first_night")
-        ]
+        # Actions where first_night is True
+        first_night_actions = registry.get(game_version).first_night_action_list
         return {"result": "success", "actions": first_night_actions}
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Character actions file not found")
@@ -361,74 +978,64 @@ class GameRequest(BaseModel):
     game_code: str
     game_version: str
 
-@app.post("/game/first_night_players")
+def load_schedule_game(db, game_code):
+    """(game_version, players) of a game for the schedule engine."""
+    if game_store:
+        game = game_store.get(game_code)
+        if not game:
+            return None, []
+        return game.game_version, [player_to_dict(player) for player in game.players.values()]
+
+    game = db.query(models.Game.game_version).filter(models.Game.game_code == game_code).first()
+    if not game:
+        return None, []
+    players = db.query(models.Player).filter(models.Player.game_code == game_code).all()
+    return game.game_version, [player_to_dict(player) for player in players]
+
+def get_wake_order(db, game_code, turn):
+    def load_game():
+        game_version, players = load_schedule_game(db, game_code)
+        if game_version is None:
+            raise HTTPException(status_code=404, detail="Game not found")
+        return game_version, players
+    return schedules.wake_order(game_code, turn, load_game)
+
+@router.get("/game/{game_code}/wake_order/{turn}")
+def get_game_wake_order(game_code: str, turn: int, db: Session = Depends(get_db)):
+    """Players to wake during the night of turn, in order. Turn 1 is the first night."""
+    try:
+        return {"result": "success", "turn": turn, "players": get_wake_order(db, game_code, turn)}
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Character actions file not found.")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/game/first_night_players")
 def get_first_night_players(request: GameRequest, db: Session = Depends(get_db)):
     try:
-        
         game_code = request.game_code
-        game_version = request.game_version
 
-        game_version_mapping = {
-            "Trouble Brewing": "trouble_brewing",
-            "trouble_brewing": "trouble_brewing"
-        }
-        # 1. Get all players in the game
-        players = db.query(models.Player).filter(models.Player.game_code == game_code).all()
-        if not players:
+        # 1. Make sure the game has players
+        if game_store:
+            game = game_store.get(game_code)
+            has_players = bool(game and game.players)
+        else:
+            has_players = db.query(models.Player.player_id).filter(models.Player.game_code == game_code).first() is not None
+        if not has_players:
             raise HTTPException(status_code=404, detail="No players found for this game.")
 
-        # 2. Load all character actions from JSON
-        with open(f"game_files/{game_version_mapping[game_version]}/characteractions.json", "r") as file:
-            character_actions = json.load(file)
-        with open(f"game_files/{game_version_mapping[game_version]}/characters.json", "r") as file:
-            characters = json.load(file)
-
-        #print('characteractions: ', character_actions)
-        #print('characters: ', characters)
-        # 3. Filter only actions for this game version and first-night characters
-        first_night_actions = {
-            action["character_id"]: action
-            for action in character_actions
-            if action.get("first_night")
-        }
-
-
-        # 3. Filter only actions for this game version and first-night characters
-        first_night_characters = {
-            character["character_id"]: character
-            for character in characters
-            if character.get("first_night_order")
-        }
-
-        #print('players: ', players)
-        #print('first_night_actions: ', first_night_actions)
-
-        # 4. Find players who have first-night active characters
-        first_night_players = []
-        for player in players:
-            if player.character_id in first_night_actions:
-                character_action_info = first_night_actions[player.character_id]
-                character_info = first_night_characters[player.character_id]
-                first_night_players.append({
-                    "player_id": player.player_id,
-                    "player_name": player.player_name,
-                    "character_id": player.character_id,
-                    "dead": player.dead,
-                    "vote_token_remaining": player.vote_token_remaining,
-                    "protected": player.protected,
-                    "character_name": character_info.get("character_name"),
-                    "designation": character_info.get("designation"),
-                    "first_night_order": character_info.get("first_night_order"),               
-                    "character_action_info": character_action_info
-                })
-            #else:
-                
+        # 2. Players with first-night actions, already sorted by first_night_order
+        first_night_players = get_wake_order(db, game_code, 1)
 
         if not first_night_players:
             return {"result": "failure", "message": "No players have first-night actions."}
 
         return {"result": "success", "players": first_night_players}
 
+    except HTTPException:
+        raise
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Character actions file not found.")
     except Exception as e:
@@ -448,24 +1055,31 @@ class GameInfoRequest(BaseModel):
     game_code: str
     players: List[PlayerInfo]
 
-@app.post("/game/update_first_night_info")
-async def update_first_night_info(game_info: GameInfoRequest, db: Session = Depends(get_db)):
-    try:
-        # Loop through each player in the request
-        for player in game_info.players:
-            # Insert a new record into the information table for each player
-            new_action = models.Actions(
-                player_id=player.player_id,
-                action_type="night_info",
-                turn=1,  # Assuming it's the first turn, adjust as necessary
-                action_input=player.information_received,
-                response_required=player.response_required,
-                information_id=0
-            )
-            db.add(new_action)
-        
-        # Commit the transaction to the database
-        db.commit()
+@router.post("/game/update_first_night_info")
+def update_first_night_info(game_info: GameInfoRequest, db: Session = Depends(get_db)):
+    try:
+        # One row per player in the request
+        rows = [
+            {
+                "player_id": player.player_id,
+                "game_code": game_info.game_code,
+                "action_type": "night_info",
+                "turn": 1,  # Assuming it's the first turn, adjust as necessary
+                "action_input": player.information_received,
+                "response_required": player.response_required,
+                "information_id": 0
+            }
+            for player in game_info.players
+        ]
+
+        # Insert them all in one statement and commit once
+        with transaction(db):
+            actions = bulk_insert(db, models.Actions, rows, returning=True)
+            log_inserted(db, models.Actions, actions)
+            new_actions = [action_to_dict(action) for action in actions]
+
+        for new_action in new_actions:
+            bus.publish(game_info.game_code, "action", new_action)
 
         return {"result": "success", "message": "Information saved successfully"}
     
@@ -480,23 +1094,22 @@ class InformationSend(BaseModel):
     response_required: bool
     turn: int
 
-@app.post("/player/add_information")
-async def add_information(info: InformationSend, db: Session = Depends(get_db)):
-    try:
-        # Loop through each player in the request
-        
-        new_info = models.Information(
-            player_id=info.player_id,
-            turn=info.turn,  # Assuming it's the first turn, adjust as necessary
-            information_type=info.information_type,
-            information_input=info.information_input,
-            response_required=info.response_required,
-            action_id = 0
-        )
-        db.add(new_info)
-        
-        # Commit the transaction to the database
-        db.commit()
+@router.post("/player/add_information")
+def add_information(info: InformationSend, db: Session = Depends(get_db)):
+    try:
+        game_code = get_player_game_code(db, info.player_id)
+        # Committed on its own or together with other inserts when group commit is enabled
+        new_info = insert_row(db, models.Information, {
+            "player_id": info.player_id,
+            "game_code": game_code,
+            "turn": info.turn,  # Assuming it's the first turn, adjust as necessary
+            "information_type": info.information_type,
+            "information_input": info.information_input,
+            "response_required": info.response_required,
+            "action_id": 0
+        })
+        if game_code:
+            bus.publish(game_code, "information", information_to_dict(new_info))
 
         return {"result": "success", "message": "Information saved successfully"}
     
@@ -511,23 +1124,22 @@ class ActionSend(BaseModel):
     response_required: bool
     turn: int
 
-@app.post("/player/add_action")
-async def add_action(info: ActionSend, db: Session = Depends(get_db)):
-    try:
-        # Loop through each player in the request
-        
-        new_info = models.Actions(
-            player_id=info.player_id,
-            turn=info.turn,  # Assuming it's the first turn, adjust as necessary
-            action_type=info.action_type,
-            action_input=info.action_input,
-            response_required=info.response_required,
-            information_id = 0
-        )
-        db.add(new_info)
-        
-        # Commit the transaction to the database
-        db.commit()
+@router.post("/player/add_action")
+def add_action(info: ActionSend, db: Session = Depends(get_db)):
+    try:
+        game_code = get_player_game_code(db, info.player_id)
+        # Committed on its own or together with other inserts when group commit is enabled
+        new_info = insert_row(db, models.Actions, {
+            "player_id": info.player_id,
+            "game_code": game_code,
+            "turn": info.turn,  # Assuming it's the first turn, adjust as necessary
+            "action_type": info.action_type,
+            "action_input": info.action_input,
+            "response_required": info.response_required,
+            "information_id": 0
+        })
+        if game_code:
+            bus.publish(game_code, "action", action_to_dict(new_info))
 
         return {"result": "success", "message": "Information saved successfully"}
     
@@ -535,25 +1147,497 @@ async def add_action(info: ActionSend, db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     
-@app.delete("/actions/delete_all")
+@router.delete("/actions/delete_all")
 def delete_all_actions(db: Session = Depends(get_db)):
     try:
         # Delete all actions
         db.query(models.Actions).delete()
         db.commit()
+        bus.bump_epoch()
+        for game_code in bus.game_codes():
+            bus.publish(game_code, "actions_cleared", {})
         return {"result": "success", "message": "All actions deleted successfully"}
     except Exception as e:
         db.rollback()  # Rollback in case of an error
         raise HTTPException(status_code=500, detail=str(e))
     
-@app.get("/player_actions/{game_code}/{player_id}")
-def get_player_actions_and_info(game_code: str, player_id: str, db: Session = Depends(get_db)):
+class NominationRequest(BaseModel):
+    nominator_id: str
+    nominee_id: str
+
+class VoteRequest(BaseModel):
+    player_id: str
+    vote: bool = True  # False lowers a hand raised earlier
+
+def load_vote_game(db, game_code):
+    """(turn, players) of a game for the vote engine."""
+    if game_store:
+        game = game_store.get(game_code)
+        if not game:
+            raise HTTPException(status_code=404, detail="Game not found")
+        return game.turn, [player_to_dict(player) for player in game.players.values()]
+
+    game = db.execute(select(models.Game.turn).where(models.Game.game_code == game_code)).first()
+    if not game:
+        raise HTTPException(status_code=404, detail="Game not found")
+    players = db.execute(select(*PLAYER_COLUMNS).where(models.Player.game_code == game_code)).mappings().all()
+    return game.turn, players
+
+def save_nomination(db, game_code, turn, tally, spent):
+    """Writes a closed nomination (an elect action and one vote action per voter) and the spent vote tokens in one transaction."""
+    rows = [{
+        "player_id": tally["nominator_id"],
+        "game_code": game_code,
+        "action_type": "elect",
+        "action_input": tally["nominee_id"],
+        "turn": turn,
+        "response_required": False,
+        "information_id": 0
+    }] + [{
+        "player_id": voter,
+        "game_code": game_code,
+        "action_type": "vote",
+        "action_input": tally["nominee_id"],
+        "turn": turn,
+        "response_required": False,
+        "information_id": 0
+    } for voter in tally["voters"]]
+
+    with transaction(db):
+        actions = bulk_insert(db, models.Actions, rows, returning=True)
+        log_inserted(db, models.Actions, actions)
+        if spent and not game_store:
+            spent_changes = [{"player_id": player_id, "vote_token_remaining": False} for player_id in spent]
+            bulk_update(db, models.Player, spent_changes)
+            log_changes(db, game_code, "player", spent_changes)
+    for action in actions:
+        bus.publish(game_code, "action", action_to_dict(action))
+
+    if not spent:
+        return
+    if game_store:
+        game = game_store.update_players(game_store.get(game_code), {
+            player_id: {"vote_token_remaining": False} for player_id in spent
+        })
+        players = [player_to_dict(game.players[player_id]) for player_id in spent]
+    else:
+        players = db.execute(select(*PLAYER_COLUMNS).where(models.Player.player_id.in_(spent))).mappings().all()
+    for player in players:
+        bus.publish(game_code, "player", dict(player))
+
+@router.get("/games/{game_code}/votes")
+def get_votes(game_code: str, db: Session = Depends(get_db)):
+    """Nominations of the current day with their live counts, the threshold and who is on the block."""
+    # Nominations and votes taken by other workers first
+    bus.catch_up(game_code)
+    return {"result": "success", **votes.summary(game_code, lambda: load_vote_game(db, game_code))}
+
+@router.post("/games/{game_code}/nominations")
+def nominate(game_code: str, request: NominationRequest, db: Session = Depends(get_db)):
+    bus.catch_up(game_code)
+    try:
+        tally = votes.nominate(game_code, lambda: load_vote_game(db, game_code), request.nominator_id, request.nominee_id)
+    except VotingError as e:
+        return {"result": "failure", "error": str(e)}
+    bus.publish(game_code, "nomination", tally)
+    return {"result": "success", "nomination": tally}
+
+@router.post("/games/{game_code}/nominations/{nomination_id}/votes")
+def vote(game_code: str, nomination_id: int, request: VoteRequest, db: Session = Depends(get_db)):
+    bus.catch_up(game_code)
+    try:
+        tally = votes.vote(game_code, lambda: load_vote_game(db, game_code), nomination_id, request.player_id, request.vote)
+    except VotingError as e:
+        return {"result": "failure", "error": str(e)}
+    # Every change of the count is pushed to the game's event stream
+    bus.publish(game_code, "nomination", tally)
+    return {"result": "success", "nomination": tally}
+
+@router.post("/games/{game_code}/nominations/{nomination_id}/close")
+def close_nomination(game_code: str, nomination_id: int, db: Session = Depends(get_db)):
+    load_game = lambda: load_vote_game(db, game_code)
+    bus.catch_up(game_code)
+    try:
+        tally, spent = votes.close(game_code, load_game, nomination_id)
+    except VotingError as e:
+        return {"result": "failure", "error": str(e)}
+    bus.publish(game_code, "nomination", tally)
+    try:
+        save_nomination(db, game_code, votes.day(game_code, load_game).turn, tally, spent)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"result": "success", "nomination": tally}
+
+class NightRequest(BaseModel):
+    choices: Optional[dict[str, list[str]]] = None  # player_id -> player_ids they pointed at
+    seed: Optional[int] = None
+
+def night_choices(db, game_code, turn, player_ids):
+    """Targets players sent this turn as night_response actions, as player ids separated by commas or spaces."""
+    rows = db.execute(
+        select(models.Actions.player_id, models.Actions.action_input)
+        .where(models.Actions.game_code == game_code, models.Actions.turn == turn, models.Actions.action_type == "night_response")
+        .order_by(models.Actions.action_id)
+    ).all()
+    choices = {}
+    for player_id, action_input in rows:
+        targets = [target for target in action_input.replace(",", " ").split() if target in player_ids]
+        if targets:
+            choices[player_id] = targets
+    return choices
+
+def night_resolved(db, game_code, turn):
+    return db.execute(
+        select(models.Information.information_id)
+        .where(models.Information.game_code == game_code, models.Information.turn == turn,
+               models.Information.information_type == NIGHT_INFO_TYPE)
+        .limit(1)
+    ).first() is not None
+
+@router.post("/game/{game_code}/resolve_night")
+def resolve_game_night(game_code: str, request: NightRequest = None, db: Session = Depends(get_db)):
+    """Resolves the current night of an ai_game_master game and writes its outcome in one transaction."""
+    try:
+        request = request or NightRequest()
+        # The game's row is claimed below by its turn, a turn change held in memory has to be in it
+        flush_game_state(game_code)
+        if game_store:
+            game = game_store.get(game_code)
+            players = [player_to_dict(player) for player in game.players.values()] if game else []
+        else:
+            game = db.execute(select(*GAME_COLUMNS).where(models.Game.game_code == game_code)).first()
+            players = db.execute(select(*PLAYER_COLUMNS).where(models.Player.game_code == game_code)).mappings().all()
+        if not game:
+            raise HTTPException(status_code=404, detail="Game not found")
+        if not game.ai_game_master:
+            return {"result": "failure", "error": "Game is not run by the AI game master"}
+
+        if night_resolved(db, game_code, game.turn):
+            return {"result": "failure", "error": f"Night {game.turn} was already resolved"}
+
+        # Seating order is the order players joined in
+        players = sorted((dict(player) for player in players), key=lambda player: (player["creation_date"], player["player_id"]))
+        choices = night_choices(db, game_code, game.turn, {player["player_id"] for player in players})
+        choices.update(request.choices or {})
+        night = resolve_night(registry.get(game.game_version), game_code, players, game.turn, choices, request.seed)
+
+        changes = {}
+        for player_id in night.deaths:
+            changes.setdefault(player_id, {})["dead"] = True
+        for player_id, character_id in night.character_changes.items():
+            changes.setdefault(player_id, {})["character_id"] = character_id
+        if game.turn > 1:
+            # Monk protection only lasts the night it was given
+            for player in players:
+                protected = player["player_id"] == night.protected
+                if bool(player["protected"]) != protected:
+                    changes.setdefault(player["player_id"], {})["protected"] = protected
+
+        information_rows = [{
+            "player_id": player_id,
+            "game_code": game_code,
+            "turn": game.turn,
+            "information_type": NIGHT_INFO_TYPE,
+            "information_input": text[:255],
+            "response_required": False,
+            "action_id": 0
+        } for player_id, text in night.information]
+
+        # Every Information row and player change of the night in one transaction
+        with transaction(db):
+            # Claims the night: a conditional UPDATE of the game's row makes concurrent resolutions of the
+            # game wait for this transaction, and the check below then sees the night they resolved
+            claimed = db.execute(
+                update(models.Game)
+                .where(models.Game.game_code == game_code, models.Game.turn == game.turn)
+                .values(turn=models.Game.turn)
+            ).rowcount
+            if not claimed:
+                return {"result": "failure", "error": f"Turn {game.turn} is over"}
+            if night_resolved(db, game_code, game.turn):
+                return {"result": "failure", "error": f"Night {game.turn} was already resolved"}
+            information = bulk_insert(db, models.Information, information_rows, returning=True)
+            log_inserted(db, models.Information, information)
+            if changes and not game_store:
+                player_changes = [{"player_id": player_id, **values} for player_id, values in changes.items()]
+                bulk_update(db, models.Player, player_changes)
+                log_changes(db, game_code, "player", player_changes)
+        if changes and game_store:
+            game = game_store.update_players(game, changes)
+
+        for info in information:
+            bus.publish(game_code, "information", information_to_dict(info))
+        if changes:
+            if game_store:
+                updated = [player_to_dict(game.players[player_id]) for player_id in changes]
+            else:
+                updated = db.execute(select(*PLAYER_COLUMNS).where(models.Player.player_id.in_(changes))).mappings().all()
+            for player in updated:
+                bus.publish(game_code, "player", dict(player))
+
+        return {
+            "result": "success",
+            "turn": game.turn,
+            "deaths": night.deaths,
+            "protected": night.protected,
+            "poisoned": night.poisoned,
+            "character_changes": night.character_changes,
+            "information": [information_to_dict(info) for info in information]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/games/{game_code}/log")
+def get_game_log(game_code: str, after_id: int = 0, limit: int = GAMES_PAGE_SIZE, db: Session = Depends(get_db)):
+    """One page of a game's log entries in the order they were written. Pass next_after_id back as after_id for the next page."""
+    if not game_log:
+        return {"result": "failure", "error": "The game log is disabled"}
     try:
+        # Entries held by the write-behind store first
+        flush_game_state(game_code)
+        limit = max(1, min(limit, GAMES_PAGE_SIZE_MAX))
+        entries = game_log.entries(db, game_code, after_id, limit)
+        next_after_id = entries[-1]["entry_id"] if len(entries) == limit else None
+        return {"result": "success", "entries": entries, "next_after_id": next_after_id}
+    except Exception as e:
+        return {"result": "failure", "error": str(e)}
+
+@router.get("/games/{game_code}/replay")
+def replay_game(game_code: str, turn: Optional[int] = None, time_of_day: Optional[str] = None, entry_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """A game as it was at the end of a turn (or of one time of day of it) or right after a log entry: the game,
+    its players and the actions and information of its turn. Rebuilt from the last snapshot before that point."""
+    if not game_log:
+        return {"result": "failure", "error": "The game log is disabled"}
+    try:
+        flush_game_state(game_code)
+        state = game_log.state_at(db, game_code, turn, time_of_day, entry_id)
+        if state is None:
+            return {"result": "failure", "error": "No logged state of the game at that point"}
+        return {"result": "success", **state}
+    except Exception as e:
+        return {"result": "failure", "error": str(e)}
+
+# Games set up per POST /games/setup/bulk call by default, and game codes per IN (...) query
+BULK_SETUP_LIMIT = 1000
+BULK_SETUP_LIMIT_MAX = 20000
+BULK_SETUP_CHUNK = 500
+
+# game_version -> (its characters, SetupGenerator), rebuilt when the script's content is reloaded
+setup_generators = {}
+
+class ScriptUnavailableError(SetupError):
+    """The game's script does not exist or does not validate."""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+def setup_generator(game_version):
+    # registry.get resolves aliases such as "trouble_brewing", like the other game routes
+    try:
+        content = registry.get(game_version)
+    except FileNotFoundError:
+        raise ScriptUnavailableError(f"No script for game version {game_version!r}", 404)
+    except ContentPackError as e:
+        raise ScriptUnavailableError(f"Script of game version {game_version!r} is invalid: {e}", 422)
+    cached = setup_generators.get(game_version)
+    if cached is None or cached[0] is not content:
+        cached = setup_generators[game_version] = (content, SetupGenerator(content.characters))
+    return cached[1]
+
+def load_setup_games(db, game_codes):
+    """{game_code: (game_version, players in seating order)} of the games that exist, read in chunks of game codes."""
+    games = {}
+    if game_store:
+        for game_code, game in game_store.get_many(game_codes).items():
+            games[game_code] = (game.game_version, [player_to_dict(player) for player in game.players.values()])
+    else:
+        for start in range(0, len(game_codes), BULK_SETUP_CHUNK):
+            chunk = game_codes[start:start + BULK_SETUP_CHUNK]
+            for game_code, game_version in db.execute(
+                    select(models.Game.game_code, models.Game.game_version).where(models.Game.game_code.in_(chunk))):
+                games[game_code] = (game_version, [])
+            for player in db.execute(select(*PLAYER_COLUMNS).where(models.Player.game_code.in_(chunk))).mappings():
+                games[player["game_code"]][1].append(dict(player))
+    # Seating order is the order players joined in, games in the order asked for so a seed deals the same setups
+    for _, players in games.values():
+        players.sort(key=lambda player: (player["creation_date"], player["player_id"]))
+    return {game_code: games[game_code] for game_code in game_codes if game_code in games}
+
+def assign_setups(db, games, rng):
+    """Draws a setup for every game and writes all of their characters at once.
+
+    Returns ({game_code: [players with their character]}, {game_code: SetupError}) so one
+    game that cannot be set up does not hold back the others.
+    """
+    setups, errors = {}, {}
+    for game_code, (game_version, players) in games.items():
+        try:
+            setups[game_code] = setup_generator(game_version).assign([player["player_id"] for player in players], rng)
+        except SetupError as e:
+            errors[game_code] = e
+
+    changes = {
+        game_code: {player_id: {"character_id": character["character_id"]} for player_id, character in setup.items()}
+        for game_code, setup in setups.items()
+    }
+    if game_store:
+        for game_code, game_changes in changes.items():
+            game_store.update_players(game_store.get(game_code), game_changes)
+    elif changes:
+        # One executemany UPDATE and a single commit for every game, with their log entries
+        with transaction(db):
+            bulk_update(db, models.Player, [
+                {"player_id": player_id, **change}
+                for game_changes in changes.values() for player_id, change in game_changes.items()
+            ])
+            log_changes_by_game(db, "player", {
+                game_code: [{"player_id": player_id, **change} for player_id, change in game_changes.items()]
+                for game_code, game_changes in changes.items()
+            })
+
+    assigned = {}
+    for game_code, setup in setups.items():
+        assigned[game_code] = []
+        for player in games[game_code][1]:
+            character = setup[player["player_id"]]
+            player["character_id"] = character["character_id"]
+            bus.publish(game_code, "player", player)
+            assigned[game_code].append({
+                "player_id": player["player_id"],
+                "player_name": player["player_name"],
+                "character_id": character["character_id"],
+                "character_name": character["character_name"],
+                "designation": character["designation"],
+            })
+    return assigned, errors
+
+class SetupRequest(BaseModel):
+    seed: Optional[int] = None
+
+@router.post("/games/{game_code}/setup")
+def setup_game(game_code: str, request: SetupRequest = None, db: Session = Depends(get_db)):
+    """Deals a random valid setup for the game's player count to all of its players, in one write.
+    Dealing again replaces the characters dealt before."""
+    try:
+        request = request or SetupRequest()
+        games = load_setup_games(db, [game_code])
+        if game_code not in games:
+            raise HTTPException(status_code=404, detail="Game not found")
+        assigned, errors = assign_setups(db, games, random.Random(request.seed))
+        error = errors.get(game_code)
+        if isinstance(error, ScriptUnavailableError):
+            raise HTTPException(status_code=error.status_code, detail=str(error))
+        if error:
+            return {"result": "failure", "error": str(error)}
+        players = assigned[game_code]
+        # Characters dealt per designation, after modifiers such as the Baron's extra outsiders
+        dealt = {designation: sum(player["designation"] == designation for player in players) for designation in DESIGNATIONS}
+        return {"result": "success", "distribution": dealt, "players": players}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        return {"result": "failure", "error": str(e)}
+
+class BulkSetupRequest(BaseModel):
+    game_codes: Optional[List[str]] = None  # Without them, AI game master games none of whose players has a character yet
+    limit: int = BULK_SETUP_LIMIT
+    seed: Optional[int] = None
+
+def games_waiting_for_setup(db, limit):
+    dealt = select(models.Player.game_code).where(models.Player.character_id != 0)
+    return db.execute(
+        select(models.Game.game_code)
+        .where(models.Game.ai_game_master.is_(True), models.Game.game_code.not_in(dealt),
+               models.Game.game_code.in_(select(models.Player.game_code)))
+        .order_by(models.Game.id).limit(limit)
+    ).scalars().all()
+
+@router.post("/games/setup/bulk")
+def setup_games_bulk(request: BulkSetupRequest, db: Session = Depends(get_db)):
+    """Deals setups to many games with one read per chunk of games and a single write for all of them."""
+    try:
+        limit = max(1, min(request.limit, BULK_SETUP_LIMIT_MAX))
+        if request.game_codes is None:
+            # Games and players still held by the write-behind store are picked too
+            flush_game_state(None)
+            game_codes = games_waiting_for_setup(db, limit)
+        else:
+            game_codes = list(dict.fromkeys(request.game_codes))[:limit]
+        games = load_setup_games(db, game_codes)
+        assigned, errors = assign_setups(db, games, random.Random(request.seed))
+        errors = {game_code: str(error) for game_code, error in errors.items()}
+        for game_code in game_codes:
+            if game_code not in games:
+                errors[game_code] = "Game not found"
+        return {"result": "success", "games_set_up": len(assigned), "setups": assigned, "errors": errors}
+    except Exception as e:
+        db.rollback()
+        return {"result": "failure", "error": str(e)}
+
+@router.post("/archive/run")
+def run_archive(background_tasks: BackgroundTasks):
+    """Starts an archival run after the response is sent. Runs already in progress are not doubled."""
+    # Pending in-memory writes count as activity, get them into the tables first
+    flush_game_state(None)
+    background_tasks.add_task(archiver.run)
+    return {"result": "success", "message": "Archive run started"}
+
+@router.get("/archive/status")
+def get_archive_status():
+    return {"result": "success", "games_archived": archiver.games_archived, "last_run": archiver.last_run}
+
+@router.get("/coordination")
+def get_coordination():
+    return {
+        "result": "success",
+        "backend": config.COORDINATION_BACKEND,
+        "worker_id": coordinator.worker_id,
+        "workers": coordinator.workers
+    }
+
+@router.get("/coordination/games/{game_code}")
+def get_game_owner(game_code: str):
+    """Worker holding a game's hot state, for a proxy routing each game to one worker."""
+    return {
+        "result": "success",
+        "game_code": game_code,
+        "owner": coordinator.owner(game_code),
+        "owned_here": coordinator.owns(game_code)
+    }
+
+@router.get("/player_actions/{game_code}/{player_id}")
+def get_player_actions_and_info(game_code: str, player_id: str, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    try:
+        # The ETag is the game's, it only covers players of that game
+        if get_player_game_code(db, player_id) != game_code:
+            raise HTTPException(status_code=404, detail="Player not found in this game")
+        etag = game_etag(game_code)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
         # Get actions for the player and turn
-        game = db.query(models.Game).filter(models.Game.game_code == game_code).all()
-        turn = game[0].turn
-        actions = db.query(models.Actions).filter(models.Actions.player_id == player_id, models.Actions.turn == turn).all()
-        information = db.query(models.Information).filter(models.Information.player_id == player_id, models.Information.turn == turn).all()
+        if game_store:
+            game = game_store.get(game_code)
+            turn = game.turn if game else None
+        else:
+            turn = db.execute(select(models.Game.turn).where(models.Game.game_code == game_code)).scalar()
+        if turn is None:
+            raise HTTPException(status_code=404, detail="Game not found")
+        actions = db.execute(
+            select(models.Actions.action_id, models.Actions.action_type, models.Actions.action_input,
+                   models.Actions.turn, models.Actions.response_required)
+            .where(models.Actions.player_id == player_id, models.Actions.turn == turn)
+        ).all()
+        information = db.execute(
+            select(models.Information.information_id, models.Information.information_type, models.Information.information_input,
+                   models.Information.turn, models.Information.response_required)
+            .where(models.Information.player_id == player_id, models.Information.turn == turn)
+        ).all()
 
         result = []
 
@@ -581,62 +1665,148 @@ def get_player_actions_and_info(game_code: str, player_id: str, db: Session = De
             }
             information_result.append(information_info)
 
-        return {
+        return FastJSONResponse({
             "result": "success",
             "actions": result,
             "information": information_result
-        }
+        }, headers=etag_headers(etag))
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
-@app.get("/all_players_info/{game_code}")
-def get_player_actions_and_info(game_code: str, db: Session = Depends(get_db)):
+def parse_since_id(since_id):
+    """since_id cursor is "<action_id>:<information_id>", a single number applies to both."""
+    if not since_id:
+        return 0, 0
+    action_id, _, information_id = since_id.partition(":")
+    return int(action_id), int(information_id or action_id)
+
+@router.get("/all_players_info/{game_code}")
+def get_all_players_actions_and_info(game_code: str, limit: Optional[int] = None, since_id: Optional[str] = None, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
     try:
-        # Get actions for the player and turn
-        game = db.query(models.Game).filter(models.Game.game_code == game_code).all()
-        turn = game[0].turn
-        actions = db.query(models.Actions).filter(models.Actions.turn == turn).all()
-        information = db.query(models.Information).filter(models.Information.turn == turn).all()
+        etag = game_etag(game_code)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
 
+        game = game_store.get(game_code) if game_store else db.query(models.Game.turn).filter(models.Game.game_code == game_code).first()
+        if not game:
+            raise HTTPException(status_code=404, detail="Game not found")
+        try:
+            since_action_id, since_information_id = parse_since_id(since_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid since_id")
+
+        # Only this game's rows for its current turn, served by the (game_code, turn) indexes
+        actions_query = (
+            db.query(
+                models.Actions.action_id,
+                models.Actions.player_id,
+                models.Actions.action_type,
+                models.Actions.action_input,
+                models.Actions.turn,
+                models.Actions.response_required
+            )
+            .filter(models.Actions.game_code == game_code, models.Actions.turn == game.turn, models.Actions.action_id > since_action_id)
+            .order_by(models.Actions.action_id)
+        )
+        information_query = (
+            db.query(
+                models.Information.information_id,
+                models.Information.player_id,
+                models.Information.information_type,
+                models.Information.information_input,
+                models.Information.turn,
+                models.Information.response_required
+            )
+            .filter(models.Information.game_code == game_code, models.Information.turn == game.turn, models.Information.information_id > since_information_id)
+            .order_by(models.Information.information_id)
+        )
+        if limit:
+            # Fetch one extra row to know whether there is another page
+            actions_query = actions_query.limit(limit + 1)
+            information_query = information_query.limit(limit + 1)
+        actions = actions_query.all()
+        information = information_query.all()
+
+        has_more = False
+        if limit and (len(actions) > limit or len(information) > limit):
+            has_more = True
+            actions = actions[:limit]
+            information = information[:limit]
+
+        # Group by player in a single pass over each result
         result = {}
-
         for action in actions:
-
-            # Add the action along with its corresponding information if available
-            action_info = {
+            result.setdefault(action.player_id, []).append({
                 "action_id": action.action_id,
                 "action_type": action.action_type,
                 "action_input": action.action_input,
                 "turn": action.turn,
                 "response_required": action.response_required,
-            }
-
-            if action.player_id not in result:
-                result[action.player_id] = [action_info]
-            else:
-                result[action.player_id].append(action_info)
+            })
 
         information_result = {}
         for info in information:
-            information_info = {
+            information_result.setdefault(info.player_id, []).append({
                 "player_id": info.player_id,
                 "information_id": info.information_id,
                 "information_type": info.information_type,
                 "information_input": info.information_input,
                 "turn": info.turn,
                 "response_required": info.response_required,
-            }
-            if action.player_id not in information_result:
-                information_result[action.player_id] = [information_info]
-            else:
-                information_result[action.player_id].append(information_info)
+            })
 
-        return {
+        last_action_id = actions[-1].action_id if actions else since_action_id
+        last_information_id = information[-1].information_id if information else since_information_id
+        return FastJSONResponse({
             "result": "success",
             "actions": result,
-            "information": information_result
-        }
+            "information": information_result,
+            "has_more": has_more,
+            "next_since_id": f"{last_action_id}:{last_information_id}"
+        }, headers=etag_headers(etag))
 
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@asynccontextmanager
+async def lifespan(app):
+    size_threadpool()
+    # Schema upgrade and content packs do not depend on each other, prepare both at once
+    await asyncio.gather(to_thread.run_sync(migrate_database), to_thread.run_sync(load_game_content))
+    start_group_commit_writer()
+    start_coordinator()
+    start_game_store()
+    start_archiver()
+    try:
+        yield
+    finally:
+        stop_archiver()
+        stop_group_commit_writer()
+        stop_game_store()
+        stop_coordinator()
+
+def create_app():
+    """Builds the API application. Startup work runs in the lifespan, so importing this module stays cheap.
+
+    uvicorn main:app uses the instance below, uvicorn --factory main:create_app builds a new one.
+    """
+    app = FastAPI(lifespan=lifespan)
+
+    # Add CORS middleware to allow frontend requests from different origins
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # or you can specify the exact frontend origin URL
+        allow_credentials=True,
+        allow_methods=["*"],  # allows all methods (GET, POST, etc.)
+        allow_headers=["*"],  # allows all headers
+    )
+    app.add_middleware(MetricsMiddleware, profiler=profiler)
+    app.include_router(router)
+    return app
+
+app = create_app()
@@ -0,0 +1,254 @@
+import contextvars
+import random
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from sqlalchemy import event
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Same statement run this many times in one request is reported as an N+1 pattern
+N_PLUS_ONE_THRESHOLD = 5
+
+# Literal values stripped from statements before grouping them
+_LITERALS = re.compile(r"'[^']*'|\b\d+\b")
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+
+class RequestStats:
+    """Database work of the request being handled, shared with the threadpool through a contextvar."""
+
+    __slots__ = ("queries", "query_time", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements = Counter()
+
+
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.route_latency = {}  # (method, route, status) -> Histogram
+        self.route_queries = {}  # (method, route) -> Histogram of queries per request
+        self.route_query_time = {}  # (method, route) -> Histogram of database time per request
+        self.n_plus_one = Counter()  # (method, route, statement) -> requests showing the pattern
+        self.queries_outside_requests = 0
+        self.gauges = {}  # name -> (help, callable), read at scrape time
+        self.counters = {}  # name -> (help, callable returning {labels tuple: value})
+
+    def add_gauge(self, name, help_text, read):
+        self.gauges[name] = (help_text, read)
+
+    def add_counter(self, name, help_text, read):
+        """Registers a counter read at scrape time. read() returns {((label, value), ...): count}."""
+        self.counters[name] = (help_text, read)
+
+    def record_request(self, method, route, status, duration, stats):
+        with self._lock:
+            self.route_latency.setdefault((method, route, status), Histogram()).observe(duration)
+            self.route_queries.setdefault((method, route), Histogram((0, 1, 2, 5, 10, 20, 50, 100))).observe(stats.queries)
+            self.route_query_time.setdefault((method, route), Histogram()).observe(stats.query_time)
+            for statement, count in stats.statements.items():
+                if count >= N_PLUS_ONE_THRESHOLD:
+                    self.n_plus_one[(method, route, statement)] += 1
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            self._render_histograms(lines, "http_request_duration_seconds", "Request latency by route.",
+                                    self.route_latency, ("method", "route", "status"))
+            self._render_histograms(lines, "db_queries_per_request", "Database queries run by one request.",
+                                    self.route_queries, ("method", "route"))
+            self._render_histograms(lines, "db_query_seconds_per_request", "Time spent in the database by one request.",
+                                    self.route_query_time, ("method", "route"))
+            lines.append("# HELP db_n_plus_one_total Requests that ran the same statement at least "
+                         f"{N_PLUS_ONE_THRESHOLD} times.")
+            lines.append("# TYPE db_n_plus_one_total counter")
+            for (method, route, statement), count in self.n_plus_one.items():
+                lines.append(f"db_n_plus_one_total{format_labels((('method', method), ('route', route), ('statement', statement)))} {count}")
+            lines.append("# HELP db_queries_outside_requests_total Queries run by background work.")
+            lines.append("# TYPE db_queries_outside_requests_total counter")
+            lines.append(f"db_queries_outside_requests_total {self.queries_outside_requests}")
+
+        for name, (help_text, read) in self.counters.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in read().items():
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        for name, (help_text, read) in self.gauges.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {read()}")
+        return "\n".join(lines) + "\n"
+
+    def _render_histograms(self, lines, name, help_text, histograms, label_names):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, histogram in histograms.items():
+            labels = tuple(zip(label_names, (str(value) for value in key)))
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.total}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for name, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def normalize_statement(statement):
+    return " ".join(_LITERALS.sub("?", statement).split())[:200]
+
+
+metrics = Metrics()
+
+
+def instrument_engine(sync_engine):
+    """Counts and times every statement run on the engine, attributed to the current request."""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - connection.info["query_start"].pop()
+        stats = current_request.get()
+        if stats is None:
+            metrics.queries_outside_requests += 1
+            return
+        stats.queries += 1
+        stats.query_time += elapsed
+        stats.statements[normalize_statement(statement)] += 1
+
+
+class SlowRequestProfiler:
+    """Opt-in sampling profiler keeping the stacks seen while slow requests ran.
+
+    A background thread samples the stacks of every thread while a sampled request
+    is in flight. When a request ends slower than threshold_ms, the samples taken
+    during it are kept, aggregated by stack, for /metrics/slow_requests.
+    """
+
+    def __init__(self, threshold_ms=500, sample_rate=1.0, interval=0.005, keep=20):
+        self.threshold = threshold_ms / 1000
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.enabled = False
+        self.slow_requests = deque(maxlen=keep)
+        self._samples = deque(maxlen=20000)  # (time, collapsed stack)
+        self._active = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+            self._thread.start()
+
+    def begin(self):
+        """Returns a token for end(), or None if this request is not sampled."""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        with self._lock:
+            self._active += 1
+        self._wake.set()
+        return time.perf_counter()
+
+    def end(self, token, method, route, duration):
+        with self._lock:
+            self._active -= 1
+            if self._active == 0:
+                self._wake.clear()
+        if duration < self.threshold:
+            return
+        stacks = Counter(stack for at, stack in list(self._samples) if at >= token)
+        self.slow_requests.append({
+            "method": method,
+            "route": route,
+            "duration_ms": round(duration * 1000, 1),
+            "samples": sum(stacks.values()),
+            "top_stacks": [{"stack": stack, "samples": count} for stack, count in stacks.most_common(10)],
+        })
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            self._wake.wait()
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = ";".join(f"{entry.name} ({entry.filename.rsplit('/', 1)[-1]}:{entry.lineno})"
+                                 for entry in traceback.extract_stack(frame, limit=30))
+                self._samples.append((now, stack))
+            time.sleep(self.interval)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request and collecting its database statistics."""
+
+    def __init__(self, app, profiler=None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = {"code": 500}
+        profile_token = self.profiler.begin() if self.profiler else None
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            current_request.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            metrics.record_request(scope["method"], route_path, status["code"], duration, stats)
+            if profile_token is not None:
+                self.profiler.end(profile_token, scope["method"], route_path, duration)
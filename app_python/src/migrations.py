@@ -0,0 +1,58 @@
+from sqlalchemy import inspect, text
+from database import Base
+import models
+
+# Columns added to existing tables after they were first created.
+# create_all() only creates missing tables, so older database.db files need these added by hand.
+ADDED_COLUMNS = [
+    ("actions", "game_code", "VARCHAR(6)"),
+    ("information", "game_code", "VARCHAR(6)"),
+]
+
+# Fills the denormalized game_code of rows written before the column existed
+BACKFILLS = [
+    ("actions", "UPDATE actions SET game_code = (SELECT players.game_code FROM players WHERE players.player_id = actions.player_id) WHERE game_code IS NULL"),
+    ("information", "UPDATE information SET game_code = (SELECT players.game_code FROM players WHERE players.player_id = information.player_id) WHERE game_code IS NULL"),
+]
+
+
+def upgrade(engine):
+    """Creates missing tables and brings existing ones up to the current models. Safe to run on every start."""
+    if engine.dialect.name == "sqlite" and not inspect(engine).get_table_names():
+        # New files get incremental vacuum, so archival can hand freed pages back without a full VACUUM.
+        # The mode can only be chosen before the first table is created.
+        with engine.connect() as connection:
+            connection.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+    Base.metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    changed = False
+
+    with engine.begin() as connection:
+        for table, column, column_type in ADDED_COLUMNS:
+            if table not in existing_tables:
+                continue
+            columns = {c["name"] for c in inspector.get_columns(table)}
+            if column not in columns:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+                changed = True
+
+        for table, statement in BACKFILLS:
+            # The EXISTS check uses the game_code indexes, so an up to date file is not scanned on every start
+            if table in existing_tables and connection.execute(text(f"SELECT 1 FROM {table} WHERE game_code IS NULL LIMIT 1")).first():
+                connection.execute(text(statement))
+
+        # Create the indexes declared on the models that an older file does not have yet
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=connection)
+                    changed = True
+
+        if changed and engine.dialect.name == "sqlite":
+            # Refresh the planner statistics so the new indexes get picked
+            connection.execute(text("ANALYZE"))
@@ -1,9 +1,9 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base  # Update the import to use database_src
 from datetime import datetime
-from random import randint
+from allocator import allocator
 
 class Game(Base):
     __tablename__ = "games"  # Table name in the database
@@ -21,8 +21,8 @@ class Game(Base):
 class Player(Base):
     __tablename__ = "players"
 
-    player_id = Column(String(10), primary_key=True, default=lambda: str(randint(10**9, 10**10 - 1)))
-    game_code = Column(String(6), ForeignKey("games.game_code"), nullable=False)
+    player_id = Column(String(10), primary_key=True, default=allocator.next_player_id)
+    game_code = Column(String(6), ForeignKey("games.game_code"), nullable=False, index=True)
     player_name = Column(String(50), nullable=False)
     creation_date = Column(DateTime, default=func.now(), nullable=False)
     character_id = Column(Integer, nullable=False)
@@ -30,11 +30,22 @@ class Player(Base):
     vote_token_remaining = Column(Boolean, nullable=False)
     protected = Column(Boolean, nullable=True)
 
+class IdSequence(Base):
+    __tablename__ = "id_sequences"
+
+    name = Column(String(50), primary_key=True) # game_code or player_id
+    next_value = Column(Integer, nullable=False) # first number not reserved by any process yet
+
 class Actions(Base):
     __tablename__ = "actions"
+    __table_args__ = (
+        Index("ix_actions_player_id_turn", "player_id", "turn"),
+        Index("ix_actions_game_code_turn", "game_code", "turn"),
+    )
 
     action_id = Column(Integer, primary_key=True, index=True)
     player_id = Column(String(10), nullable=False)
+    game_code = Column(String(6), nullable=True) # Denormalized from players, null only on rows older than the column
     action_type = Column(String(50), nullable=False) # Either elect, vote or night_response,
     action_input = Column(String(255), nullable=False)
     turn = Column(Integer, nullable=False)
@@ -43,15 +54,50 @@ class Actions(Base):
 
 class Information(Base):
     __tablename__ = "information"
+    __table_args__ = (
+        Index("ix_information_player_id_turn", "player_id", "turn"),
+        Index("ix_information_game_code_turn", "game_code", "turn"),
+    )
 
     information_id = Column(Integer, primary_key=True, index=True)
     player_id = Column(String(10), nullable=False)
+    game_code = Column(String(6), nullable=True) # Denormalized from players, null only on rows older than the column
     turn = Column(Integer, nullable=False)
     information_type = Column(String(10), nullable=False) 
     information_input = Column(String(255), nullable=False)
     response_required = Column(Boolean, nullable=False)
     action_id = Column(Integer, nullable=False) #action_id that the information is responding_to
 
+class GameLogEntry(Base):
+    __tablename__ = "game_log"
+    __table_args__ = (
+        Index("ix_game_log_game_code_entry_id", "game_code", "entry_id"),
+        Index("ix_game_log_game_code_turn", "game_code", "turn"),
+        {"sqlite_autoincrement": True},  # ids of archived entries are never handed out again
+    )
+
+    entry_id = Column(Integer, primary_key=True) # Order of the entries, a game's entries only ever grow
+    game_code = Column(String(6), nullable=False)
+    kind = Column(String(20), nullable=False) # game, player, action or information
+    turn = Column(Integer, nullable=False) # Game's turn and time of day once the change was made
+    time_of_day = Column(String(10), nullable=False)
+    data = Column(Text, nullable=False) # JSON of the changed columns, or of the new row
+    created = Column(Float, nullable=False) # Unix time of the change, before the insert with write-behind
+
+class GameSnapshot(Base):
+    __tablename__ = "game_snapshots"
+    __table_args__ = (
+        Index("ix_game_snapshots_game_code_entry_id", "game_code", "entry_id"),
+    )
+
+    snapshot_id = Column(Integer, primary_key=True)
+    game_code = Column(String(6), nullable=False)
+    entry_id = Column(Integer, nullable=False) # Last log entry folded into the state
+    turn = Column(Integer, nullable=False)
+    time_of_day = Column(String(10), nullable=False)
+    state = Column(Text, nullable=False) # JSON of the game, its players and the actions and information of its turn
+    created = Column(Float, nullable=False)
+
 class Characters(Base):
     __tablename__ = "characters"
 
@@ -0,0 +1,217 @@
+import random
+
+GOOD = {"townsfolk", "outsider"}
+EVIL = {"minion", "demon"}
+
+# Minion and demon info is only given in games of this many players or more
+EVIL_INFO_MIN_PLAYERS = 7
+
+# information_type of the rows written by the engine (the column holds 10 characters)
+NIGHT_INFO_TYPE = "night_info"
+
+
+class NightResult:
+    __slots__ = ("deaths", "protected", "poisoned", "information", "character_changes")
+
+    def __init__(self):
+        self.deaths = []  # player_ids killed tonight
+        self.protected = None  # player_id protected by the Monk, None if nobody
+        self.poisoned = None  # player_id poisoned by the Poisoner, None if nobody
+        self.information = []  # (player_id, text) given to each player
+        self.character_changes = {}  # player_id -> new character_id (the Imp passing on)
+
+
+class Night:
+    """Resolves one Trouble Brewing night in a single pass, in night order.
+
+    players are dicts (player_id, player_name, character_id, dead) in seating order.
+    choices maps a player_id to the player_ids they pointed at; a missing or invalid
+    choice is made at random, the way an automated storyteller would play it.
+    The Drunk has no ability of their own here (the game does not store which
+    Townsfolk they believe they are), poisoned players get false information and
+    their protections and kills fail. Everything comes from rng so a night
+    resolved with the same seed gives the same result.
+    """
+
+    def __init__(self, content, game_code, players, turn, choices=None, rng=None):
+        self.content = content
+        self.game_code = game_code
+        self.seats = list(players)
+        self.by_id = {player["player_id"]: player for player in self.seats}
+        self.turn = turn
+        self.first_night = turn <= 1
+        self.choices = choices or {}
+        self.rng = rng or random.Random(f"{game_code}:{turn}")
+        self.result = NightResult()
+
+    # Lookups
+
+    def character(self, player):
+        return self.content.characters_by_id.get(player["character_id"], {})
+
+    def role(self, player):
+        return self.character(player).get("character_name")
+
+    def designation(self, player):
+        return self.character(player).get("designation")
+
+    def is_evil(self, player):
+        return self.designation(player) in EVIL
+
+    def alive(self):
+        return [player for player in self.seats if not player["dead"] and player["player_id"] not in self.result.deaths]
+
+    def acting(self, role):
+        """Living players with a character, in seating order."""
+        return [player for player in self.alive() if self.role(player) == role]
+
+    def malfunctioning(self, player):
+        return player["player_id"] == self.result.poisoned
+
+    def choose(self, player, count, candidates):
+        """The count players a player pointed at, or a random pick among candidates."""
+        candidate_ids = [candidate["player_id"] for candidate in candidates]
+        chosen = [player_id for player_id in self.choices.get(player["player_id"], []) if player_id in self.by_id]
+        if len(chosen) >= count:
+            return [self.by_id[player_id] for player_id in chosen[:count]]
+        if len(candidate_ids) < count:
+            return [self.by_id[player_id] for player_id in candidate_ids]
+        return [self.by_id[player_id] for player_id in self.rng.sample(candidate_ids, count)]
+
+    def tell(self, player, text):
+        self.result.information.append((player["player_id"], text))
+
+    # Night
+
+    def resolve(self):
+        for player in self.acting("Poisoner"):
+            self.poisoner(player)
+        if self.first_night:
+            if len(self.seats) >= EVIL_INFO_MIN_PLAYERS:
+                self.evil_info()
+            for player in self.acting("Washerwoman"):
+                self.pair_info(player, "townsfolk", "Townsfolk")
+            for player in self.acting("Librarian"):
+                self.pair_info(player, "outsider", "Outsider")
+            for player in self.acting("Investigator"):
+                self.pair_info(player, "minion", "Minion")
+            for player in self.acting("Chef"):
+                self.chef(player)
+        else:
+            for player in self.acting("Monk"):
+                self.monk(player)
+            for player in self.acting("Imp"):
+                self.imp(player)
+        for player in self.acting("Empath"):
+            self.empath(player)
+        for player in self.acting("Fortune Teller"):
+            self.fortune_teller(player)
+        return self.result
+
+    def poisoner(self, player):
+        target = self.choose(player, 1, [other for other in self.alive() if other is not player])
+        if target:
+            self.result.poisoned = target[0]["player_id"]
+            self.tell(player, f"{target[0]['player_name']} is poisoned tonight.")
+
+    def monk(self, player):
+        target = self.choose(player, 1, [other for other in self.alive() if other is not player])
+        if target and target[0] is not player and not self.malfunctioning(player):
+            self.result.protected = target[0]["player_id"]
+
+    def imp(self, player):
+        target = self.choose(player, 1, [other for other in self.alive() if not self.is_evil(other)])
+        if not target or self.malfunctioning(player):
+            return
+        target = target[0]
+        if target["dead"] or target["player_id"] == self.result.protected:
+            return
+        if self.role(target) == "Soldier" and not self.malfunctioning(target):
+            return
+        self.result.deaths.append(target["player_id"])
+        if target is player:
+            # Star pass: a living Minion becomes the Imp, the Scarlet Woman first
+            minions = [other for other in self.alive() if self.designation(other) == "minion"]
+            minions.sort(key=lambda other: self.role(other) != "Scarlet Woman")
+            if minions:
+                self.result.character_changes[minions[0]["player_id"]] = player["character_id"]
+                self.tell(minions[0], "You are now the Imp.")
+
+    def evil_info(self):
+        demons = [player for player in self.seats if self.designation(player) == "demon"]
+        minions = [player for player in self.seats if self.designation(player) == "minion"]
+        in_play = {player["character_id"] for player in self.seats}
+        not_in_play = [character["character_name"] for character in self.content.characters
+                       if character["designation"] in GOOD and character["character_id"] not in in_play]
+        bluffs = self.rng.sample(not_in_play, min(3, len(not_in_play)))
+        for demon in demons:
+            names = ", ".join(minion["player_name"] for minion in minions) or "nobody"
+            self.tell(demon, f"Your minions are {names}. These characters are not in play: {', '.join(bluffs)}.")
+        for minion in minions:
+            names = ", ".join(demon["player_name"] for demon in demons)
+            self.tell(minion, f"The Demon is {names}.")
+
+    def pair_info(self, player, designation, label):
+        """Washerwoman, Librarian and Investigator: one of two players is a given character."""
+        others = [other for other in self.seats if other is not player]
+        if len(others) < 2:
+            # Too few players to name two of them
+            return
+        matching = [other for other in others if self.designation(other) == designation]
+        if self.malfunctioning(player):
+            tokens = [character["character_name"] for character in self.content.characters
+                      if character["designation"] == designation]
+            first, second = self.rng.sample(others, 2)
+            self.tell(player, f"One of {first['player_name']} and {second['player_name']} is the {self.rng.choice(tokens)}.")
+            return
+        if not matching:
+            self.tell(player, f"There are no {label}s in play.")
+            return
+        shown = self.rng.choice(matching)
+        decoy = self.rng.choice([other for other in others if other is not shown])
+        first, second = self.rng.sample([shown, decoy], 2)
+        self.tell(player, f"One of {first['player_name']} and {second['player_name']} is the {self.role(shown)}.")
+
+    def chef(self, player):
+        evil = [self.is_evil(seat) for seat in self.seats]
+        pairs = sum(1 for index in range(len(evil)) if evil[index] and evil[index - 1]) if len(evil) > 2 else 0
+        if self.malfunctioning(player):
+            pairs = self.rng.choice([count for count in range(3) if count != pairs])
+        self.tell(player, f"{pairs} pairs of evil players are sitting next to each other.")
+
+    def neighbours(self, player):
+        alive = self.alive()
+        if player not in alive or len(alive) < 2:
+            return []
+        index = alive.index(player)
+        left, right = alive[index - 1], alive[(index + 1) % len(alive)]
+        return [left] if left is right else [left, right]
+
+    def empath(self, player):
+        count = sum(1 for neighbour in self.neighbours(player) if self.is_evil(neighbour))
+        if self.malfunctioning(player):
+            count = self.rng.choice([other for other in range(3) if other != count])
+        self.tell(player, f"{count} of your living neighbours are evil.")
+
+    def red_herring(self):
+        # The same good player every night of a game
+        good = sorted(player["player_id"] for player in self.seats if self.designation(player) in GOOD)
+        return random.Random(f"{self.game_code}:red_herring").choice(good) if good else None
+
+    def fortune_teller(self, player):
+        chosen = self.choose(player, 2, self.seats)
+        if len(chosen) < 2:
+            return
+        red_herring = self.red_herring()
+        yes = any(self.designation(other) == "demon" or other["player_id"] == red_herring for other in chosen)
+        if self.malfunctioning(player):
+            yes = not yes
+        answer = "Yes" if yes else "No"
+        self.tell(player, f"{answer}, {'one' if yes else 'neither'} of {chosen[0]['player_name']} and "
+                          f"{chosen[1]['player_name']} {'is' if yes else 'are'} the Demon.")
+
+
+def resolve_night(content, game_code, players, turn, choices=None, seed=None):
+    """Resolves a night. seed defaults to the game and turn, so resolving it again gives the same result."""
+    rng = random.Random(seed if seed is not None else f"{game_code}:{turn}")
+    return Night(content, game_code, players, turn, choices, rng).resolve()
@@ -0,0 +1,35 @@
+import json
+from datetime import date, datetime
+from fastapi.responses import JSONResponse
+
+# orjson serializes dicts, lists and datetimes several times faster than the json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content):
+    """JSON bytes of plain data (dicts, lists, datetimes, pydantic models)."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed, the json module otherwise.
+
+    Returning one directly from a route skips FastAPI's jsonable_encoder pass, so the
+    content must already be plain data.
+    """
+
+    def render(self, content):
+        return dumps(content)
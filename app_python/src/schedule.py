@@ -0,0 +1,117 @@
+import threading
+
+FIRST_NIGHT = "first_night"
+OTHER_NIGHTS = "other_nights"
+
+
+def night_for_turn(turn):
+    return FIRST_NIGHT if turn <= 1 else OTHER_NIGHTS
+
+
+class GameSchedule:
+    __slots__ = ("game_version", "players", "nights")
+
+    def __init__(self, game_version, players, nights):
+        self.game_version = game_version
+        self.players = players  # player_id -> (character_id, dead) the schedule was built from
+        self.nights = nights  # FIRST_NIGHT / OTHER_NIGHTS -> ordered wake list
+
+
+class ScheduleEngine:
+    """Ordered wake lists of each game, for the first night and the nights after it.
+
+    A game's lists are built once from the content registry and kept until one of
+    its players joins, changes character or dies/revives (or the game version
+    changes). Protection changes are written into the cached entries in place.
+    """
+
+    def __init__(self, registry, version):
+        self.registry = registry
+        self.version = version  # game_code -> event bus version, to detect writes racing a rebuild
+        self._schedules = {}
+        self._lock = threading.Lock()
+
+    def wake_order(self, game_code, turn, load_game):
+        """Wake list for the night of turn. load_game() returns (game_version, players) on a cache miss."""
+        schedule = self._schedules.get(game_code)
+        if schedule is None:
+            version = self.version(game_code)
+            game_version, players = load_game()
+            schedule = self.build(game_version, players)
+            with self._lock:
+                # A write published while we were loading may not be in what we read, do not cache it
+                if self.version(game_code) == version:
+                    self._schedules[game_code] = schedule
+        return schedule.nights[night_for_turn(turn)]
+
+    def build(self, game_version, players):
+        content = self.registry.get(game_version)
+        alive = [player for player in players if not player["dead"]]
+
+        first_night = []
+        other_nights = []
+        for player in alive:
+            character = content.characters_by_id.get(player["character_id"])
+            if character is None:
+                continue
+            first_night_action = content.first_night_actions.get(player["character_id"])
+            if first_night_action:
+                first_night.append(self._entry(player, character, character.get("first_night_order") or 0, first_night_action))
+            if character.get("night_order"):
+                other_nights.append(self._entry(player, character, character["night_order"],
+                                                content.night_actions.get(player["character_id"])))
+
+        first_night.sort(key=lambda entry: (entry["wake_order"], entry["player_name"]))
+        other_nights.sort(key=lambda entry: (entry["wake_order"], entry["player_name"]))
+        return GameSchedule(
+            game_version,
+            {player["player_id"]: (player["character_id"], player["dead"]) for player in players},
+            {FIRST_NIGHT: first_night, OTHER_NIGHTS: other_nights},
+        )
+
+    def _entry(self, player, character, order, action):
+        return {
+            "player_id": player["player_id"],
+            "player_name": player["player_name"],
+            "character_id": player["character_id"],
+            "dead": player["dead"],
+            "vote_token_remaining": player["vote_token_remaining"],
+            "protected": player["protected"],
+            "character_name": character.get("character_name"),
+            "designation": character.get("designation"),
+            "first_night_order": character.get("first_night_order"),
+            "night_order": character.get("night_order"),
+            "wake_order": order,
+            "character_action_info": action,
+        }
+
+    def invalidate(self, game_code):
+        with self._lock:
+            self._schedules.pop(game_code, None)
+
+    def retain(self, game_codes):
+        """Drops the schedules of every game not in game_codes."""
+        with self._lock:
+            self._schedules = {game_code: schedule for game_code, schedule in self._schedules.items() if game_code in game_codes}
+
+    def on_event(self, game_code, event):
+        """Event bus listener keeping the cached schedules in line with the game."""
+        schedule = self._schedules.get(game_code)
+        if schedule is None:
+            return
+        if event.kind == "player":
+            player = event.data
+            if schedule.players.get(player["player_id"]) != (player["character_id"], player["dead"]):
+                self.invalidate(game_code)
+                return
+            for night in schedule.nights.values():
+                for entry in night:
+                    if entry["player_id"] == player["player_id"]:
+                        entry["player_name"] = player["player_name"]
+                        entry["protected"] = player["protected"]
+                        entry["vote_token_remaining"] = player["vote_token_remaining"]
+        elif event.kind == "game" and event.data.get("game_version") != schedule.game_version:
+            self.invalidate(game_code)
+        elif event.kind == "archived":
+            # Also seen for games archived by another worker
+            self.invalidate(game_code)
@@ -1,7 +1,68 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
+from datetime import datetime
 
 class PlayerCreate(BaseModel):
     game_code: str
     player_name: str
-    icon_image: Optional[str] = None  # i
\ No newline at end of file
+    icon_image: Optional[str] = None  # i
+
+# Response models of the game and player routes. FastAPI validates the returned dicts
+# against them and serializes straight to JSON bytes. Routes use
+# response_model_exclude_unset so a failure response only carries result and error.
+
+class GameOut(BaseModel):
+    id: int
+    game_code: str
+    player_count: int
+    created_date: datetime
+    game_version: str
+    ai_game_master: bool
+    turn: int
+    time_of_day: str
+
+class PlayerOut(BaseModel):
+    player_id: str
+    game_code: str
+    player_name: str
+    creation_date: datetime
+    character_id: int
+    dead: bool
+    vote_token_remaining: bool
+    protected: Optional[bool] = None
+
+class CharacterSummary(BaseModel):
+    character_id: int
+    character_name: str
+    designation: str
+    character_description: Optional[str] = None
+
+class PlayerDetail(PlayerOut):
+    turn: int
+    character: Optional[CharacterSummary] = None
+
+class GameResponse(BaseModel):
+    result: str
+    game: Optional[GameOut] = None
+    error: Optional[str] = None
+
+class GamesPageResponse(BaseModel):
+    result: str
+    games: Optional[List[GameOut]] = None
+    next_after_id: Optional[int] = None
+    error: Optional[str] = None
+
+class PlayerResponse(BaseModel):
+    result: str
+    player: Optional[PlayerOut] = None
+    error: Optional[str] = None
+
+class PlayerDetailResponse(BaseModel):
+    result: str
+    player: Optional[PlayerDetail] = None
+    error: Optional[str] = None
+
+class PlayersResponse(BaseModel):
+    result: str
+    players: Optional[List[PlayerOut]] = None
+    error: Optional[str] = None
@@ -0,0 +1,520 @@
+import argparse
+import json
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from content import ContentRegistry
+from game_setup import DISTRIBUTION, SetupGenerator
+
+# Vectorizes a whole batch of games at once, the pure Python engine plays the same games one by one
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Games simulated per task sent to a worker process
+BATCH_SIZE = 2000
+
+# How the simulated players behave. Information gathered by the good team makes
+# evil players look more suspicious when the town picks who to execute.
+ACCURACY = 0.35  # suspicion added to evil players per point of information
+MISINFORMATION = 0.5  # share of a poisoned or drunk player's information that misleads the town
+INFO_STRENGTH = {
+    "Washerwoman": 1.0, "Librarian": 0.8, "Investigator": 1.2, "Chef": 0.8, "Empath": 1.0,
+    "Fortune Teller": 1.0, "Undertaker": 0.8, "Ravenkeeper": 1.5,
+    "Virgin": 1.0,  # a Townsfolk nominating her and dying confirms both of them
+}
+DEFAULT_INFO_STRENGTH = 0.8  # townsfolk of other scripts waking at night
+RECLUSE_SUSPICION = 0.5  # extra suspicion of the Recluse, who can register as evil
+SPY_SUSPICION = 0.5  # share of the evil suspicion the Spy gets, registering as good
+EXECUTION_CHANCE = 0.8  # chance a day ends with an execution while more than four players live
+VIRGIN_NOMINATION_CHANCE = 0.3  # chance the Virgin is nominated on the first day
+STAR_PASS_CHANCE = 0.05  # chance the Imp kills themselves when a minion can take over
+MAYOR_BOUNCE_CHANCE = 0.5  # chance a kill aimed at the Mayor lands on another player
+MAX_DAYS = 30  # games still running are counted as evil wins
+
+# Behaviour of each modelled character. Characters of other scripts behave by
+# designation: demons kill, townsfolk waking at night gather information.
+BEHAVIOURS = {
+    "Poisoner": "poison", "Monk": "protect", "Imp": "kill", "Ravenkeeper": "ravenkeeper",
+    "Undertaker": "undertaker", "Slayer": "slayer", "Virgin": "virgin", "Soldier": "soldier",
+    "Mayor": "mayor", "Saint": "saint", "Recluse": "recluse", "Spy": "spy", "Drunk": "drunk",
+    "Scarlet Woman": "scarlet_woman",
+}
+NIGHT_BEHAVIOURS = {"poison", "protect", "kill", "ravenkeeper", "undertaker", "info", "drunk"}
+
+
+class Script:
+    """Characters of a script with what the simulator needs to know about each of them."""
+
+    def __init__(self, characters):
+        self.characters = list(characters)
+        self.names = [character["character_name"] for character in self.characters]
+        self.designations = [character["designation"] for character in self.characters]
+        self.behaviours = [self.behaviour(character) for character in self.characters]
+        self.index = {id(character): index for index, character in enumerate(self.characters)}
+        self.setups = SetupGenerator(self.characters)
+
+    @staticmethod
+    def behaviour(character):
+        if character["character_name"] in BEHAVIOURS:
+            return BEHAVIOURS[character["character_name"]]
+        if character["designation"] == "demon":
+            return "kill"
+        if character["designation"] == "townsfolk" and (character.get("first_night_order") or character.get("night_order")):
+            return "info"
+        return None
+
+    def strength(self, index):
+        return INFO_STRENGTH.get(self.names[index], DEFAULT_INFO_STRENGTH)
+
+    def night_steps(self, first_night):
+        """(character index, behaviour) of the characters waking on a night, in night order."""
+        key = "first_night_order" if first_night else "night_order"
+        steps = [
+            (character[key], index, self.behaviours[index])
+            for index, character in enumerate(self.characters)
+            if character.get(key) is not None and self.behaviours[index] in NIGHT_BEHAVIOURS
+        ]
+        return [(index, behaviour) for _, index, behaviour in sorted(steps)]
+
+
+class Tally:
+    """Results of a number of games, merged across batches and processes."""
+
+    def __init__(self, character_count):
+        self.games = 0
+        self.good_wins = 0
+        self.lengths = Counter()  # days played -> games
+        self.in_play = [0] * character_count
+        self.good_wins_with = [0] * character_count
+
+    def add(self, roles, good_win, days):
+        self.games += 1
+        self.good_wins += good_win
+        self.lengths[days] += 1
+        for role in set(roles):
+            self.in_play[role] += 1
+            self.good_wins_with[role] += good_win
+
+    def merge(self, other):
+        self.games += other.games
+        self.good_wins += other.good_wins
+        self.lengths.update(other.lengths)
+        for index in range(len(self.in_play)):
+            self.in_play[index] += other.in_play[index]
+            self.good_wins_with[index] += other.good_wins_with[index]
+        return self
+
+
+# Pure Python engine, one game at a time
+
+def play_game(script, roles, rng):
+    """Plays one game from a seating of character indexes. Returns (good won, days played)."""
+    seats = range(len(roles))
+    alive = [True] * len(roles)
+    evil = [script.designations[role] in ("minion", "demon") for role in roles]
+    seat_of = {role: seat for seat, role in enumerate(roles)}
+    behaviour_seat = {}
+    for seat, role in enumerate(roles):
+        behaviour_seat.setdefault(script.behaviours[role], seat)
+    demon = next(seat for seat in seats if script.designations[roles[seat]] == "demon")
+    knowledge = 0.0
+    slayer_used = virgin_used = executed_yesterday = False
+
+    def alive_count():
+        return sum(alive)
+
+    def info(seat, strength, works):
+        nonlocal knowledge
+        knowledge = max(0.0, knowledge + (strength if works else -strength * MISINFORMATION))
+
+    def special(behaviour):
+        seat = behaviour_seat.get(behaviour)
+        return seat if seat is not None and alive[seat] else None
+
+    def suspicion(seat):
+        weight = 1.0
+        if evil[seat]:
+            weight += ACCURACY * knowledge * (SPY_SUSPICION if script.behaviours[roles[seat]] == "spy" else 1.0)
+        elif script.behaviours[roles[seat]] == "recluse":
+            weight += RECLUSE_SUSPICION
+        return weight
+
+    def pick(candidates, weights=None):
+        if not candidates:
+            return None
+        return rng.choices(candidates, weights)[0] if weights else rng.choice(candidates)
+
+    def kill_demon():
+        """The demon died: True if the game goes on with the Scarlet Woman as the demon."""
+        nonlocal demon
+        scarlet_woman = special("scarlet_woman")
+        if scarlet_woman is not None and not poisoned.get(scarlet_woman) and alive_count() >= 4:
+            demon = scarlet_woman
+            return True
+        return False
+
+    poisoned = {}
+    for day in range(1, MAX_DAYS + 1):
+        # Night
+        poisoned = {}
+        protected = None
+        killed = None
+        for role, behaviour in script.night_steps(day == 1):
+            seat = seat_of.get(role)
+            if seat is None:
+                continue
+            if behaviour == "kill":
+                # Whoever is the demon now, after a star pass or the Scarlet Woman taking over
+                seat = demon
+            works = not poisoned.get(seat)
+            if behaviour == "poison" and alive[seat]:
+                poisoned[pick([other for other in seats if alive[other] and other != seat])] = True
+            elif behaviour == "protect" and alive[seat] and works:
+                protected = pick([other for other in seats if alive[other] and other != seat])
+            elif behaviour == "kill" and alive[seat] and works:
+                minions = [other for other in seats if alive[other] and evil[other] and other != seat]
+                if minions and rng.random() < STAR_PASS_CHANCE:
+                    alive[seat] = False
+                    demon = pick(minions)
+                    continue
+                target = pick([other for other in seats if alive[other] and not evil[other]])
+                if target is None or target == protected:
+                    continue
+                target_behaviour = script.behaviours[roles[target]]
+                if target_behaviour == "soldier" and not poisoned.get(target):
+                    continue
+                if target_behaviour == "mayor" and not poisoned.get(target) and rng.random() < MAYOR_BOUNCE_CHANCE:
+                    target = pick([other for other in seats if alive[other] and not evil[other] and other != target])
+                    if target is None or target == protected:
+                        continue
+                alive[target] = False
+                killed = target
+            elif behaviour == "ravenkeeper" and killed == seat:
+                info(seat, script.strength(role), works)
+            elif behaviour == "undertaker" and alive[seat] and executed_yesterday:
+                info(seat, script.strength(role), works)
+            elif behaviour == "info" and alive[seat]:
+                info(seat, script.strength(role), works)
+            elif behaviour == "drunk" and alive[seat]:
+                info(seat, DEFAULT_INFO_STRENGTH, False)
+        if alive_count() <= 2:
+            return False, day
+
+        # Day
+        slayer = special("slayer")
+        if slayer is not None and not slayer_used:
+            slayer_used = True
+            others = [other for other in seats if alive[other] and other != slayer]
+            target = pick(others, [suspicion(other) for other in others])
+            if target == demon and not poisoned.get(slayer):
+                alive[demon] = False
+                if not kill_demon():
+                    return True, day
+
+        mayor = special("mayor")
+        if alive_count() == 3 and mayor is not None and not poisoned.get(mayor):
+            return True, day
+
+        executed = None
+        virgin = special("virgin")
+        if virgin is not None and not virgin_used and rng.random() < VIRGIN_NOMINATION_CHANCE:
+            virgin_used = True
+            nominator = pick([other for other in seats if alive[other] and other != virgin])
+            if not poisoned.get(virgin) and script.designations[roles[nominator]] == "townsfolk":
+                executed = nominator
+                info(virgin, script.strength(roles[virgin]), True)
+        if executed is None and (alive_count() <= 4 or rng.random() < EXECUTION_CHANCE):
+            candidates = [seat for seat in seats if alive[seat]]
+            executed = pick(candidates, [suspicion(seat) for seat in candidates])
+        executed_yesterday = executed is not None
+        if executed is not None:
+            alive[executed] = False
+            if script.behaviours[roles[executed]] == "saint" and not poisoned.get(executed):
+                return False, day
+            if executed == demon and not kill_demon():
+                return True, day
+        if alive_count() <= 2:
+            return False, day
+    return False, MAX_DAYS
+
+
+def simulate_python(script, player_count, games, seed):
+    rng = random.Random(seed)
+    tally = Tally(len(script.characters))
+    for _ in range(games):
+        roles = [script.index[id(character)] for character in script.setups.draw(player_count, rng)]
+        good_win, days = play_game(script, roles, rng)
+        tally.add(roles, good_win, days)
+    return tally
+
+
+# NumPy engine, every game of a batch advanced together
+
+def simulate_numpy(script, player_count, games, seed):
+    setup_rng = random.Random(seed)
+    rng = np.random.default_rng(seed)
+    roles = np.array([
+        [script.index[id(character)] for character in script.setups.draw(player_count, setup_rng)]
+        for _ in range(games)
+    ])
+    rows = np.arange(games)
+    seats = np.arange(player_count)
+    designations = np.array(script.designations)
+    behaviours = np.array([behaviour or "" for behaviour in script.behaviours])
+
+    alive = np.ones((games, player_count), dtype=bool)
+    evil = np.isin(designations[roles], ("minion", "demon"))
+    seat_behaviour = behaviours[roles]
+    demon = np.argmax(designations[roles] == "demon", axis=1)
+    knowledge = np.zeros(games)
+    over = np.zeros(games, dtype=bool)
+    good_win = np.zeros(games, dtype=bool)
+    days = np.full(games, MAX_DAYS)
+    slayer_used = np.zeros(games, dtype=bool)
+    virgin_used = np.zeros(games, dtype=bool)
+    executed_yesterday = np.zeros(games, dtype=bool)
+
+    def seat_with(mask):
+        """Seat of the first player matching mask in each game, -1 where nobody does."""
+        return np.where(mask.any(axis=1), np.argmax(mask, axis=1), -1)
+
+    def at(values, seat):
+        """values[game, seat] of each game, False where seat is -1."""
+        return np.where(seat >= 0, values[rows, np.maximum(seat, 0)], False)
+
+    def pick(weights):
+        """Weighted random seat of each game, -1 where every weight is 0."""
+        total = weights.sum(axis=1)
+        threshold = rng.random(games) * total
+        choice = np.minimum((weights.cumsum(axis=1) <= threshold[:, None]).sum(axis=1), player_count - 1)
+        return np.where(total > 0, choice, -1)
+
+    def info(mask, strength, works):
+        nonlocal knowledge
+        change = np.where(works, strength, -strength * MISINFORMATION)
+        knowledge = np.where(mask, np.maximum(0.0, knowledge + change), knowledge)
+
+    def finish(mask, good):
+        nonlocal over
+        mask = mask & ~over
+        good_win[mask] = good
+        days[mask] = day
+        over = over | mask
+
+    def kill(mask, seat):
+        alive[rows[mask], seat[mask]] = False
+
+    def kill_demon(mask):
+        """The demon died in the games of mask: the Scarlet Woman takes over where she can, the others end."""
+        nonlocal demon
+        scarlet_woman = seat_with((seat_behaviour == "scarlet_woman") & alive)
+        takes_over = mask & (scarlet_woman >= 0) & ~at(poisoned, scarlet_woman) & (alive.sum(axis=1) >= 4)
+        demon = np.where(takes_over, scarlet_woman, demon)
+        finish(mask & ~takes_over, True)
+
+    def suspicion():
+        weight = np.ones((games, player_count))
+        spy = seat_behaviour == "spy"
+        weight += np.where(evil, ACCURACY * knowledge[:, None] * np.where(spy, SPY_SUSPICION, 1.0), 0.0)
+        weight += np.where(~evil & (seat_behaviour == "recluse"), RECLUSE_SUSPICION, 0.0)
+        return weight * alive
+
+    for day in range(1, MAX_DAYS + 1):
+        if over.all():
+            break
+        # Night
+        poisoned = np.zeros((games, player_count), dtype=bool)
+        protected = np.full(games, -1)
+        killed = np.full(games, -1)
+        for role, behaviour in script.night_steps(day == 1):
+            seat = seat_with(roles == role)
+            if behaviour == "kill":
+                # Whoever is the demon now, after a star pass or the Scarlet Woman taking over
+                seat = np.where(seat >= 0, demon, -1)
+            awake = ~over & at(alive, seat)
+            works = ~at(poisoned, seat)
+            if behaviour == "poison":
+                target = pick((alive & (seats != seat[:, None])).astype(float))
+                hit = awake & (target >= 0)
+                poisoned[rows[hit], target[hit]] = True
+            elif behaviour == "protect":
+                target = pick((alive & (seats != seat[:, None])).astype(float))
+                protected = np.where(awake & works, target, protected)
+            elif behaviour == "kill":
+                acting = awake & works
+                minions = alive & evil & (seats != demon[:, None])
+                star_pass = acting & minions.any(axis=1) & (rng.random(games) < STAR_PASS_CHANCE)
+                kill(star_pass, demon)
+                demon = np.where(star_pass, pick(minions.astype(float)), demon)
+                acting &= ~star_pass
+                target = pick((alive & ~evil).astype(float))
+                target_behaviour = np.where(target >= 0, seat_behaviour[rows, np.maximum(target, 0)], "")
+                target_works = ~at(poisoned, target)
+                bounce = (target_behaviour == "mayor") & target_works & (rng.random(games) < MAYOR_BOUNCE_CHANCE)
+                bounced = pick((alive & ~evil & (seats != target[:, None])).astype(float))
+                target = np.where(bounce, bounced, target)
+                target_behaviour = np.where(bounce, "", target_behaviour)
+                dies = acting & (target >= 0) & (target != protected)
+                dies &= ~((target_behaviour == "soldier") & target_works)
+                kill(dies, target)
+                killed = np.where(dies, target, killed)
+            elif behaviour == "ravenkeeper":
+                info(~over & (seat >= 0) & (killed == seat), script.strength(role), works)
+            elif behaviour == "undertaker":
+                info(awake & executed_yesterday, script.strength(role), works)
+            elif behaviour == "info":
+                info(awake, script.strength(role), works)
+            elif behaviour == "drunk":
+                info(awake, DEFAULT_INFO_STRENGTH, False)
+        finish(alive.sum(axis=1) <= 2, False)
+
+        # Day
+        slayer = seat_with((seat_behaviour == "slayer") & alive)
+        shooting = ~over & (slayer >= 0) & ~slayer_used
+        slayer_used |= shooting
+        target = pick(suspicion() * (seats != slayer[:, None]))
+        hit = shooting & (target == demon) & ~at(poisoned, slayer)
+        kill(hit, demon)
+        kill_demon(hit)
+
+        mayor = seat_with((seat_behaviour == "mayor") & alive)
+        finish((alive.sum(axis=1) == 3) & (mayor >= 0) & ~at(poisoned, mayor), True)
+
+        executed = np.full(games, -1)
+        virgin = seat_with((seat_behaviour == "virgin") & alive)
+        nominated = ~over & (virgin >= 0) & ~virgin_used & (rng.random(games) < VIRGIN_NOMINATION_CHANCE)
+        virgin_used |= nominated
+        nominator = pick((alive & (seats != virgin[:, None])).astype(float))
+        nominator_townsfolk = designations[roles[rows, np.maximum(nominator, 0)]] == "townsfolk"
+        triggered = nominated & ~at(poisoned, virgin) & (nominator >= 0) & nominator_townsfolk
+        executed = np.where(triggered, nominator, executed)
+        info(triggered, INFO_STRENGTH["Virgin"], True)
+        voting = ~over & (executed < 0) & ((alive.sum(axis=1) <= 4) | (rng.random(games) < EXECUTION_CHANCE))
+        executed = np.where(voting, pick(suspicion()), executed)
+        executed = np.where(over, -1, executed)
+        executed_yesterday = executed >= 0
+        kill(executed_yesterday, executed)
+        saint = executed_yesterday & (seat_behaviour[rows, np.maximum(executed, 0)] == "saint") & ~at(poisoned, executed)
+        finish(saint, False)
+        kill_demon(~over & executed_yesterday & (executed == demon))
+        finish(alive.sum(axis=1) <= 2, False)
+
+    tally = Tally(len(script.characters))
+    tally.games = games
+    tally.good_wins = int(good_win.sum())
+    tally.lengths = Counter(days.tolist())
+    in_play = np.zeros((games, len(script.characters)), dtype=bool)
+    in_play[rows[:, None], roles] = True
+    tally.in_play = in_play.sum(axis=0).tolist()
+    tally.good_wins_with = (in_play & good_win[:, None]).sum(axis=0).tolist()
+    return tally
+
+
+def simulate_batch(characters, player_count, games, seed, engine):
+    script = Script(characters)
+    if engine == "numpy":
+        return simulate_numpy(script, player_count, games, seed)
+    return simulate_python(script, player_count, games, seed)
+
+
+def simulate(characters, player_count, games, seed=1, workers=None, engine=None, batch_size=BATCH_SIZE):
+    """Plays games randomized games of a script, split in batches over a process pool. Returns a Tally.
+
+    Each batch has its own seed, so the results do not depend on the number of workers.
+    """
+    engine = engine or ("numpy" if np is not None else "python")
+    if engine == "numpy" and np is None:
+        raise RuntimeError("The numpy engine needs numpy (pip install numpy)")
+    batches = [(start, min(batch_size, games - start)) for start in range(0, games, batch_size)]
+    tally = Tally(len(characters))
+    arguments = [(characters, player_count, size, seed * 1_000_003 + index, engine) for index, (_, size) in enumerate(batches)]
+    if workers == 1 or len(batches) == 1:
+        for batch in arguments:
+            tally.merge(simulate_batch(*batch))
+        return tally
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(simulate_batch, *zip(*arguments)):
+            tally.merge(result)
+    return tally
+
+
+def summary(characters, tally):
+    games = tally.games or 1
+    good_rate = tally.good_wins / games
+    lengths = sorted(tally.lengths.elements())
+    characters_summary = []
+    for index, character in enumerate(characters):
+        with_games = tally.in_play[index]
+        without_games = tally.games - with_games
+        if not with_games or not without_games:
+            continue
+        with_rate = tally.good_wins_with[index] / with_games
+        without_rate = (tally.good_wins - tally.good_wins_with[index]) / without_games
+        characters_summary.append({
+            "character_name": character["character_name"],
+            "designation": character["designation"],
+            "in_play": with_games / games,
+            "good_win_rate": with_rate,
+            # Percentage points of good wins the character brings, against games without it
+            "impact": (with_rate - without_rate) * 100,
+        })
+    characters_summary.sort(key=lambda entry: entry["impact"], reverse=True)
+    return {
+        "games": tally.games,
+        "good_win_rate": good_rate,
+        "evil_win_rate": 1 - good_rate,
+        "length": {
+            "mean_days": sum(lengths) / games,
+            "median_days": lengths[len(lengths) // 2] if lengths else 0,
+            "days": {str(days): count / games for days, count in sorted(tally.lengths.items())},
+        },
+        "characters": characters_summary,
+    }
+
+
+def report(player_count, result, elapsed):
+    print(f"\n{player_count} players: {result['games']} games in {elapsed:.1f}s, "
+          f"good {result['good_win_rate']:.1%}, evil {result['evil_win_rate']:.1%}, "
+          f"{result['length']['mean_days']:.1f} days on average")
+    print("  days   " + "  ".join(f"{days:>5}" for days in result["length"]["days"]))
+    print("  games  " + "  ".join(f"{share:>5.1%}" for share in result["length"]["days"].values()))
+    print(f"  {'character':<16}{'in play':>9}{'good wins':>11}{'impact':>9}")
+    for entry in result["characters"]:
+        print(f"  {entry['character_name']:<16}{entry['in_play']:>9.1%}{entry['good_win_rate']:>11.1%}{entry['impact']:>+8.1f}pp")
+
+
+def player_counts(value):
+    if "-" in value:
+        first, last = value.split("-")
+        return list(range(int(first), int(last) + 1))
+    return [int(count) for count in value.split(",")]
+
+
+if __name__ == "__main__":
+    # Balance of a script before playing it: python simulator.py --script trouble_brewing --players 5-15
+    parser = argparse.ArgumentParser(description="Plays randomized games of a script and reports win rates.")
+    parser.add_argument("--script", default="trouble_brewing", help="script folder under game_files or a game_version")
+    parser.add_argument("--players", default="7", help="player count, a range like 5-15 or a list like 7,10,13")
+    parser.add_argument("--games", type=int, default=20000, help="games per player count")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--engine", choices=("numpy", "python"), help="defaults to numpy when it is installed")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    characters = ContentRegistry().get(args.script).characters
+    results = {}
+    for player_count in player_counts(args.players):
+        if player_count not in DISTRIBUTION:
+            parser.error(f"player counts go from {min(DISTRIBUTION)} to {max(DISTRIBUTION)}")
+        start = time.perf_counter()
+        tally = simulate(characters, player_count, args.games, args.seed, args.workers, args.engine)
+        results[player_count] = summary(characters, tally)
+        if not args.json:
+            report(player_count, results[player_count], time.perf_counter() - start)
+    if args.json:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,251 @@
+import threading
+
+
+class VotingError(ValueError):
+    """A nomination or vote the rules do not allow."""
+
+
+def execution_threshold(alive_count):
+    """Votes needed to put a nominee on the block: half the living players, rounded up."""
+    return (alive_count + 1) // 2
+
+
+class Nomination:
+    __slots__ = ("nomination_id", "nominator_id", "nominee_id", "voters", "dead_voters", "open")
+
+    def __init__(self, nomination_id, nominator_id, nominee_id):
+        self.nomination_id = nomination_id
+        self.nominator_id = nominator_id
+        self.nominee_id = nominee_id
+        self.voters = set()  # player_ids with a hand raised
+        self.dead_voters = set()  # the dead ones among them, spending their vote token
+        self.open = True
+
+
+class DayState:
+    """Nominations of one game for one day, with the counters needed to tally them in O(1)."""
+
+    def __init__(self, turn, players):
+        self.turn = turn
+        self.alive = {player["player_id"] for player in players if not player["dead"]}
+        self.tokens = {player["player_id"] for player in players if player["dead"] and player["vote_token_remaining"]}
+        self.players = {player["player_id"] for player in players}
+        self.nominations = []
+        self.nominators = set()
+        self.nominees = set()
+        self.on_the_block = None  # nominee_id about to be executed, None when nobody or a tie
+        self.block_votes = 0  # highest vote count of the day, a later nominee has to beat it
+
+    @property
+    def threshold(self):
+        return execution_threshold(len(self.alive))
+
+    def open_nomination(self):
+        return self.nominations[-1] if self.nominations and self.nominations[-1].open else None
+
+
+class VoteEngine:
+    """Server-side nominations and votes, tallied in memory.
+
+    Every alive player has one vote per nomination; a dead player has a single vote
+    token for the rest of the game, spent when a nomination they voted on closes.
+    Counts, the threshold and the nominee on the block are updated as each vote
+    comes in. Closing a nomination hands back the rows to persist in one batch.
+    """
+
+    def __init__(self):
+        self._days = {}  # game_code -> DayState
+        self._remote = {}  # game_code -> {(turn, nomination_id): tally} from other workers, for days not loaded here
+        self._lock = threading.Lock()
+
+    def day(self, game_code, load_game):
+        """DayState of a game. load_game() returns (turn, players) when it is not in memory yet."""
+        state = self._days.get(game_code)
+        if state is None:
+            turn, players = load_game()
+            with self._lock:
+                state = self._days.get(game_code)
+                if state is None:
+                    state = self._days[game_code] = DayState(turn, players)
+                    for key, tally in sorted(self._remote.pop(game_code, {}).items()):
+                        if key[0] == turn:
+                            self._apply(game_code, state, tally)
+        return state
+
+    def nominate(self, game_code, load_game, nominator_id, nominee_id):
+        state = self.day(game_code, load_game)
+        with self._lock:
+            if state.open_nomination():
+                raise VotingError("Another nomination is still open")
+            if nominator_id not in state.alive:
+                raise VotingError("Only living players can nominate")
+            if nominee_id not in state.players:
+                raise VotingError("Nominee is not in this game")
+            if nominator_id in state.nominators:
+                raise VotingError("Player already nominated today")
+            if nominee_id in state.nominees:
+                raise VotingError("Player was already nominated today")
+            nomination = Nomination(len(state.nominations) + 1, nominator_id, nominee_id)
+            state.nominations.append(nomination)
+            state.nominators.add(nominator_id)
+            state.nominees.add(nominee_id)
+            return self.tally(state, nomination)
+
+    def vote(self, game_code, load_game, nomination_id, player_id, raised):
+        """Raises or lowers a player's hand on the open nomination."""
+        state = self.day(game_code, load_game)
+        with self._lock:
+            nomination = self._nomination(state, nomination_id)
+            if not nomination.open:
+                raise VotingError("Nomination is closed")
+            if raised:
+                if player_id in state.alive:
+                    nomination.voters.add(player_id)
+                elif player_id in state.tokens:
+                    nomination.voters.add(player_id)
+                    nomination.dead_voters.add(player_id)
+                elif player_id in state.players:
+                    raise VotingError("Dead player has already used their vote token")
+                else:
+                    raise VotingError("Player is not in this game")
+            else:
+                nomination.voters.discard(player_id)
+                nomination.dead_voters.discard(player_id)
+            return self.tally(state, nomination)
+
+    def close(self, game_code, load_game, nomination_id):
+        """Closes a nomination. Returns (tally, player_ids whose vote token was spent)."""
+        state = self.day(game_code, load_game)
+        with self._lock:
+            nomination = self._nomination(state, nomination_id)
+            if not nomination.open:
+                raise VotingError("Nomination is already closed")
+            spent = self._close(state, nomination)
+            return self.tally(state, nomination), spent
+
+    def _close(self, state, nomination):
+        nomination.open = False
+        votes = len(nomination.voters)
+        if votes >= state.threshold and votes > state.block_votes:
+            state.on_the_block = nomination.nominee_id
+            state.block_votes = votes
+        elif votes >= state.threshold and votes == state.block_votes:
+            # A tie with the nominee on the block: nobody is executed
+            state.on_the_block = None
+        spent = set(nomination.dead_voters)
+        state.tokens -= spent
+        return spent
+
+    def summary(self, game_code, load_game):
+        state = self.day(game_code, load_game)
+        with self._lock:
+            return {
+                "turn": state.turn,
+                "alive": len(state.alive),
+                "threshold": state.threshold,
+                "on_the_block": state.on_the_block,
+                "block_votes": state.block_votes,
+                "nominations": [self.tally(state, nomination) for nomination in state.nominations],
+            }
+
+    def _nomination(self, state, nomination_id):
+        if not 1 <= nomination_id <= len(state.nominations):
+            raise VotingError("Nomination not found")
+        return state.nominations[nomination_id - 1]
+
+    def tally(self, state, nomination):
+        votes = len(nomination.voters)
+        return {
+            "turn": state.turn,
+            "nomination_id": nomination.nomination_id,
+            "nominator_id": nomination.nominator_id,
+            "nominee_id": nomination.nominee_id,
+            "votes": votes,
+            "voters": sorted(nomination.voters),
+            "threshold": state.threshold,
+            "open": nomination.open,
+            "reaches_threshold": votes >= state.threshold,
+            "on_the_block": state.on_the_block,
+        }
+
+    def apply(self, game_code, tally):
+        """Mirrors a nomination tallied by another worker into this worker's day."""
+        with self._lock:
+            state = self._days.get(game_code)
+            if state is None:
+                # Kept until the day is loaded here, only the latest tally of each nomination matters
+                remote = self._remote.setdefault(game_code, {})
+                remote[(tally["turn"], tally["nomination_id"])] = tally
+                for key in [key for key in remote if key[0] < tally["turn"]]:
+                    del remote[key]
+                return
+            self._apply(game_code, state, tally)
+
+    def _apply(self, game_code, state, tally):
+        if tally["turn"] != state.turn:
+            return
+        nomination_id = tally["nomination_id"]
+        if nomination_id == len(state.nominations) + 1:
+            nomination = Nomination(nomination_id, tally["nominator_id"], tally["nominee_id"])
+            state.nominations.append(nomination)
+            state.nominators.add(nomination.nominator_id)
+            state.nominees.add(nomination.nominee_id)
+        elif 1 <= nomination_id <= len(state.nominations):
+            nomination = state.nominations[nomination_id - 1]
+        else:
+            # Missed part of the day, it cannot be rebuilt here
+            self._days.pop(game_code, None)
+            return
+        if not nomination.open:
+            return
+        nomination.voters = set(tally["voters"])
+        nomination.dead_voters = {player_id for player_id in nomination.voters if player_id not in state.alive}
+        if not tally["open"]:
+            self._close(state, nomination)
+
+    def invalidate(self, game_code):
+        with self._lock:
+            self._days.pop(game_code, None)
+
+    def forget(self, game_code):
+        """Drops the game's day and the nominations other workers sent for it."""
+        with self._lock:
+            self._days.pop(game_code, None)
+            self._remote.pop(game_code, None)
+
+    def on_event(self, game_code, event):
+        """Event bus listener keeping the living players and vote tokens in line with the game."""
+        if event.kind == "nomination" and event.remote:
+            self.apply(game_code, event.data)
+            return
+        if event.kind == "archived":
+            self.forget(game_code)
+            return
+        state = self._days.get(game_code)
+        if state is None:
+            return
+        if event.kind == "player":
+            player = event.data
+            with self._lock:
+                state.players.add(player["player_id"])
+                if player["dead"]:
+                    state.alive.discard(player["player_id"])
+                    if player["vote_token_remaining"]:
+                        state.tokens.add(player["player_id"])
+                    else:
+                        state.tokens.discard(player["player_id"])
+                else:
+                    state.alive.add(player["player_id"])
+                    state.tokens.discard(player["player_id"])
+                # A voter who died while the nomination is open now votes with their token, if any
+                nomination = state.open_nomination()
+                if nomination and player["player_id"] in nomination.voters:
+                    if player["player_id"] in state.alive:
+                        nomination.dead_voters.discard(player["player_id"])
+                    elif player["player_id"] in state.tokens:
+                        nomination.dead_voters.add(player["player_id"])
+                    else:
+                        nomination.voters.discard(player["player_id"])
+        elif event.kind == "game" and event.data.get("turn") != state.turn:
+            # A new day starts with no nominations
+            self.invalidate(game_code)
@@ -69,14 +69,34 @@ const CurrentGame = () => {
     }
   };
 
-  // Fetch players when component mounts & every 5 seconds
+  // Keep the player list in sync with the server's event stream
   useEffect(() => {
-    fetchPlayers(); // Initial fetch
+    if (typeof EventSource === "undefined") {
+      // No server-sent events support, fall back to polling every 5 seconds
+      fetchPlayers();
+      const interval = setInterval(fetchPlayers, 5000);
+      return () => clearInterval(interval);
+    }
 
-    // Poll the server every 5 seconds to get new players
-    const interval = setInterval(fetchPlayers, 5000);
+    // EventSource reconnects by itself and sends Last-Event-ID, so the server only replays what was missed
+    const events = new EventSource(`${apiUrl}/games/${gameCode}/events`);
+
+    events.addEventListener("snapshot", (e) => {
+      setPlayers(JSON.parse(e.data).players);
+    });
+
+    events.addEventListener("player", (e) => {
+      const updatedPlayer = JSON.parse(e.data);
+      setPlayers((prev) => {
+        const index = prev.findIndex((p) => p.player_id === updatedPlayer.player_id);
+        if (index === -1) return [...prev, updatedPlayer];
+        const next = [...prev];
+        next[index] = updatedPlayer;
+        return next;
+      });
+    });
 
-    return () => clearInterval(interval); // Cleanup on component unmount
+    return () => events.close(); // Cleanup on component unmount
   }, [gameCode]);
 
   // Fetch characters after game version is set
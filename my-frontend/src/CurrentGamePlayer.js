@@ -53,6 +53,28 @@ const CurrentGamePlayer = () => {
     }
   };
 
+  // Refresh actions and information when the server pushes a change for this player or the game
+  useEffect(() => {
+    if (!player || typeof EventSource === "undefined") return;
+
+    fetchPlayerActionsAndInfo();
+    const events = new EventSource(`${apiUrl}/games/${player.game_code}/events`);
+    const refreshIfMine = (e) => {
+      if (JSON.parse(e.data).player_id === playerId) fetchPlayerActionsAndInfo();
+    };
+
+    events.addEventListener("action", refreshIfMine);
+    events.addEventListener("information", refreshIfMine);
+    events.addEventListener("actions_cleared", () => fetchPlayerActionsAndInfo());
+    events.addEventListener("game", (e) => {
+      const game = JSON.parse(e.data);
+      setPlayer((prev) => (prev && prev.turn !== game.turn ? { ...prev, turn: game.turn } : prev));
+      fetchPlayerActionsAndInfo();
+    });
+
+    return () => events.close();
+  }, [player?.game_code, playerId]);
+
   const handleInputChangeSolo = (e) => {
     setNewInformation(e.target.value);
   };